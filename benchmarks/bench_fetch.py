@@ -0,0 +1,64 @@
+"""
+Offline throughput benchmark for the YouTube fetch stage (run_yt_api_regions + enrich_video_details).
+Uses the yt_replay transports, so it needs no API key or network:
+
+    python benchmarks/bench_fetch.py --videos 50 --regions 10 --latency-ms 120
+    python benchmarks/bench_fetch.py --mode replay --fixtures tests/fixtures/yt_api
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REGIONS = ["CA", "DE", "FR", "GB", "IN", "JP", "KR", "MX", "RU", "US"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["synthetic", "replay"], default="synthetic")
+    parser.add_argument("--fixtures", default=None, help="Fixture directory for --mode replay")
+    parser.add_argument("--videos", type=int, default=50, help="Videos per region (max 50 per chart request)")
+    parser.add_argument("--regions", type=int, default=len(REGIONS), help="Number of regions (M)")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Simulated latency per HTTP round trip")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent region requests")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    regions = REGIONS[:args.regions] + [f"X{i}" for i in range(max(0, args.regions - len(REGIONS)))]
+
+    # Configure the transports before ty_api is imported
+    os.environ["YT_API_MODE"] = args.mode
+    os.environ["YT_REPLAY_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["YT_SYNTHETIC_VIDEOS"] = str(args.videos)
+    os.environ["YT_SYNTHETIC_REGIONS"] = ",".join(regions)
+    os.environ["YT_SYNTHETIC_SEED"] = str(args.seed)
+    if args.fixtures:
+        os.environ["YT_FIXTURE_DIR"] = args.fixtures
+    os.environ.setdefault("YT_API_KEY", "offline-benchmark")
+    os.environ["YT_RESPONSE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "responses.json")
+
+    from ty_api import run_yt_api_regions, enrich_video_details
+
+    print(f"mode={args.mode} regions={len(regions)} videos/region={args.videos} "
+          f"latency={args.latency_ms}ms workers={args.workers}")
+
+    timings = []
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        videos = run_yt_api_regions(size=args.videos, regions=regions, max_workers=args.workers)
+        fetched = time.perf_counter()
+        enrich_video_details(videos)
+        done = time.perf_counter()
+        timings.append((fetched - start, done - fetched, len(videos)))
+
+    print(f"\n{'run':>4} {'fetch s':>9} {'enrich s':>9} {'videos':>7} {'videos/s':>9}")
+    for i, (fetch_s, enrich_s, n) in enumerate(timings, start=1):
+        print(f"{i:>4} {fetch_s:>9.3f} {enrich_s:>9.3f} {n:>7} {n / (fetch_s + enrich_s):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
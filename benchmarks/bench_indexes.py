@@ -0,0 +1,164 @@
+"""
+Query plan benchmark for the weekly read paths (Spark weekly export, dashboard channel/video queries).
+Seeds a throwaway schema in a local Postgres with synthetic history, then reports
+EXPLAIN ANALYZE timings before and after migrations.run_migrations():
+
+    ENV=test python benchmarks/bench_indexes.py --videos 20000 --hours 48 --days 90
+    python benchmarks/bench_indexes.py --keep      # leave the bench schema in place
+
+Connects with db.get_db_connection(env) (POSTGRES_* variables for ENV=test, DB_URL otherwise).
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection, ensure_trending_partitions
+from migrations import run_migrations
+
+SCHEMA = "bench_indexes"
+
+
+def _queries(schema):
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    next_monday = monday + timedelta(days=7)
+    return [
+        ("spark weekly window", f"""
+            SELECT * FROM {schema}.youtube_trending_history_p
+            WHERE recorded_at >= %s AND recorded_at < %s;
+        """, (monday, next_monday)),
+        ("channels this week (DATE())", f"""
+            SELECT channel_title, COUNT(*) AS video_count
+            FROM {schema}.youtube_videos_p
+            WHERE DATE(recorded_at) >= %s AND DATE(recorded_at) < %s
+            GROUP BY channel_title HAVING COUNT(*) > 2 ORDER BY video_count DESC;
+        """, (monday, next_monday)),
+        ("channels this week (range)", f"""
+            SELECT channel_title, COUNT(*) AS video_count
+            FROM {schema}.youtube_videos_p
+            WHERE recorded_at >= %s AND recorded_at < %s
+            GROUP BY channel_title HAVING COUNT(*) > 2 ORDER BY video_count DESC;
+        """, (monday, next_monday)),
+        ("latest videos", f"""
+            SELECT video_id, title, channel_title, thumbnail_link, category_id, tags
+            FROM {schema}.youtube_videos_p ORDER BY recorded_at DESC LIMIT 10;
+        """, ()),
+    ]
+
+
+def seed(conn, videos, hours, days, channels):
+    """Creates the bench schema (same layout as db.sql) and fills it with synthetic history."""
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {SCHEMA};")
+        cur.execute(f"""
+            CREATE TABLE {SCHEMA}.youtube_videos_p (
+                video_id varchar(20) primary key, title text not null, channel_title text,
+                category_id integer, publish_date timestamp, tags text, thumbnail_link text,
+                recorded_at date default CURRENT_DATE, views bigint, likes bigint, comment_count bigint
+            );
+            CREATE TABLE {SCHEMA}.youtube_trending_history_p (
+                id serial,
+                video_id varchar(20) references {SCHEMA}.youtube_videos_p on delete cascade,
+                publish_date date not null, views bigint, likes bigint, comment_count bigint,
+                recorded_at timestamp with time zone default CURRENT_TIMESTAMP not null,
+                primary key (id, recorded_at),
+                unique (video_id, recorded_at)
+            ) PARTITION BY RANGE (recorded_at);
+            CREATE TABLE {SCHEMA}.youtube_trending_history_p_default
+                PARTITION OF {SCHEMA}.youtube_trending_history_p DEFAULT;
+        """)
+    conn.commit()
+
+    ensure_trending_partitions(weeks_ahead=1, start=date.today() - timedelta(days=days + 1),
+                               conn=conn, env="bench", schema=SCHEMA)
+
+    with conn.cursor() as cur:
+        # video i is first seen (and trends from) day i mod days before today
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.youtube_videos_p
+            SELECT 'v' || lpad(i::text, 10, '0'), 'title ' || i, 'channel ' || mod(i, %s), mod(i, 30) + 1,
+                   CURRENT_DATE - mod(i, %s) - 3, 'tag' || mod(i, 500), 'https://i.ytimg.com/' || i,
+                   CURRENT_DATE - mod(i, %s), i * 10, i, i / 10
+            FROM generate_series(1, %s) AS i;
+        """, (channels, days, days, videos))
+        # one snapshot per hour for `hours` hours after the video was first seen
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.youtube_trending_history_p
+                (video_id, publish_date, views, likes, comment_count, recorded_at)
+            SELECT v.video_id, v.publish_date::date, v.views + h * 100, v.likes + h, v.comment_count + h,
+                   v.recorded_at + make_interval(hours => h)
+            FROM {SCHEMA}.youtube_videos_p v, generate_series(0, %s - 1) AS h;
+        """, (hours,))
+        cur.execute(f"ANALYZE {SCHEMA}.youtube_videos_p; ANALYZE {SCHEMA}.youtube_trending_history_p;")
+    conn.commit()
+
+
+def explain(conn, sql, params, repeat):
+    """Returns (best execution ms, scan nodes of that plan) of EXPLAIN ANALYZE over `repeat` runs."""
+    best, node = None, None
+    with conn.cursor() as cur:
+        for _ in range(repeat):
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+            result = cur.fetchone()[0]
+            result = json.loads(result) if isinstance(result, str) else result
+            ms = result[0]["Execution Time"]
+            if best is None or ms < best:
+                best, node = ms, _scan_nodes(result[0]["Plan"])
+    conn.rollback()
+    return best, node
+
+
+def _scan_nodes(plan):
+    """Distinct scan node types in a plan, e.g. 'Bitmap Heap Scan, Index Only Scan'."""
+    found = []
+    stack = [plan]
+    while stack:
+        p = stack.pop()
+        if "Scan" in p["Node Type"] and p["Node Type"] not in found:
+            found.append(p["Node Type"])
+        stack.extend(p.get("Plans", []))
+    return ", ".join(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--hours", type=int, default=48, help="Hourly snapshots per video")
+    parser.add_argument("--days", type=int, default=90, help="Days of history")
+    parser.add_argument("--channels", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--env", default=os.getenv("ENV", "test"))
+    parser.add_argument("--keep", action="store_true", help="Don't drop the bench schema at the end")
+    args = parser.parse_args()
+
+    conn = get_db_connection(args.env)
+    try:
+        print(f"Seeding {SCHEMA}: {args.videos} videos x {args.hours} snapshots over {args.days} days...")
+        seed(conn, args.videos, args.hours, args.days, args.channels)
+
+        queries = _queries(SCHEMA)
+        before = [explain(conn, sql, params, args.repeat) for _, sql, params in queries]
+        run_migrations(conn=conn, env="bench", schema=SCHEMA)
+        with conn.cursor() as cur:
+            cur.execute(f"ANALYZE {SCHEMA}.youtube_videos_p; ANALYZE {SCHEMA}.youtube_trending_history_p;")
+        conn.commit()
+        after = [explain(conn, sql, params, args.repeat) for _, sql, params in queries]
+
+        print(f"\n{'query':<30} {'before ms':>10} {'after ms':>10}  plan after")
+        for (name, _, _), (b_ms, _), (a_ms, a_plan) in zip(queries, before, after):
+            print(f"{name:<30} {b_ms:>10.2f} {a_ms:>10.2f}  {a_plan}")
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+            conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark of the Redis video cache writer against a local redis-server:
+the previous writer (SCAN of the keyspace + nine HSETs and an EXPIRE per video in a
+transaction) vs cache_video_ids_idempotent (index lookup + one HSET mapping and EXPIRE per key).
+
+    redis-server &
+    python benchmarks/bench_redis_cache.py --videos 200 --cached 20000
+
+Uses its own key prefix (bench_cache) and deletes it afterwards.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from g_sheets import cache_video_ids_idempotent
+
+PREFIX = "bench_cache"
+
+
+def legacy_cache_video_ids(videos, redis_client, prefix, env="bench", ttl_seconds=86400):
+    """The writer as it was before the index and mapping HSETs, kept here as the baseline."""
+    prefix = f"{prefix}:"
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
+    existing_ids = set()
+    for k in redis_client.scan_iter(f"{prefix}*"):
+        existing_ids.add(k.replace(prefix, ""))
+
+    pipe = redis_client.pipeline()
+    for video in videos:
+        vid = video["video_id"]
+        key = f"{prefix}{vid}"
+        if vid in existing_ids:
+            pipe.expire(key, ttl_seconds)
+        else:
+            for field in ("video_id", "cached_at", "env", "title", "channel_id",
+                          "published_at", "duration", "thumbnail", "in_sheet"):
+                pipe.hset(key, field, {"video_id": vid, "cached_at": now, "env": env,
+                                       "in_sheet": "no"}.get(field, video.get(field, "")))
+            pipe.expire(key, ttl_seconds)
+    pipe.execute()
+
+
+def _videos(n, offset=0):
+    return [{"video_id": f"vid{i:08d}", "title": f"title {i}", "channel_id": f"UC{i % 97}",
+             "published_at": "2025-01-01T00:00:00Z", "duration": "PT4M2S", "thumbnail": ""}
+            for i in range(offset, offset + n)]
+
+
+def _commands(client):
+    return client.info("stats")["total_commands_processed"]
+
+
+def _clear(client):
+    keys = list(client.scan_iter(f"{PREFIX}:*", count=1000))
+    for i in range(0, len(keys), 1000):
+        client.delete(*keys[i:i + 1000])
+
+
+def _seed(client, n):
+    """Fills the cache with `n` keys written by the current writer (so the index exists too)."""
+    for start in range(0, n, 1000):
+        cache_video_ids_idempotent(_videos(min(1000, n - start), offset=1_000_000 + start),
+                                   env="bench", prefix=PREFIX, redis_client=client)
+
+
+def run(name, fn, client, repeat):
+    best_s, commands = None, None
+    for _ in range(repeat):
+        before = _commands(client)
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        # the INFO call itself counts as one command
+        used = _commands(client) - before - 1
+        if best_s is None or elapsed < best_s:
+            best_s, commands = elapsed, used
+    print(f"{name:<32} {best_s * 1000:>10.1f} ms {commands:>10} commands")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--videos", type=int, default=200, help="Videos per run")
+    parser.add_argument("--cached", type=int, default=20000, help="Keys already in the cache")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    client = redis.Redis(host=args.host, port=args.port, decode_responses=True)
+    client.ping()
+    batch = _videos(args.videos)
+
+    try:
+        _clear(client)
+        _seed(client, args.cached)
+        print(f"cache size={args.cached} keys, batch={args.videos} videos\n")
+
+        def legacy_new():
+            client.delete(*[f"{PREFIX}:{v['video_id']}" for v in batch])
+            legacy_cache_video_ids(batch, client, PREFIX)
+
+        def current_new():
+            pipe = client.pipeline(transaction=False)
+            pipe.delete(*[f"{PREFIX}:{v['video_id']}" for v in batch])
+            pipe.zrem(f"{PREFIX}:__idx__", *[v["video_id"] for v in batch])
+            pipe.execute()
+            cache_video_ids_idempotent(batch, env="bench", prefix=PREFIX, redis_client=client)
+
+        print(f"{'':<32} {'time':>13} {'commands':>10}")
+        # "new videos" runs include the cleanup that makes the batch new again (DEL, plus ZREM for the index)
+        run("legacy, new videos", legacy_new, client, args.repeat)
+        run("mapping+index, new videos", current_new, client, args.repeat)
+        run("legacy, cached videos", lambda: legacy_cache_video_ids(batch, client, PREFIX), client, args.repeat)
+        run("mapping+index, cached videos",
+            lambda: cache_video_ids_idempotent(batch, env="bench", prefix=PREFIX, redis_client=client),
+            client, args.repeat)
+    finally:
+        _clear(client)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import math
+import mmap
+import struct
+import hashlib
+from dotenv import load_dotenv
+load_dotenv()
+
+# Seen video IDs filter (see dedup.load_seen_filter)
+BLOOM_PATH = os.getenv("BLOOM_PATH", "seen_videos.bloom")
+# Number of IDs the filter is sized for, and its false positive rate at that size
+BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", 5_000_000))
+BLOOM_ERROR_RATE = float(os.getenv("BLOOM_ERROR_RATE", 0.001))
+
+# File layout: header (magic, number of bits, number of hashes, synced_at, synced_size, items added)
+# then the bit array
+_MAGIC = b"YTBLOOM2"
+_HEADER = struct.Struct("<8sQQdQQ")
+_SYNCED_AT = struct.Struct("<d")
+_SYNCED_AT_OFFSET = _HEADER.size - 24
+
+
+def optimal_size(capacity, error_rate):
+    """
+    Bits and hash functions for `capacity` items at `error_rate` false positives.
+    returns - (num_bits, num_hashes)
+    """
+    capacity = max(int(capacity), 1)
+    num_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings: no false negatives, false positives at about the sized error rate.
+    The header and bits live in one buffer, a bytearray or a memory-mapped file (open()), so a
+    filter of millions of IDs is loaded without reading it into Python objects.
+    Positions come from one blake2b digest per item (double hashing h1 + i * h2).
+    args:
+        num_bits: int : Size of the bit array
+        num_hashes: int : Bits set per item
+    """
+
+    def __init__(self, num_bits, num_hashes, buffer=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        size = _HEADER.size + (num_bits + 7) // 8
+        if buffer is None:
+            buffer = bytearray(size)
+            _HEADER.pack_into(buffer, 0, _MAGIC, num_bits, num_hashes, 0.0, 0, 0)
+        elif len(buffer) != size:
+            raise ValueError(f"Bloom filter buffer is {len(buffer)} bytes, expected {size}")
+        self._buf = buffer
+        self._file = None
+
+    @classmethod
+    def for_capacity(cls, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        """Empty in-memory filter sized for `capacity` items at `error_rate`."""
+        return cls(*optimal_size(capacity, error_rate))
+
+    @staticmethod
+    def _read_header(data):
+        magic, num_bits, num_hashes, _, _, _ = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a bloom filter file")
+        return num_bits, num_hashes
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Filter from to_bytes() output (e.g. the copy stored in Redis)."""
+        return cls(*cls._read_header(data), buffer=bytearray(data))
+
+    @classmethod
+    def open(cls, path=BLOOM_PATH, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        """
+        Memory-maps the filter file at `path`, creating an empty one sized for
+        `capacity` / `error_rate` when it doesn't exist. Changes go straight to the file;
+        call flush() to make sure they are on disk.
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            cls.for_capacity(capacity, error_rate).save(path)
+        f = open(path, "r+b")
+        try:
+            mapped = mmap.mmap(f.fileno(), 0)
+            bloom = cls(*cls._read_header(mapped), buffer=mapped)
+        except Exception:
+            f.close()
+            raise
+        bloom._file = f
+        return bloom
+
+    # ---- membership ----
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        h2 |= 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        """Adds `item`. returns - True if it was (definitely) not in the filter before."""
+        buf, offset = self._buf, _HEADER.size
+        added = False
+        for pos in self._positions(item):
+            index = offset + (pos >> 3)
+            mask = 1 << (pos & 7)
+            if not buf[index] & mask:
+                buf[index] |= mask
+                added = True
+        if added:
+            struct.pack_into("<Q", buf, _HEADER.size - 8, len(self) + 1)
+        return added
+
+    def update(self, items):
+        """Adds every item. returns - number of items that were not in the filter before."""
+        return sum(1 for item in items if self.add(item))
+
+    def __contains__(self, item):
+        buf, offset = self._buf, _HEADER.size
+        return all(buf[offset + (pos >> 3)] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self):
+        """Number of items added (items that were false positives when added are not counted)."""
+        return struct.unpack_from("<Q", self._buf, _HEADER.size - 8)[0]
+
+    @property
+    def synced_at(self):
+        """Unix time up to which the filter is known to hold its source's items (0 if never synced)."""
+        return _SYNCED_AT.unpack_from(self._buf, _SYNCED_AT_OFFSET)[0]
+
+    @synced_at.setter
+    def synced_at(self, value):
+        _SYNCED_AT.pack_into(self._buf, _SYNCED_AT_OFFSET, float(value))
+
+    @property
+    def synced_size(self):
+        """Size in bytes of an append-only source (e.g. a CSV) when the filter was last synced with it."""
+        return struct.unpack_from("<Q", self._buf, _HEADER.size - 16)[0]
+
+    @synced_size.setter
+    def synced_size(self, value):
+        struct.pack_into("<Q", self._buf, _HEADER.size - 16, int(value))
+
+    # ---- persistence ----
+    def to_bytes(self):
+        return bytes(self._buf)
+
+    def save(self, path):
+        """Writes the filter to `path` (atomically replaced)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._buf)
+        os.replace(tmp, path)
+
+    def flush(self):
+        """Writes a memory-mapped filter's changes to disk (no-op in memory)."""
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.flush()
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.flush()
+            self._buf.close()
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -1,5 +1,14 @@
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from threading import Lock, BoundedSemaphore
+import time
+import io
+import re
 import os
+from datetime import datetime, timedelta, date, timezone
+from yt_records import to_rows, normalize_tags, VIDEO_FIELDS, SNAPSHOT_FIELDS, VideoSnapshot
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -22,6 +31,124 @@ def get_db_connection(env=os.getenv("ENV", "prod")):
         return psycopg2.connect(os.getenv("DB_URL"))
 
 
+## Connection pool shared by the pipeline writers and the dashboard
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 5))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Connections idle for longer than this are checked with SELECT 1 before reuse
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", 30))
+
+_pools = {}
+_pool_slots = {}
+_pools_lock = Lock()
+_released_at = {}
+
+
+def get_db_pool(env=os.getenv("ENV", "prod")):
+    """
+    Returns the process wide connection pool for `env`, creating it on first use.
+    Connections are opened lazily up to DB_POOL_MAX; DB_POOL_MIN are kept open.
+    """
+    with _pools_lock:
+        pool = _pools.get(env)
+        if pool is None:
+            if env == "test":
+                pool = ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX,
+                    host=os.getenv("POSTGRES_HOST"),
+                    port=os.getenv("POSTGRES_PORT"),
+                    database=os.getenv("POSTGRES_DB"),
+                    user=os.getenv("POSTGRES_USER"),
+                    password=os.getenv("POSTGRES_PASSWORD")
+                )
+            else:
+                pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.getenv("DB_URL"))
+            _pools[env] = pool
+            _pool_slots[env] = BoundedSemaphore(DB_POOL_MAX)
+        return pool
+
+
+def _connection_is_healthy(conn):
+    """Checks a pooled connection before handing it out again."""
+    if conn.closed:
+        return False
+    if time.monotonic() - _released_at.get(id(conn), 0) < DB_POOL_CHECK_IDLE:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def get_pooled_connection(env=os.getenv("ENV", "prod")):
+    """
+    Borrows a healthy connection from the pool, waiting up to DB_POOL_TIMEOUT seconds
+    when every connection is in use. Give it back with release_pooled_connection.
+    """
+    pool = get_db_pool(env)
+    if not _pool_slots[env].acquire(timeout=DB_POOL_TIMEOUT):
+        raise psycopg2.pool.PoolError(f"No free DB connection after {DB_POOL_TIMEOUT}s (DB_POOL_MAX={DB_POOL_MAX})")
+
+    try:
+        # Broken connections (e.g. dropped by NeonDB while idle) are discarded and replaced
+        for _ in range(DB_POOL_MAX + 1):
+            conn = pool.getconn()
+            if _connection_is_healthy(conn):
+                return conn
+            _released_at.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("Could not get a healthy DB connection from the pool")
+    except Exception:
+        _pool_slots[env].release()
+        raise
+
+
+def release_pooled_connection(conn, env=os.getenv("ENV", "prod")):
+    """Returns a borrowed connection to the pool, rolling back anything left uncommitted."""
+    pool = get_db_pool(env)
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            if conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        _released_at.pop(id(conn), None)
+    else:
+        _released_at[id(conn)] = time.monotonic()
+    pool.putconn(conn, close=broken)
+    _pool_slots[env].release()
+
+
+@contextmanager
+def pooled_connection(env=os.getenv("ENV", "prod")):
+    """
+    Context manager around get_pooled_connection / release_pooled_connection:
+        with pooled_connection() as conn:
+            pd.read_sql(query, conn)
+    """
+    conn = get_pooled_connection(env)
+    try:
+        yield conn
+    finally:
+        release_pooled_connection(conn, env)
+
+
+def close_db_pools():
+    """Closes every pooled connection (e.g. at the end of a pipeline run)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+        _pool_slots.clear()
+        _released_at.clear()
+
+
 def add_video_O(video, conn=None, env=os.getenv("ENV", "prod"), schema="yt_data"):
     """
     Inserts a video into youtube_videos.
@@ -116,18 +243,23 @@ def add_trending_snapshot_O(snapshot, conn=None, env=os.getenv("ENV", "prod"), s
 ##Pipeline version with partitioned tables below
 #Use these functions instead of the above for partitioned tables
 
+def _video_rows(videos):
+    """youtube_videos_p rows: VIDEO_FIELDS values followed by the normalized tag_list."""
+    tags_at = VIDEO_FIELDS.index("tags")
+    return [row + [normalize_tags(row[tags_at])] for row in to_rows(videos, VIDEO_FIELDS)]
+
 def add_video_P(videos, conn=None, env=os.getenv("ENV", "prod"), schema=None):
     """
-    Inserts a video into youtube_videos.
+    Inserts videos into youtube_videos_p.
     Skips if video_id already exists.
-    video - dict with keys matching table columns.
+    videos - list of VideoSnapshot records (or dicts with keys matching table columns).
     conn - optional existing DB connection.
     env - "prod" or "test" to determine connection type.
     """
     try:
         close_conn = False
         if conn is None:
-            conn = get_db_connection(env)
+            conn = get_pooled_connection(env)
             close_conn = True
 
         if env == "test":
@@ -137,20 +269,16 @@ def add_video_P(videos, conn=None, env=os.getenv("ENV", "prod"), schema=None):
                 schema = "yt_data"
 
         with conn.cursor() as cur:
-            for vid in videos:
+            for row in _video_rows(videos):
                 cur.execute(f"""
                     INSERT INTO {schema}.youtube_videos_p (
                         video_id, title, channel_title,
                         category_id, publish_date, tags, views, likes,
-                        comment_count, thumbnail_link, recorded_at
-                    )
-                    VALUES (
-                        %(video_id)s, %(title)s, %(channel_title)s,
-                        %(category_id)s, %(publish_date)s, %(tags)s, %(views)s, %(likes)s,
-                        %(comment_count)s, %(thumbnail_link)s, %(recorded_at)s
+                        comment_count, thumbnail_link, recorded_at, tag_list
                     )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::text[])
                     ON CONFLICT (video_id) DO NOTHING;
-                """, vid)
+                """, row)
 
         conn.commit()
         
@@ -160,9 +288,6 @@ def add_video_P(videos, conn=None, env=os.getenv("ENV", "prod"), schema=None):
                     print("DB NOTICE:", message)
                 conn.notices.clear() 
 
-        if close_conn:
-            conn.close()
-
         return 1 ## Indicate success
     
     except Exception as e:
@@ -171,20 +296,20 @@ def add_video_P(videos, conn=None, env=os.getenv("ENV", "prod"), schema=None):
     
     finally:
         if close_conn and conn:
-            conn.close()
+            release_pooled_connection(conn, env)
     
 def add_trending_snapshot_P(snapshot, conn=None, env=os.getenv("ENV", "prod"), schema=None):
     """
-    Adds a daily trending snapshot.
+    Adds trending snapshots.
     Skips if an identical record already exists.
-    snapshot - dict with keys matching table columns.
+    snapshot - VideoSnapshot record(s) (or dicts with keys matching table columns).
     conn - optional existing DB connection.
     env - "prod" or "test" to determine connection type.
     """
     try:
         close_conn = False
         if conn is None:
-            conn = get_db_connection(env)
+            conn = get_pooled_connection(env)
             close_conn = True
 
         if env == "test":
@@ -195,21 +320,18 @@ def add_trending_snapshot_P(snapshot, conn=None, env=os.getenv("ENV", "prod"), s
 
         with conn.cursor() as cur:
             # Make sure snapshot is a list
-            if isinstance(snapshot, dict):
+            if isinstance(snapshot, (dict, VideoSnapshot)):
                 snapshot = [snapshot]
 
-            for vid in snapshot:
+            for row in to_rows(snapshot, SNAPSHOT_FIELDS):
                 cur.execute(f"""
                     INSERT INTO {schema}.youtube_trending_history_p (
                         video_id, publish_date, views, likes,
                         comment_count, recorded_at
                     )
-                    VALUES (
-                        %(video_id)s, %(publish_date)s, %(views)s, %(likes)s,
-                        %(comment_count)s, %(recorded_at)s
-                    )
+                    VALUES (%s, %s, %s, %s, %s, %s)
                     ON CONFLICT (video_id, recorded_at) DO NOTHING;
-                """, vid)
+                """, row)
 
         conn.commit()
 
@@ -219,9 +341,6 @@ def add_trending_snapshot_P(snapshot, conn=None, env=os.getenv("ENV", "prod"), s
                     print("DB NOTICE:", message)
                 conn.notices.clear() 
 
-        if close_conn:
-            conn.close()
-
         return 1 ## Indicate success
     
     except Exception as e:
@@ -230,8 +349,933 @@ def add_trending_snapshot_P(snapshot, conn=None, env=os.getenv("ENV", "prod"), s
     
     finally:
         if close_conn and conn:
-            conn.close()
+            release_pooled_connection(conn, env)
+
+
+
+## Bulk versions: one statement per page of rows instead of one round trip per row
+
+def add_videos_bulk(videos, conn=None, env=os.getenv("ENV", "prod"), schema=None, page_size=1000):
+    """
+    Inserts videos into youtube_videos_p with multi-row INSERT statements (execute_values),
+    sending `page_size` rows per round trip. Existing video_ids are skipped (ON CONFLICT DO NOTHING).
+    videos - list of VideoSnapshot records (or dicts with keys matching table columns).
+    conn - optional existing DB connection.
+    env - "prod" or "test" to determine connection type.
+    returns - dict with inserted / skipped counts and error (None on success).
+    """
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        rows = _video_rows(videos)
+        if not rows:
+            return {"inserted": 0, "skipped": 0, "error": None}
+
+        with conn.cursor() as cur:
+            inserted = execute_values(cur, f"""
+                INSERT INTO {schema}.youtube_videos_p (
+                    video_id, title, channel_title,
+                    category_id, publish_date, tags, views, likes,
+                    comment_count, thumbnail_link, recorded_at, tag_list
+                )
+                VALUES %s
+                ON CONFLICT (video_id) DO NOTHING
+                RETURNING video_id;
+            """, rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::text[])",
+                page_size=page_size, fetch=True)
+
+        conn.commit()
+
+        print(f"Bulk video insert → inserted: {len(inserted)}, skipped: {len(rows) - len(inserted)}")
+        return {"inserted": len(inserted), "skipped": len(rows) - len(inserted), "error": None}
+
+    except Exception as e:
+        print("Error bulk adding videos:", e)
+        if conn and not close_conn:
+            conn.rollback()
+        return {"inserted": 0, "skipped": 0, "error": str(e)}
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+def add_trending_snapshots_bulk(snapshots, conn=None, env=os.getenv("ENV", "prod"), schema=None, page_size=1000):
+    """
+    Adds trending snapshots with multi-row INSERT statements (execute_values),
+    sending `page_size` rows per round trip. Identical (video_id, recorded_at) rows are skipped.
+    snapshots - VideoSnapshot record(s) (or dicts with keys matching table columns).
+    conn - optional existing DB connection.
+    env - "prod" or "test" to determine connection type.
+    returns - dict with inserted / skipped counts and error (None on success).
+    """
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        if isinstance(snapshots, (dict, VideoSnapshot)):
+            snapshots = [snapshots]
+
+        rows = to_rows(snapshots, SNAPSHOT_FIELDS)
+        if not rows:
+            return {"inserted": 0, "skipped": 0, "error": None}
+
+        with conn.cursor() as cur:
+            inserted = execute_values(cur, f"""
+                INSERT INTO {schema}.youtube_trending_history_p (
+                    video_id, publish_date, views, likes,
+                    comment_count, recorded_at
+                )
+                VALUES %s
+                ON CONFLICT (video_id, recorded_at) DO NOTHING
+                RETURNING video_id;
+            """, rows, page_size=page_size, fetch=True)
+
+        conn.commit()
+
+        print(f"Bulk snapshot insert → inserted: {len(inserted)}, skipped: {len(rows) - len(inserted)}")
+        return {"inserted": len(inserted), "skipped": len(rows) - len(inserted), "error": None}
+
+    except Exception as e:
+        print("Error bulk adding trending snapshots:", e)
+        if conn and not close_conn:
+            conn.rollback()
+        return {"inserted": 0, "skipped": 0, "error": str(e)}
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+## Run-scoped writer: one transaction for the videos and snapshots of a pipeline run
+
+def _copy_value(value):
+    """Formats a value for COPY ... FROM STDIN (text format). Lists become text[] literals."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, tuple)):
+        value = "{" + ",".join(
+            '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in value
+        ) + "}"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _copy_rows(cur, table, columns, rows):
+    """Streams rows into `table` with a single COPY."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def write_pipeline_run(videos, snapshots, conn=None, env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Writes one pipeline run in a single transaction:
+    videos and snapshots are COPYed into temporary staging tables, then merged into
+    youtube_videos_p and youtube_trending_history_p with set-based INSERT ... SELECT
+    (ON CONFLICT DO NOTHING), and committed once. Either the whole run lands or nothing does.
+    videos - new VideoSnapshot records (or dicts) for youtube_videos_p, may be empty.
+    snapshots - VideoSnapshot records (or dicts) for youtube_trending_history_p.
+    conn - optional existing DB connection (defaults to one from the pool).
+    env - "prod" or "test" to determine connection type.
+    returns - dict with inserted / skipped counts per table and error (None on success).
+    """
+    result = {
+        "videos": {"inserted": 0, "skipped": 0},
+        "snapshots": {"inserted": 0, "skipped": 0},
+        "error": None
+    }
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        if isinstance(snapshots, (dict, VideoSnapshot)):
+            snapshots = [snapshots]
+
+        video_rows = to_rows(videos or [], VIDEO_FIELDS)
+        snapshot_rows = to_rows(snapshots or [], SNAPSHOT_FIELDS)
+        if not video_rows and not snapshot_rows:
+            return result
+
+        with conn.cursor() as cur:
+            # Staging tables take their column types from the real tables and vanish at commit.
+            # tags is staged as text[] and cast on merge, giving the same text as the row-by-row inserts.
+            cur.execute(f"""
+                CREATE TEMP TABLE _stage_videos ON COMMIT DROP AS
+                SELECT video_id, title, channel_title, category_id, publish_date,
+                       NULL::text[] AS tags, views, likes, comment_count, thumbnail_link, recorded_at
+                FROM {schema}.youtube_videos_p WITH NO DATA;
+
+                CREATE TEMP TABLE _stage_snapshots ON COMMIT DROP AS
+                SELECT {", ".join(SNAPSHOT_FIELDS)}
+                FROM {schema}.youtube_trending_history_p WITH NO DATA;
+            """)
+
+            if video_rows:
+                _copy_rows(cur, "_stage_videos", VIDEO_FIELDS, video_rows)
+                cur.execute(f"""
+                    INSERT INTO {schema}.youtube_videos_p (
+                        video_id, title, channel_title,
+                        category_id, publish_date, tags, views, likes,
+                        comment_count, thumbnail_link, recorded_at, tag_list
+                    )
+                    SELECT DISTINCT ON (video_id)
+                        video_id, title, channel_title,
+                        category_id, publish_date, tags::text, views, likes,
+                        comment_count, thumbnail_link, recorded_at,
+                        -- same normalization as yt_records.normalize_tags
+                        ARRAY(
+                            SELECT lower(btrim(t)) FROM unnest(tags) WITH ORDINALITY AS u(t, n)
+                            WHERE btrim(t) <> '' GROUP BY 1 ORDER BY min(n)
+                        )
+                    FROM _stage_videos
+                    ORDER BY video_id
+                    ON CONFLICT (video_id) DO NOTHING;
+                """)
+                result["videos"] = {"inserted": cur.rowcount, "skipped": len(video_rows) - cur.rowcount}
+
+            if snapshot_rows:
+                _copy_rows(cur, "_stage_snapshots", SNAPSHOT_FIELDS, snapshot_rows)
+                cur.execute(f"""
+                    INSERT INTO {schema}.youtube_trending_history_p (
+                        video_id, publish_date, views, likes,
+                        comment_count, recorded_at
+                    )
+                    SELECT {", ".join(SNAPSHOT_FIELDS)}
+                    FROM _stage_snapshots
+                    ON CONFLICT (video_id, recorded_at) DO NOTHING;
+                """)
+                result["snapshots"] = {"inserted": cur.rowcount, "skipped": len(snapshot_rows) - cur.rowcount}
+
+        conn.commit()
+
+        print(f"Pipeline run written → videos inserted: {result['videos']['inserted']}, "
+              f"skipped: {result['videos']['skipped']} | snapshots inserted: {result['snapshots']['inserted']}, "
+              f"skipped: {result['snapshots']['skipped']}")
+        return result
+
+    except Exception as e:
+        print("Error writing pipeline run:", e)
+        if conn and not close_conn:
+            conn.rollback()
+        return {
+            "videos": {"inserted": 0, "skipped": 0},
+            "snapshots": {"inserted": 0, "skipped": 0},
+            "error": str(e)
+        }
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+## Weekly range partitions of youtube_trending_history_p (see db.sql, migrations.py converts old tables)
+
+TRENDING_TABLE = "youtube_trending_history_p"
+# Partitions created ahead of the current week on every maintenance run (maintenance.py)
+PARTITION_WEEKS_AHEAD = int(os.getenv("TRENDING_PARTITION_WEEKS_AHEAD", 4))
+# Weeks of raw snapshots kept by apply_trending_retention (0 keeps everything)
+TRENDING_RETENTION_WEEKS = int(os.getenv("TRENDING_RETENTION_WEEKS", 0))
+# "on" drops the partitions past retention; by default they are only detached (kept for archiving)
+TRENDING_RETENTION_DROP = os.getenv("TRENDING_RETENTION_DROP", "off").lower() == "on"
+
+_PARTITION_NAME = re.compile(rf"^{TRENDING_TABLE}_w(\d{{4}}_\d{{2}}_\d{{2}})$")
+
+
+def _week_start(day):
+    """Monday of the week containing `day` (same week boundaries as the weekly Spark export)."""
+    return day - timedelta(days=day.weekday())
+
+
+def current_week_start():
+    """
+    Monday of the current UTC week: the week_start the dashboard aggregates are written and read
+    with, whatever the host's or the DB session's timezone (recorded_at dates are UTC days).
+    """
+    return _week_start(datetime.now(timezone.utc).date())
+
+
+def trending_partition_name(week_start):
+    """Partition table name for the week starting on `week_start`, e.g. youtube_trending_history_p_w2025_01_06."""
+    return f"{TRENDING_TABLE}_w{week_start.strftime('%Y_%m_%d')}"
+
+
+def _list_trending_partitions(cur, schema):
+    """Returns {week_start: partition_name} for the partitions attached to the trending table."""
+    cur.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_namespace ns ON ns.oid = parent.relnamespace
+        WHERE ns.nspname = %s AND parent.relname = %s;
+    """, (schema, TRENDING_TABLE))
+
+    partitions = {}
+    for (name,) in cur.fetchall():
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime.strptime(match.group(1), "%Y_%m_%d").date()] = name
+    return partitions
+
+
+def _is_partitioned(cur, schema):
+    cur.execute("""
+        SELECT 1
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        JOIN pg_namespace ns ON ns.oid = c.relnamespace
+        WHERE ns.nspname = %s AND c.relname = %s;
+    """, (schema, TRENDING_TABLE))
+    return cur.fetchone() is not None
+
+
+def ensure_trending_partitions(weeks_ahead=PARTITION_WEEKS_AHEAD, start=None, conn=None,
+                               env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Creates the weekly partitions of youtube_trending_history_p that don't exist yet,
+    from the week of `start` (defaults to today) up to `weeks_ahead` weeks after the current one.
+    Only missing partitions are created, so calling this on every maintenance run costs one catalog query.
+    Does nothing if the table is not partitioned yet (migrations.py 0007 converts it).
+    returns - list of created partition names, or None on failure.
+    """
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        created = []
+        with conn.cursor() as cur:
+            if not _is_partitioned(cur, schema):
+                print(f"{schema}.{TRENDING_TABLE} is not partitioned, skipping partition management.")
+                return created
+
+            existing = _list_trending_partitions(cur, schema)
+            week = _week_start(start or date.today())
+            last_week = _week_start(date.today()) + timedelta(weeks=weeks_ahead)
+
+            while week <= last_week:
+                if week not in existing:
+                    name = trending_partition_name(week)
+                    cur.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {schema}.{name}
+                        PARTITION OF {schema}.{TRENDING_TABLE}
+                        FOR VALUES FROM (%s) TO (%s);
+                    """, (week, week + timedelta(weeks=1)))
+                    created.append(name)
+                week += timedelta(weeks=1)
+
+        conn.commit()
+        if created:
+            print(f"Created trending partitions: {', '.join(created)}")
+        return created
+
+    except Exception as e:
+        print("Error creating trending partitions:", e)
+        if conn and not close_conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+def apply_trending_retention(keep_weeks=TRENDING_RETENTION_WEEKS, drop=TRENDING_RETENTION_DROP, conn=None,
+                             env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Retention policy for youtube_trending_history_p: partitions whose whole week is older than
+    `keep_weeks` weeks before the current week are detached, and dropped only when `drop` is True
+    (TRENDING_RETENTION_DROP=on); detached tables stay around for archiving otherwise.
+    Replaces DELETE-based cleanup.
+    keep_weeks - weeks to keep including the current one; 0 disables retention.
+    returns - list of detached partition names, or None on failure.
+    """
+    if keep_weeks <= 0:
+        return []
+
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        cutoff = _week_start(date.today()) - timedelta(weeks=keep_weeks - 1)
+        detached = []
+        with conn.cursor() as cur:
+            if not _is_partitioned(cur, schema):
+                print(f"{schema}.{TRENDING_TABLE} is not partitioned, skipping retention.")
+                return detached
 
+            for week, name in sorted(_list_trending_partitions(cur, schema).items()):
+                if week >= cutoff:
+                    continue
+                cur.execute(f"ALTER TABLE {schema}.{TRENDING_TABLE} DETACH PARTITION {schema}.{name};")
+                if drop:
+                    cur.execute(f"DROP TABLE {schema}.{name};")
+                detached.append(name)
+
+        conn.commit()
+        if detached:
+            print(f"{'Dropped' if drop else 'Detached'} trending partitions older than {cutoff}: {', '.join(detached)}")
+        return detached
+
+    except Exception as e:
+        print("Error applying trending retention:", e)
+        if conn and not close_conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+## Hourly -> daily rollup of trending snapshots (tables created by migrations.py)
+
+DAILY_TABLE = "youtube_trending_daily_p"
+ROLLUP_NAME = "trending_daily"
+# Weeks of raw hourly snapshots kept once they are rolled up (0 keeps everything)
+TRENDING_RAW_KEEP_WEEKS = int(os.getenv("TRENDING_RAW_KEEP_WEEKS", 0))
+# The watermark stays this far behind the DB clock, so snapshots stamped by the client shortly
+# before (or with a skewed clock) and committed after a rollup are still rolled up later
+ROLLUP_LAG_MINUTES = int(os.getenv("TRENDING_ROLLUP_LAG_MINUTES", 90))
+
+
+def rollup_trending_daily(conn=None, env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Incrementally aggregates closed hours of youtube_trending_history_p into youtube_trending_daily_p
+    (one row per video and day with first/last/max of views, likes and comment_count; the
+    *_delta columns are generated from first/last).
+    Only snapshots between the stored watermark and the new one are read, and a day that is
+    rolled up over several runs is merged into the existing row, so every run costs about one
+    hour of snapshots no matter how long the history is.
+    The new watermark is the start of the hour ROLLUP_LAG_MINUTES ago, capped at the newest
+    committed snapshot: recorded_at is the client's fetch time, so rows can commit after their
+    hour closed and must not fall behind the watermark. Run it after the run's write.
+    returns - {"rows": upserted daily rows, "rolled_until": new watermark, "error": str or None}
+    """
+    result = {"rows": 0, "rolled_until": None, "error": None}
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        with conn.cursor() as cur:
+            # Row lock on the watermark so two runs never roll up the same hours
+            cur.execute(f"""
+                INSERT INTO {schema}.rollup_watermarks (name, rolled_until)
+                VALUES (%s, '-infinity') ON CONFLICT (name) DO NOTHING;
+            """, (ROLLUP_NAME,))
+            cur.execute(f"""
+                SELECT rolled_until FROM {schema}.rollup_watermarks WHERE name = %s FOR UPDATE;
+            """, (ROLLUP_NAME,))
+            rolled_until = cur.fetchone()[0]
+            # LEAST ignores NULL (no snapshot past the watermark); never moves the watermark back
+            cur.execute(f"""
+                SELECT GREATEST(%s, LEAST(
+                    date_trunc('hour', CURRENT_TIMESTAMP - make_interval(mins => %s)),
+                    (SELECT MAX(recorded_at) FROM {schema}.{TRENDING_TABLE} WHERE recorded_at >= %s)
+                ));
+            """, (rolled_until, ROLLUP_LAG_MINUTES, rolled_until))
+            closed_until = cur.fetchone()[0]
+
+            cur.execute(f"""
+                INSERT INTO {schema}.{DAILY_TABLE} AS d (
+                    video_id, day, snapshot_count, first_recorded_at, last_recorded_at,
+                    first_views, last_views, max_views,
+                    first_likes, last_likes, max_likes,
+                    first_comment_count, last_comment_count, max_comment_count
+                )
+                SELECT video_id, day, snapshot_count, first_recorded_at, last_recorded_at,
+                       first_views, last_views, max_views,
+                       first_likes, last_likes, max_likes,
+                       first_comment_count, last_comment_count, max_comment_count
+                FROM (
+                    SELECT video_id,
+                           recorded_at::date AS day,
+                           COUNT(*) AS snapshot_count,
+                           MIN(recorded_at) AS first_recorded_at,
+                           MAX(recorded_at) AS last_recorded_at,
+                           (array_agg(views ORDER BY recorded_at))[1] AS first_views,
+                           (array_agg(views ORDER BY recorded_at DESC))[1] AS last_views,
+                           MAX(views) AS max_views,
+                           (array_agg(likes ORDER BY recorded_at))[1] AS first_likes,
+                           (array_agg(likes ORDER BY recorded_at DESC))[1] AS last_likes,
+                           MAX(likes) AS max_likes,
+                           (array_agg(comment_count ORDER BY recorded_at))[1] AS first_comment_count,
+                           (array_agg(comment_count ORDER BY recorded_at DESC))[1] AS last_comment_count,
+                           MAX(comment_count) AS max_comment_count
+                    FROM {schema}.{TRENDING_TABLE}
+                    WHERE recorded_at >= %s AND recorded_at < %s
+                    GROUP BY video_id, recorded_at::date
+                ) hourly
+                ON CONFLICT (video_id, day) DO UPDATE SET
+                    snapshot_count = d.snapshot_count + EXCLUDED.snapshot_count,
+                    first_recorded_at = LEAST(d.first_recorded_at, EXCLUDED.first_recorded_at),
+                    last_recorded_at = GREATEST(d.last_recorded_at, EXCLUDED.last_recorded_at),
+                    first_views = CASE WHEN EXCLUDED.first_recorded_at < d.first_recorded_at THEN EXCLUDED.first_views ELSE d.first_views END,
+                    last_views = CASE WHEN EXCLUDED.last_recorded_at > d.last_recorded_at THEN EXCLUDED.last_views ELSE d.last_views END,
+                    max_views = GREATEST(d.max_views, EXCLUDED.max_views),
+                    first_likes = CASE WHEN EXCLUDED.first_recorded_at < d.first_recorded_at THEN EXCLUDED.first_likes ELSE d.first_likes END,
+                    last_likes = CASE WHEN EXCLUDED.last_recorded_at > d.last_recorded_at THEN EXCLUDED.last_likes ELSE d.last_likes END,
+                    max_likes = GREATEST(d.max_likes, EXCLUDED.max_likes),
+                    first_comment_count = CASE WHEN EXCLUDED.first_recorded_at < d.first_recorded_at THEN EXCLUDED.first_comment_count ELSE d.first_comment_count END,
+                    last_comment_count = CASE WHEN EXCLUDED.last_recorded_at > d.last_recorded_at THEN EXCLUDED.last_comment_count ELSE d.last_comment_count END,
+                    max_comment_count = GREATEST(d.max_comment_count, EXCLUDED.max_comment_count)
+                RETURNING d.video_id;
+            """, (rolled_until, closed_until))
+            rows = cur.fetchall()
+
+            cur.execute(f"UPDATE {schema}.rollup_watermarks SET rolled_until = %s WHERE name = %s;",
+                        (closed_until, ROLLUP_NAME))
+
+        conn.commit()
+        result["rows"] = len(rows)
+        result["rolled_until"] = closed_until
+        print(f"Rolled up {len(rows)} daily trending rows up to {closed_until}.")
+        return result
+
+    except Exception as e:
+        print("Error rolling up trending snapshots:", e)
+        if conn:
+            conn.rollback()
+        result["error"] = str(e)
+        return result
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+def compact_trending_history(keep_weeks=TRENDING_RAW_KEEP_WEEKS, drop=TRENDING_RETENTION_DROP, conn=None,
+                             env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Removes raw hourly snapshots older than `keep_weeks` weeks (counting the current one),
+    but never past the rollup watermark, so only hours already in youtube_trending_daily_p go away.
+    Whole weekly partitions are detached, and dropped when `drop` is True (apply_trending_retention);
+    an unpartitioned table falls back to DELETE.
+    keep_weeks - weeks of raw snapshots to keep; 0 disables compaction.
+    returns - number of compacted partitions (or deleted rows when unpartitioned), or None on failure.
+    """
+    if keep_weeks <= 0:
+        return 0
+
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        cutoff = _week_start(date.today()) - timedelta(weeks=keep_weeks - 1)
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT rolled_until::date FROM {schema}.rollup_watermarks WHERE name = %s;", (ROLLUP_NAME,))
+            row = cur.fetchone()
+            partitioned = _is_partitioned(cur, schema)
+        conn.commit()
+
+        if row is None or row[0] is None or row[0] < cutoff:
+            print(f"Rollup has not reached {cutoff} yet, skipping compaction.")
+            return 0
+
+        if partitioned:
+            dropped = apply_trending_retention(keep_weeks=keep_weeks, drop=drop, conn=conn, env=env, schema=schema)
+            return None if dropped is None else len(dropped)
+
+        with conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {schema}.{TRENDING_TABLE} WHERE recorded_at < %s;", (cutoff,))
+            deleted = cur.rowcount
+        conn.commit()
+        print(f"Deleted {deleted} raw trending snapshots older than {cutoff}.")
+        return deleted
+
+    except Exception as e:
+        print("Error compacting trending history:", e)
+        if conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+## Dashboard aggregates (tables created by migrations.py), refreshed after every pipeline write
+
+def refresh_dashboard_aggregates(videos, conn=None, env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Incrementally refreshes the dashboard aggregate tables for the videos of one pipeline run:
+    - dash_video_trending_hours: +1 trending hour per video when the run is in a new hour, latest counters
+    - dash_channel_weekly: this week's video count of the channels in the run
+    - dash_category_weekly: this week's video count and counters of the categories in the run
+    Only rows for the run's videos, channels and categories are touched, so the dashboard reads
+    small precomputed tables instead of grouping the raw ones.
+    - videos: all fetched records of the run (VideoSnapshot or dicts), including suppressed snapshots
+    returns - {"videos": int, "channels": int, "categories": int, "error": str or None}
+    """
+    result = {"videos": 0, "channels": 0, "categories": 0, "error": None}
+    if not videos:
+        return result
+
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        # one week boundary for the three tables (and the dashboard readers)
+        week = current_week_start()
+        # one row per video (a video can trend in several regions)
+        latest = {}
+        for video_id, recorded_at, views, likes, comment_count in to_rows(
+                videos, ("video_id", "recorded_at", "views", "likes", "comment_count")):
+            latest[video_id] = (week, video_id, recorded_at, recorded_at, views, likes, comment_count)
+        channels = sorted({v.get("channel_title") for v in videos if v.get("channel_title")})
+
+        with conn.cursor() as cur:
+            execute_values(cur, f"""
+                INSERT INTO {schema}.dash_video_trending_hours AS d
+                    (week_start, video_id, trending_hours, first_seen, last_seen, last_views, last_likes, last_comment_count)
+                VALUES %s
+                ON CONFLICT (week_start, video_id) DO UPDATE SET
+                    trending_hours = d.trending_hours + CASE
+                        WHEN date_trunc('hour', EXCLUDED.last_seen) > date_trunc('hour', d.last_seen) THEN 1 ELSE 0 END,
+                    last_seen = GREATEST(d.last_seen, EXCLUDED.last_seen),
+                    last_views = EXCLUDED.last_views,
+                    last_likes = EXCLUDED.last_likes,
+                    last_comment_count = EXCLUDED.last_comment_count;
+            """, list(latest.values()),
+                template="(%s, %s, 1, %s::timestamptz, %s::timestamptz, %s, %s, %s)")
+            result["videos"] = len(latest)
+
+            if channels:
+                cur.execute(f"""
+                    INSERT INTO {schema}.dash_channel_weekly AS d (week_start, channel_title, video_count)
+                    SELECT %s, channel_title, COUNT(*)
+                    FROM {schema}.youtube_videos_p
+                    WHERE recorded_at >= %s AND recorded_at < %s AND channel_title = ANY(%s)
+                    GROUP BY channel_title
+                    ON CONFLICT (week_start, channel_title) DO UPDATE SET video_count = EXCLUDED.video_count;
+                """, (week, week, week + timedelta(weeks=1), channels))
+                result["channels"] = cur.rowcount
+
+            cur.execute(f"""
+                INSERT INTO {schema}.dash_category_weekly AS d
+                    (week_start, category_id, video_count, trending_hours, total_views, total_likes, total_comment_count)
+                SELECT h.week_start, v.category_id, COUNT(*), SUM(h.trending_hours),
+                       SUM(h.last_views), SUM(h.last_likes), SUM(h.last_comment_count)
+                FROM {schema}.dash_video_trending_hours h
+                JOIN {schema}.youtube_videos_p v ON v.video_id = h.video_id
+                WHERE h.week_start = %s
+                  AND v.category_id IN (SELECT category_id FROM {schema}.youtube_videos_p WHERE video_id = ANY(%s))
+                GROUP BY h.week_start, v.category_id
+                ON CONFLICT (week_start, category_id) DO UPDATE SET
+                    video_count = EXCLUDED.video_count,
+                    trending_hours = EXCLUDED.trending_hours,
+                    total_views = EXCLUDED.total_views,
+                    total_likes = EXCLUDED.total_likes,
+                    total_comment_count = EXCLUDED.total_comment_count;
+            """, (week, list(latest)))
+            result["categories"] = cur.rowcount
+
+        conn.commit()
+        print(f"Refreshed dashboard aggregates for {result['videos']} videos, "
+              f"{result['channels']} channels and {result['categories']} categories.")
+        return result
+
+    except Exception as e:
+        print("Error refreshing dashboard aggregates:", e)
+        if conn:
+            conn.rollback()
+        result["error"] = str(e)
+        return result
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+## Tag lookups on youtube_videos_p.tag_list (GIN index from migrations.py)
+
+def get_top_tags_for_week(week_start=None, limit=20, min_videos=2, conn=None,
+                          env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Most used tags among the videos first seen in the week starting on `week_start`
+    (defaults to the current week).
+    returns - list of (tag, video_count) tuples, most used first, or None on failure.
+    """
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        week = _week_start(week_start or date.today())
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT tag, COUNT(*) AS video_count
+                FROM {schema}.youtube_videos_p, unnest(tag_list) AS tag
+                WHERE recorded_at >= %s AND recorded_at < %s
+                GROUP BY tag
+                HAVING COUNT(*) >= %s
+                ORDER BY video_count DESC, tag
+                LIMIT %s;
+            """, (week, week + timedelta(weeks=1), min_videos, limit))
+            rows = cur.fetchall()
+        conn.rollback()
+        return rows
+
+    except Exception as e:
+        print("Error fetching top tags:", e)
+        if conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+def get_videos_by_tag(tag, limit=50, offset=0, conn=None, env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Videos carrying `tag` (case insensitive), newest first. Uses the GIN index on tag_list.
+    returns - list of dicts (video_id, title, channel_title, thumbnail_link, recorded_at), or None on failure.
+    """
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT video_id, title, channel_title, thumbnail_link, recorded_at
+                FROM {schema}.youtube_videos_p
+                WHERE tag_list @> ARRAY[%s]::text[]
+                ORDER BY recorded_at DESC, video_id
+                LIMIT %s OFFSET %s;
+            """, (tag.strip().lower(), limit, offset))
+            columns = [c[0] for c in cur.description]
+            rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        conn.rollback()
+        return rows
+
+    except Exception as e:
+        print("Error fetching videos by tag:", e)
+        if conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+## Full text search over titles and channels (search_vector column from migrations.py)
+
+def search_videos(query, limit=20, offset=0, conn=None, env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Ranked full text search of video titles and channel names across the whole history.
+    `query` uses web search syntax ("quoted phrase", -excluded, or). Title matches rank
+    above channel matches. Pages with limit/offset.
+    returns - list of dicts (video_id, title, channel_title, thumbnail_link, recorded_at, rank),
+              best match first, or None on failure.
+    """
+    if not query or not query.strip():
+        return []
+
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT video_id, title, channel_title, thumbnail_link, recorded_at,
+                       ts_rank_cd(search_vector, q) AS rank
+                FROM {schema}.youtube_videos_p, websearch_to_tsquery('simple', %s) AS q
+                WHERE search_vector @@ q
+                ORDER BY rank DESC, recorded_at DESC, video_id
+                LIMIT %s OFFSET %s;
+            """, (query, limit, offset))
+            columns = [c[0] for c in cur.description]
+            rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        conn.rollback()
+        return rows
+
+    except Exception as e:
+        print("Error searching videos:", e)
+        if conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+## Dedup lookups (dedup.find_new_videos resolves Redis misses with this)
+
+def get_existing_video_ids(video_ids, conn=None, env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Returns which of `video_ids` are already in youtube_videos_p, in one query (video_id = ANY(%s)
+    on the primary key) whatever the batch size.
+    returns - set of existing video IDs, or None on failure.
+    """
+    video_ids = list(dict.fromkeys(v for v in video_ids if v))
+    if not video_ids:
+        return set()
+
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT video_id FROM {schema}.youtube_videos_p
+                WHERE video_id = ANY(%s);
+            """, (video_ids,))
+            existing = {row[0] for row in cur.fetchall()}
+        conn.rollback()
+        return existing
+
+    except Exception as e:
+        print("Error looking up existing video IDs:", e)
+        if conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+def iter_video_ids(batch_size=50_000, since=None, conn=None, env=os.getenv("ENV", "prod"), schema=None):
+    """
+    Streams every video ID in youtube_videos_p through a server side cursor, `batch_size` per
+    round trip, so the full set is never held in memory (e.g. to seed bloom.BloomFilter).
+    With `since` (a date), only the videos recorded on or after that day (recorded_at index).
+    yields - lists of video IDs. Raises on failure (a partial listing must not pass for a full one).
+    """
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        if env == "test":
+            schema = os.getenv("POSTGRES_DB")
+        else:
+            if schema is None:
+                schema = "yt_data"
+
+        with conn.cursor(name="video_ids") as cur:
+            cur.itersize = batch_size
+            if since is None:
+                cur.execute(f"SELECT video_id FROM {schema}.youtube_videos_p;")
+            else:
+                cur.execute(f"SELECT video_id FROM {schema}.youtube_videos_p WHERE recorded_at >= %s;", (since,))
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [row[0] for row in rows]
+        conn.rollback()
+
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
         
 def wipe_youtube_tables(conn=None, env=os.getenv("ENV", "prod"), schema=None):
     """
@@ -246,7 +1290,7 @@ def wipe_youtube_tables(conn=None, env=os.getenv("ENV", "prod"), schema=None):
     try:
         close_conn = False
         if conn is None:
-            conn = get_db_connection(env)
+            conn = get_pooled_connection(env)
             close_conn = True
 
         if env == "test":
@@ -262,9 +1306,6 @@ def wipe_youtube_tables(conn=None, env=os.getenv("ENV", "prod"), schema=None):
         conn.commit()
         print("Wiped youtube_videos_p and youtube_trending_history_p tables.")
 
-        if close_conn:
-            conn.close()
-
         return 1  # Success
 
     except Exception as e:
@@ -273,4 +1314,4 @@ def wipe_youtube_tables(conn=None, env=os.getenv("ENV", "prod"), schema=None):
 
     finally:
         if close_conn and conn:
-            conn.close()
\ No newline at end of file
+            release_pooled_connection(conn, env)
\ No newline at end of file
@@ -47,18 +47,122 @@ create table some_schema.youtube_videos_p
     comment_count  bigint
 );
 
+-- trending history, partitioned by week on recorded_at
+-- recorded_at is a timestamp with time zone (the fetch time of the run, stamped in UTC by ty_api)
+-- instead of a date: one snapshot per video per pipeline run (hourly) rather than one per day,
+-- about 24x the rows of a daily table, kept in check by retention and the daily rollup below.
+-- (video_id, recorded_at) still dedups a re-sent snapshot of the same fetch.
+-- Weekly range partitions (Monday to Monday, same window as the weekly Spark export) are named
+-- youtube_trending_history_p_wYYYY_MM_DD, created ahead of time by db.ensure_trending_partitions()
+-- and detached (optionally dropped) by db.apply_trending_retention() instead of DELETE.
+-- The partition key has to be part of every unique constraint, so the primary key is (id, recorded_at).
+-- An existing unpartitioned table is converted by migrations.py (0007_partition_trending_history).
+
 CREATE TABLE some_schema.youtube_trending_history_p
 (
-    id            serial
-        primary key,
+    id            serial,
     video_id      varchar(20)
-        references youtube_videos_p
+        references some_schema.youtube_videos_p
             on delete cascade,
-    publish_date date not null,
+    publish_date  date not null,
     views         bigint,
     likes         bigint,
     comment_count bigint,
-    recorded_at   date default CURRENT_DATE,
+    recorded_at   timestamp with time zone default CURRENT_TIMESTAMP not null,
+    constraint youtube_trending_history_p_pkey
+        primary key (id, recorded_at),
     constraint youtube_trending_history_p_pk
         unique (video_id, recorded_at)
-);
\ No newline at end of file
+) PARTITION BY RANGE (recorded_at);
+
+-- catches rows outside every weekly partition instead of failing the insert
+CREATE TABLE some_schema.youtube_trending_history_p_default
+    PARTITION OF some_schema.youtube_trending_history_p DEFAULT;
+
+
+-- daily rollup of the hourly snapshots (created by migrations.py, filled by db.rollup_trending_daily())
+-- raw hours older than TRENDING_RAW_KEEP_WEEKS are compacted by db.compact_trending_history()
+-- once they are rolled up
+
+CREATE TABLE some_schema.youtube_trending_daily_p
+(
+    video_id            varchar(20)
+        references some_schema.youtube_videos_p
+            on delete cascade,
+    day                 date not null,
+    snapshot_count      integer not null,
+    first_recorded_at   timestamp with time zone not null,
+    last_recorded_at    timestamp with time zone not null,
+    first_views         bigint,
+    last_views          bigint,
+    max_views           bigint,
+    first_likes         bigint,
+    last_likes          bigint,
+    max_likes           bigint,
+    first_comment_count bigint,
+    last_comment_count  bigint,
+    max_comment_count   bigint,
+    views_delta         bigint generated always as (last_views - first_views) stored,
+    likes_delta         bigint generated always as (last_likes - first_likes) stored,
+    comment_count_delta bigint generated always as (last_comment_count - first_comment_count) stored,
+    primary key (video_id, day)
+);
+
+CREATE TABLE some_schema.rollup_watermarks
+(
+    name          text primary key,
+    rolled_until  timestamp with time zone not null
+);
+
+
+-- dashboard aggregates (created by migrations.py, refreshed by db.refresh_dashboard_aggregates()
+-- after every pipeline write; read by the Streamlit app instead of grouping the raw tables)
+
+CREATE TABLE some_schema.dash_video_trending_hours
+(
+    week_start          date not null,
+    video_id            varchar(20)
+        references some_schema.youtube_videos_p
+            on delete cascade,
+    trending_hours      integer not null,
+    first_seen          timestamp with time zone not null,
+    last_seen           timestamp with time zone not null,
+    last_views          bigint,
+    last_likes          bigint,
+    last_comment_count  bigint,
+    primary key (week_start, video_id)
+);
+
+CREATE TABLE some_schema.dash_channel_weekly
+(
+    week_start     date not null,
+    channel_title  text not null,
+    video_count    integer not null,
+    primary key (week_start, channel_title)
+);
+
+CREATE TABLE some_schema.dash_category_weekly
+(
+    week_start           date not null,
+    category_id          integer not null,
+    video_count          integer not null,
+    trending_hours       bigint not null,
+    total_views          bigint,
+    total_likes          bigint,
+    total_comment_count  bigint,
+    primary key (week_start, category_id)
+);
+
+
+-- normalized tags (migrations.py 0005): lowercased, trimmed, deduplicated tags filled on insert
+ALTER TABLE some_schema.youtube_videos_p ADD COLUMN tag_list text[];
+CREATE INDEX youtube_videos_p_tag_list_gin ON some_schema.youtube_videos_p USING gin (tag_list);
+
+
+-- full text search over title/channel (migrations.py 0006), queried by db.search_videos()
+ALTER TABLE some_schema.youtube_videos_p ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(channel_title, '')), 'B')
+    ) STORED;
+CREATE INDEX youtube_videos_p_search_vector_gin ON some_schema.youtube_videos_p USING gin (search_vector);
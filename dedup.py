@@ -0,0 +1,221 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from db import get_existing_video_ids, iter_video_ids
+from g_sheets import _cached_video_ids, cache_video_ids_idempotent
+from redis_conn import get_redis_client
+from bloom import BloomFilter, BLOOM_PATH, BLOOM_CAPACITY, BLOOM_ERROR_RATE
+from dotenv import load_dotenv
+load_dotenv()
+
+# "on" loads the seen video IDs filter in the pipeline
+SEEN_FILTER_MODE = os.getenv("SEEN_FILTER_MODE", "off").lower()
+# Copy the filter (~9 MB at the default capacity) to Redis at most once per this many hours,
+# for hosts starting without the file. 0 keeps it local only.
+SEEN_FILTER_REDIS_COPY_HOURS = float(os.getenv("SEEN_FILTER_REDIS_COPY_HOURS", 0))
+# Days re-read before the filter's last sync when catching it up: recorded_at is a date, and
+# covers rows committed late or dated in another timezone
+SEEN_FILTER_SYNC_DAYS = int(os.getenv("SEEN_FILTER_SYNC_DAYS", 2))
+
+
+def _seen_filter_key(env):
+    return f"bloom:seen_videos:{env}"
+
+
+def load_seen_filter(
+    env=os.getenv("ENV", "prod"),
+    path=BLOOM_PATH,
+    redis_client=None,
+    conn=None,
+    capacity=BLOOM_CAPACITY,
+    error_rate=BLOOM_ERROR_RATE
+):
+    """
+    Memory-maps the Bloom filter of every video ID already stored, for find_new_videos().
+    Loaded from `path` when the file exists, else restored from the copy in Redis, else
+    built by streaming youtube_videos_p (db.iter_video_ids) into a new file. A loaded or
+    restored filter is then caught up with the videos recorded since it was last synced
+    (another host's writes, an old file or Redis copy), so its negatives can be trusted.
+    args:
+        redis_client: redis.Redis : Optional client returning bytes (decode_responses=False)
+    returns:
+        BloomFilter, or None when it can't be loaded, built or caught up (dedup then uses Redis/Postgres only)
+    """
+    try:
+        bloom = None
+        if os.path.exists(path):
+            try:
+                bloom = BloomFilter.open(path)
+            except Exception as e:
+                print(f"Seen videos filter {path} unreadable ({e}), rebuilding it.")
+
+        if bloom is None:
+            redis_client = redis_client or get_redis_client(env, decode_responses=False)
+            data = redis_client.get(_seen_filter_key(env)) if redis_client else None
+            restored = None
+            if data:
+                try:
+                    restored = BloomFilter.from_bytes(data)
+                    print(f"Seen videos filter restored from Redis into {path}.")
+                except ValueError as e:
+                    print(f"Seen videos filter copy in Redis unreadable ({e}), rebuilding it.")
+            if restored is None:
+                # built in memory and saved once complete, a partial filter would miss stored IDs
+                restored = BloomFilter.for_capacity(capacity, error_rate)
+                restored.synced_at = time.time()
+                for ids in iter_video_ids(conn=conn, env=env):
+                    restored.update(ids)
+                print(f"Seen videos filter built from Postgres with {len(restored)} IDs.")
+            restored.save(path)
+            bloom = BloomFilter.open(path)
+
+        try:
+            _catch_up_seen_filter(bloom, conn=conn, env=env)
+        except Exception:
+            bloom.close()
+            raise
+
+        if len(bloom) > capacity:
+            print(f"Seen videos filter holds {len(bloom)} IDs, over its capacity of {capacity}: "
+                  f"false positives (extra exact lookups) are growing. Delete {path} and "
+                  f"{_seen_filter_key(env)} to rebuild it larger.")
+        return bloom
+
+    except Exception as e:
+        print(f"Seen videos filter unavailable ({e}) — deduplicating with Redis/Postgres only.")
+        return None
+
+
+def _catch_up_seen_filter(bloom, conn=None, env=os.getenv("ENV", "prod")):
+    """
+    Adds the videos recorded since the filter's last sync (minus SEEN_FILTER_SYNC_DAYS) with one
+    range scan on recorded_at, then moves its sync time to when the scan started.
+    returns - number of IDs that were missing from the filter
+    """
+    started = time.time()
+    synced_day = datetime.fromtimestamp(bloom.synced_at, timezone.utc).date()
+    added = 0
+    for ids in iter_video_ids(since=synced_day - timedelta(days=SEEN_FILTER_SYNC_DAYS), conn=conn, env=env):
+        added += bloom.update(ids)
+    bloom.synced_at = started
+    bloom.flush()
+    if added:
+        print(f"Seen videos filter caught up with {added} IDs stored since {synced_day}.")
+    return added
+
+
+def save_seen_filter(
+    bloom,
+    env=os.getenv("ENV", "prod"),
+    redis_client=None,
+    copy_every_hours=SEEN_FILTER_REDIS_COPY_HOURS
+):
+    """
+    Flushes the filter file. With copy_every_hours > 0, also stores a copy in Redis (so other
+    hosts can start from it) when the last copy is older than that.
+    returns - True if the Redis copy was written.
+    """
+    bloom.flush()
+    if copy_every_hours <= 0:
+        return False
+    try:
+        redis_client = redis_client or get_redis_client(env, decode_responses=False)
+        if not redis_client:
+            return False
+        key = _seen_filter_key(env)
+        copied_at = redis_client.get(f"{key}:copied_at")
+        if copied_at and time.time() - float(copied_at) < copy_every_hours * 3600:
+            return False
+        pipe = redis_client.pipeline()
+        pipe.set(key, bloom.to_bytes())
+        pipe.set(f"{key}:copied_at", time.time())
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Could not copy the seen videos filter to Redis: {e}")
+        return False
+
+
+def find_new_videos(
+    videos,
+    env=os.getenv("ENV", "prod"),
+    redis_client=None,
+    conn=None,
+    schema=None,
+    prefix="",
+    ttl_hours=24.0,
+    seen_filter=None
+):
+    """
+    Splits a batch of fetched videos into the ones never seen before and the known ones.
+    Redis -> Postgres fallback chain, with a fixed number of round trips whatever the batch size:
+      1. one pipelined lookup of the whole batch in the Redis ID index
+      2. one SELECT video_id = ANY(%s) on youtube_videos_p for the Redis misses
+      3. the IDs Postgres already had are written back to Redis (cache_video_ids_idempotent)
+    With a `seen_filter` (load_seen_filter, caught up with Postgres when loaded), IDs the Bloom
+    filter has never seen are new without any lookup; only its positives, which may be false,
+    are confirmed through steps 1-3.
+    When Redis is down every ID goes to Postgres; when Postgres fails too the misses are
+    reported as new (inserts are ON CONFLICT DO NOTHING, so nothing is duplicated in the DB).
+    args:
+        videos: list[dict] : Videos with at least 'video_id'
+        env: str : Environment name for the Redis namespace and the DB schema
+        redis_client: redis.Redis : Optional Redis client. If None, the shared pooled client is used.
+        conn: psycopg2 connection : Optional connection (a pooled one is used otherwise)
+        schema: str : Schema for prod (defaults to yt_data)
+        prefix: str : Optional prefix for Redis keys
+        ttl_hours: float : TTL of the backfilled Redis keys
+        seen_filter: BloomFilter : Optional filter of the stored video IDs
+    returns:
+        dict : "new" (list of new video dicts, first occurrence of each ID, in order),
+            "cached" / "in_db" (sets of IDs found in Redis / Postgres), "unseen" (number of
+            IDs the filter never saw, reported new without a lookup) and "error"
+    """
+    ids = list(dict.fromkeys(v.get("video_id") for v in videos if v.get("video_id")))
+    result = {"new": [], "cached": set(), "in_db": set(), "unseen": 0, "error": None}
+    if not ids:
+        return result
+    if seen_filter is not None:
+        seen = [vid for vid in ids if vid in seen_filter]
+        result["unseen"] = len(ids) - len(seen)
+        ids = seen
+
+    redis_client = redis_client or get_redis_client(env)
+    key_prefix = f"{prefix}:" if prefix else f"{env}:"
+    if redis_client and ids:
+        try:
+            result["cached"] = _cached_video_ids(redis_client, key_prefix, env, ids=ids)
+        except Exception as e:
+            print(f"Redis unavailable ({e}) — checking every ID against Postgres.")
+            redis_client = None
+
+    misses = [vid for vid in ids if vid not in result["cached"]]
+    if misses:
+        in_db = get_existing_video_ids(misses, conn=conn, env=env, schema=schema)
+        if in_db is None:
+            result["error"] = "Postgres lookup failed"
+            in_db = set()
+        result["in_db"] = in_db
+
+    # Backfill Redis so the next run answers these from the cache
+    if redis_client and result["in_db"]:
+        backfill = [v for v in videos if v.get("video_id") in result["in_db"]]
+        cache_video_ids_idempotent(backfill, env=env, prefix=prefix, ttl_hours=ttl_hours,
+                                   redis_client=redis_client)
+
+    result["new"] = _first_occurrences(videos, result["cached"] | result["in_db"])
+    print(f"Dedup: {result['unseen']} unseen by the filter, {len(result['cached'])} cached, "
+          f"{len(result['in_db'])} found in Postgres, {len(result['new'])} new.")
+    return result
+
+
+def _first_occurrences(videos, known):
+    """Videos whose ID is not in `known`, keeping the first occurrence of each ID, in order."""
+    new, seen = [], set()
+    for video in videos:
+        vid = video.get("video_id")
+        if not vid or vid in known or vid in seen:
+            continue
+        seen.add(vid)
+        new.append(video)
+    return new
@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import col, when, round
 from awsfuncs import extract_s3_parts, delete_old_week_folders
+from db import get_db_connection
+from pg_export import export_week_to_parquet, count_week_rows, SPARK_MIN_ROWS
 from dotenv import load_dotenv
 from urllib.parse import urlparse, urlunparse
 load_dotenv()
@@ -172,9 +174,39 @@ def run_spark_job(env = os.getenv("ENV", "test")):
     except Exception as e:
         print(f"\033[1;31mERROR: Spark job failed: {e}\033[0m") 
         return {"status": "failure"}
-        
 
-run_spark_job()
+
+def run_weekly_export(env=os.getenv("ENV", "test"), spark_min_rows=SPARK_MIN_ROWS):
+    """Picks the export engine for the current week by its size: weeks with fewer than
+    `spark_min_rows` snapshots are streamed straight from Postgres to Parquet (pg_export),
+    bigger ones go through the Spark job. Both write the same week_YYYY_MM_DD layout.
+    arg:
+    env: str : 'test' or 'prod' to determine configurations
+    returns:
+    dict : Status of the job and output path if successful
+    """
+    today = datetime.now().date()
+    monday = today - timedelta(days=today.weekday())
+    schema = "aq_test_local" if env == "test" else "yt_data"
+
+    try:
+        conn = get_db_connection(env)
+        try:
+            rows = count_week_rows(conn, schema, monday, monday + timedelta(days=7))
+            conn.rollback()
+            if rows < spark_min_rows:
+                print(f"\n\033[34m{rows} rows this week (< {spark_min_rows}), exporting directly without Spark\033[0m\n")
+                return export_week_to_parquet(get_output_path(env), env=env, monday=monday, conn=conn)
+        finally:
+            conn.close()
+        print(f"\n\033[34m{rows} rows this week, running the Spark job\033[0m\n")
+    except Exception as e:
+        print(f"\033[33mCould not size this week ({e}), running the Spark job\033[0m")
+
+    return run_spark_job(env)
+
+
+run_weekly_export()
 
 def read_s3_parquet(output_path=get_output_path(), env=os.getenv("ENV", "test")):
     """
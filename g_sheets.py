@@ -2,7 +2,9 @@ import gspread
 from google.oauth2.service_account import Credentials
 import os
 import json
-import redis
+import time
+from redis_conn import get_redis_client
+from yt_records import to_rows, SNAPSHOT_FIELDS
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -22,42 +24,6 @@ SHEET_ID = os.getenv("SHEET_ID")
 VIDEOS_SHEET_NAME = "vids"
 TRENDING_SHEET_NAME = "snapshots"
 
-def get_redis_client(env: str = os.getenv("ENV", "test")) -> redis.Redis:
-    """
-    Establishes and returns a Redis client based on the environment.
-    - For 'test', local Redis on localhost or whatever you have set up
-    - For 'prod', uses credentials from environment variables
-    """
-    try:
-        if env.lower() == "test":
-            print("Connecting to local Redis (test mode)...")
-            client = redis.Redis(
-                host="127.0.0.1",
-                port=6379,
-                db=0,
-                decode_responses=True
-            )
-        else:
-            print(f"Connecting to Redis (env={env})...")
-            client = redis.Redis(
-                host=os.getenv("REDIS_HOST"),
-                port=int(os.getenv("REDIS_PORT", 6379)),
-                username=os.getenv("REDIS_USERNAME"),
-                password=os.getenv("REDIS_PASSWORD"),
-                ssl=bool(os.getenv("REDIS_SSL", "false").lower() == "true"),
-                db=int(os.getenv("REDIS_DB", 0)),
-                decode_responses=True
-            )
-
-        # Quick ping test for early failure detection
-        client.ping()
-        print("Redis connection successful")
-        return client
-
-    except Exception as e:
-        print(f"Redis connection failed: {e}")
-        return None
-
 def clear_redis_cache(env: str = os.getenv("ENV", "prod")):
     """
     clears all keys in Redis for the specified environment.
@@ -72,29 +38,131 @@ def clear_redis_cache(env: str = os.getenv("ENV", "prod")):
     except Exception as e:
         print(f"Error clearing Redis cache: {e}")
 
+## Per-env index of cached video IDs: a sorted set `{prefix}__idx__` scored by each key's
+## expiry (unix time, inf for keys without TTL), so membership checks never SCAN the keyspace.
+VIDEO_INDEX_SUFFIX = "__idx__"
+## Sorted set `{prefix}__sheet__` of the IDs update_videos_sheet has appended, scored by when
+## (kept apart from the cache keys, which expire and carry the video fields). Entries older than
+## SHEET_INDEX_DAYS are trimmed on each lookup, like the expired entries of the ID index.
+SHEET_INDEX_SUFFIX = "__sheet__"
+SHEET_INDEX_DAYS = float(os.getenv("SHEET_INDEX_DAYS", 30))
+
+
+def _video_index_key(prefix):
+    """Index key for an already normalized key prefix ("prod:" -> "prod:__idx__")."""
+    return f"{prefix}{VIDEO_INDEX_SUFFIX}"
+
+
+def _sheet_index_key(prefix):
+    """Sheet membership key for an already normalized key prefix ("prod:" -> "prod:__sheet__")."""
+    return f"{prefix}{SHEET_INDEX_SUFFIX}"
+
+
+def rebuild_video_id_index(env: str = os.getenv("ENV", "prod"), prefix: str = "", redis_client=None) -> int:
+    """
+    Rebuilds the video ID index from the cached keys with one SCAN (and a pipelined TTL per key).
+    Only needed once for caches written before the index existed; the cache functions call it
+    automatically when the index key is missing.
+    args:
+        env: str : Environment name for namespacing keys
+        prefix: str : Optional prefix for Redis keys
+        redis_client: redis.Redis : Optional Redis client
+    returns:
+        int : Number of IDs in the rebuilt index
+    """
+    redis_client = redis_client or get_redis_client(env)
+    prefix = f"{prefix}:" if prefix else f"{env}:"
+    index_key = _video_index_key(prefix)
+
+    keys = []
+    for k in redis_client.scan_iter(f"{prefix}*"):
+        if isinstance(k, bytes):
+            k = k.decode()
+        if k not in (index_key, _sheet_index_key(prefix)):
+            keys.append(k)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for k in keys:
+        pipe.ttl(k)
+    ttls = pipe.execute() if keys else []
+
+    now = time.time()
+    # the index itself marks the set as built, so an empty cache doesn't trigger a rescan every run
+    scores = {VIDEO_INDEX_SUFFIX: float("inf")}
+    for k, ttl in zip(keys, ttls):
+        if ttl == -2:  # expired in between
+            continue
+        scores[k[len(prefix):]] = now + ttl if ttl >= 0 else float("inf")
+
+    pipe = redis_client.pipeline()
+    pipe.delete(index_key)
+    pipe.zadd(index_key, scores)
+    pipe.execute()
+
+    print(f"Rebuilt Redis video ID index {index_key} with {len(scores) - 1} IDs.")
+    return len(scores) - 1
+
+
+def _cached_video_ids(redis_client, prefix, env, ids=None) -> set:
+    """
+    Returns the cached (not expired) video IDs among `ids`, or all of them when `ids` is None.
+    One pipelined round trip: drop expired index entries, then ZMSCORE the batch.
+    """
+    index_key = _video_index_key(prefix)
+    now = time.time()
+
+    for attempt in range(2):
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.exists(index_key)
+        pipe.zremrangebyscore(index_key, "-inf", f"({now}")
+        if ids is None:
+            pipe.zrangebyscore(index_key, now, "+inf")
+        elif ids:
+            pipe.zmscore(index_key, ids)
+        results = pipe.execute()
+
+        if results[0] or attempt:
+            break
+        rebuild_video_id_index(env=env, prefix=prefix.rstrip(":"), redis_client=redis_client)
+
+    if ids is None:
+        found = results[2]
+        found = {m.decode() if isinstance(m, bytes) else m for m in found}
+        found.discard(VIDEO_INDEX_SUFFIX)
+        return found
+    if not ids:
+        return set()
+    return {vid for vid, score in zip(ids, results[2]) if score is not None}
+
+
 def cache_video_ids_idempotent(
     videos:list,
     env:str = os.getenv("ENV", "prod"),
     prefix:str = "",
     ttl_hours:float = 24.0,
-    redis_client= None
+    redis_client= None,
+    queue_extra= None
 ):
     """
     Caches video IDs in Redis with idempotency.
+    New videos get one HSET (all fields as a mapping) + EXPIRE, cached ones only an EXPIRE,
+    all sent in one non-transactional pipeline (one round trip besides the index lookup).
     args:
         videos: list[dict] : List of video dicts containing at least 'video_id'
         env: str : Environment name for namespacing keys
         prefix: str : Optional prefix for Redis keys
         ttl_hours: float : Time-to-live for each key in hours
-        redis_client: redis.Redis : Optional Redis client. If None, a new client will be
-            created based on the environment.
+        redis_client: redis.Redis : Optional Redis client. If None, the shared pooled client is used.
+        queue_extra: callable : Optional callable(pipe) queuing more commands sent in the same
+            pipeline (e.g. leaderboards.queue_leaderboard_updates)
     returns:
-        dict : Summary of added, refreshed, skipped counts
+        dict : Summary of added, refreshed, skipped, failed counts and per-key outcomes
+            ("results": {video_id: "added" | "refreshed" | "failed"})
     """
     try:
         redis_client = redis_client or get_redis_client(env)
         if not redis_client or not videos:
-            return {"added": 0, "refreshed": 0, "skipped": 0}
+            return {"added": 0, "refreshed": 0, "skipped": 0, "failed": 0, "results": {}}
 
         prefix = f"{prefix}:" if prefix else f"{env}:"
         ttl_seconds = int(ttl_hours * 3600)
@@ -102,19 +170,18 @@ def cache_video_ids_idempotent(
         from datetime import datetime
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
 
-        # Load existing IDs
-        existing_ids = set()
-        for k in redis_client.scan_iter(f"{prefix}*"):
-            if isinstance(k, bytes):
-                k = k.decode()
-            existing_ids.add(k.replace(prefix, ""))
+        # Which of these IDs are already cached (index lookup, no SCAN)
+        batch_ids = list(dict.fromkeys(v.get("video_id") for v in videos if v.get("video_id")))
+        existing_ids = _cached_video_ids(redis_client, prefix, env, ids=batch_ids)
 
-        pipe = redis_client.pipeline()
-        added = refreshed = skipped = 0
+        pipe = redis_client.pipeline(transaction=False)
+        skipped = 0
+        queued = []  # (video_id, outcome, number of queued commands)
+        expires_at = {}
 
         for video in videos:
             vid = video.get("video_id")
-            if not vid:
+            if not vid or vid in expires_at:
                 skipped += 1
                 continue
 
@@ -122,28 +189,50 @@ def cache_video_ids_idempotent(
 
             if vid in existing_ids:
                 pipe.expire(key, ttl_seconds)
-                refreshed += 1
+                queued.append((vid, "refreshed", 1))
             else:
-                pipe.hset(key, "video_id", vid)
-                pipe.hset(key, "cached_at", now)
-                pipe.hset(key, "env", env)
-                pipe.hset(key, "title", video.get("title", ""))
-                pipe.hset(key, "channel_id", video.get("channel_id", ""))
-                pipe.hset(key, "published_at", video.get("published_at", ""))
-                pipe.hset(key, "duration", video.get("duration", ""))
-                pipe.hset(key, "thumbnail", video.get("thumbnail", ""))
-                pipe.hset(key, "in_sheet", "no")  # Mark as not yet written to sheet
+                pipe.hset(key, mapping={
+                    "video_id": vid,
+                    "cached_at": now,
+                    "env": env,
+                    "title": video.get("title") or "",
+                    "channel_id": video.get("channel_id") or "",
+                    "published_at": video.get("published_at") or "",
+                    "duration": video.get("duration") or "",
+                    "thumbnail": video.get("thumbnail") or video.get("thumbnail_link") or "",
+                    "in_sheet": "no",  # Mark as not yet written to sheet
+                })
                 pipe.expire(key, ttl_seconds)
-                added += 1
-
-        pipe.execute()
-
-        print(f"Redis summary → added: {added}, refreshed: {refreshed}, skipped: {skipped}")
+                queued.append((vid, "added", 2))
+            expires_at[vid] = time.time() + ttl_seconds
+
+        if expires_at:
+            pipe.zadd(_video_index_key(prefix), expires_at)
+        if queue_extra:
+            try:
+                queue_extra(pipe)
+            except Exception as e:
+                print(f"Error queuing extra Redis commands: {e}")
+        replies = pipe.execute(raise_on_error=False)
+
+        results = {}
+        position = 0
+        for vid, outcome, n_commands in queued:
+            failed = any(isinstance(r, Exception) for r in replies[position:position + n_commands])
+            results[vid] = "failed" if failed else outcome
+            position += n_commands
+
+        added = sum(1 for r in results.values() if r == "added")
+        refreshed = sum(1 for r in results.values() if r == "refreshed")
+        failed = sum(1 for r in results.values() if r == "failed")
+        print(f"Redis summary → added: {added}, refreshed: {refreshed}, skipped: {skipped}, failed: {failed}")
 
         return {
             "added": added,
             "refreshed": refreshed,
             "skipped": skipped,
+            "failed": failed,
+            "results": results,
             "error": None
         }
     except Exception as e:
@@ -152,6 +241,8 @@ def cache_video_ids_idempotent(
             "added": 0,
             "refreshed": 0,
             "skipped": 0,
+            "failed": 0,
+            "results": {},
             "error": str(e)
         }
 
@@ -181,14 +272,25 @@ def get_existing_keys_cached(
     sheet_name="",
     env=os.getenv("ENV", "test"),
     redis_client=None,
-    prefix=""
+    prefix="",
+    ids=None,
+    seen_filter=None
 ):
     """
     Pull existing keys from Redis.
+    args:
+        ids: list[str] : Optional batch of video IDs to check; only those that are cached are
+            returned (one ZMSCORE on the index). If None, all cached IDs are returned.
+        seen_filter: BloomFilter : Optional filter of the stored video IDs (dedup.load_seen_filter).
+            IDs are only cached once stored, so with `ids` just the filter's positives are looked up.
     Returns:
         existing_ids (set[str])
         needs_header (bool)
     """
+    if seen_filter is not None and ids is not None:
+        ids = [vid for vid in ids if vid in seen_filter]
+        if not ids:
+            return set(), False
 
     redis_client = redis_client or get_redis_client(env)
     prefix = f"{prefix}:" if prefix else f"{env}:"
@@ -196,14 +298,7 @@ def get_existing_keys_cached(
     if redis_client:
         print("Fetching existing keys from Redis...")
         try:
-            existing_ids = set()
-
-            for k in redis_client.scan_iter(f"{prefix}*"):
-                if isinstance(k, bytes):
-                    k = k.decode()
-
-                video_id = k.split(":", 1)[1]
-                existing_ids.add(video_id)
+            existing_ids = _cached_video_ids(redis_client, prefix, env, ids=ids)
 
             print(f"Found {len(existing_ids)} cached IDs in Redis.")
             return existing_ids, False
@@ -225,7 +320,7 @@ def _append_to_sheet(sheet_name, fieldnames, rows, needs_header):
     args:
         sheet_name: str : Name of the sheet/tab
         fieldnames: list[str] : List of field names (columns)
-        rows: list[dict] : List of row dicts to append
+        rows: list : List of records (VideoSnapshot or dicts) to append
         needs_header: bool : Whether to add header row
     returns:
         int : Number of rows added
@@ -244,16 +339,8 @@ def _append_to_sheet(sheet_name, fieldnames, rows, needs_header):
         print(f"Adding header row to '{sheet_name}'...")
         sheet.append_row(fieldnames)
 
-    # Convert dicts to lists matching the fieldnames
-    cleaned_rows = []
-    for row in rows:
-        cleaned_row = [
-            ", ".join(v) if isinstance(v, list)
-            else str(v) if isinstance(v, (dict, tuple))
-            else v
-            for v in (row.get(f, "") for f in fieldnames)
-        ]
-        cleaned_rows.append(cleaned_row)
+    # Convert records (VideoSnapshot or dicts) to lists matching the fieldnames in one pass
+    cleaned_rows = to_rows(rows, fieldnames, default="", clean=True)
 
     # Batch append all rows at once
     if cleaned_rows:
@@ -264,12 +351,22 @@ def _append_to_sheet(sheet_name, fieldnames, rows, needs_header):
 
 
 
+# HSET in_sheet only when the key exists (EXISTS + HSET atomically, so an expiring key isn't recreated)
+_MARK_IN_SHEET_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HSET', KEYS[1], 'in_sheet', 'yes')
+end
+return -1
+"""
+
+
 def update_videos_sheet(
     videos,
     env=os.getenv("ENV", "prod"),
     sheet_name="",
     redis_client=None,
-    prefix=""
+    prefix="",
+    seen_filter=None
 ):
     """Appends unique videos to Google Sheet using Redis to prevent duplicates after insert.
     args:
@@ -279,6 +376,8 @@ def update_videos_sheet(
         redis_client: redis.Redis : Optional Redis client. If None, a new client will be
             created based on the environment.
         prefix: str : Optional prefix for Redis keys
+        seen_filter: BloomFilter : Optional filter of the stored video IDs; the IDs it never saw
+            are not looked up in Redis (see get_existing_keys_cached)
     returns:
         int : Number of new videos added to the sheet
     """
@@ -288,14 +387,32 @@ def update_videos_sheet(
 
     fieldnames = list(videos[0].keys())
 
+    redis_client = redis_client or get_redis_client(env)
+    key_prefix = f"{prefix}:" if prefix else f"{env}:"
+
     # Fetch existing IDs (only those marked as in_sheet=yes)
     existing_ids, needs_header = get_existing_keys_cached(
         key_fields=["video_id"],
         sheet_name=sheet_name if sheet_name else "vids",
+        env=env,
         redis_client=redis_client,
-        prefix=prefix
+        prefix=prefix,
+        ids=[v["video_id"] for v in videos],
+        seen_filter=seen_filter
     )
 
+    # IDs appended to the sheet in the last SHEET_INDEX_DAYS, cached or not
+    ids = [v["video_id"] for v in videos if seen_filter is None or v["video_id"] in seen_filter]
+    if redis_client and ids:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.zremrangebyscore(_sheet_index_key(key_prefix), "-inf", time.time() - SHEET_INDEX_DAYS * 86400)
+            pipe.zmscore(_sheet_index_key(key_prefix), ids)
+            in_sheet = pipe.execute()[1]
+            existing_ids = set(existing_ids) | {vid for vid, score in zip(ids, in_sheet) if score is not None}
+        except Exception as e:
+            print(f"Could not read the sheet index from Redis ({e}).")
+
     # Filter new videos
     new_videos = [v for v in videos if v["video_id"] not in existing_ids]
 
@@ -309,11 +426,21 @@ def update_videos_sheet(
     _append_to_sheet(sheet_name if sheet_name else "vids", fieldnames, new_videos, needs_header)
     print(f"Added {len(new_videos)} new videos to Google Sheet '{sheet_name if sheet_name else 'vids'}'.")
 
-    # Mark Redis entries as actually written into the sheet
+    # Record the IDs as written into the sheet, and mark the cache entries that already exist.
+    # A missing cache key is not created here: it would be a TTL-less hash without the video
+    # fields, which cache_video_ids_idempotent would then treat as cached and never fill in.
     if redis_client:
-        for v in new_videos:
-            key = f"{prefix}:{v['video_id']}"
-            redis_client.hset(key, "in_sheet", "yes")
+        try:
+            mark_in_sheet = redis_client.register_script(_MARK_IN_SHEET_LUA)
+            pipe = redis_client.pipeline(transaction=False)
+            now = time.time()
+            pipe.zadd(_sheet_index_key(key_prefix), {v["video_id"]: now for v in new_videos})
+            pipe.expire(_sheet_index_key(key_prefix), int(SHEET_INDEX_DAYS * 86400))
+            for v in new_videos:
+                mark_in_sheet(keys=[f"{key_prefix}{v['video_id']}"], client=pipe)
+            pipe.execute()
+        except Exception as e:
+            print(f"Could not record the appended IDs in Redis ({e}).")
 
     return len(new_videos)
 
@@ -325,7 +452,7 @@ def update_trending_sheet(snapshots, xclient=None, sheet_name=""):
     - Only fetches the first row to check for headers (efficient for large sheets).
 
     args:
-        snapshots (list[dict]): List of trending snapshot records.
+        snapshots (list): List of trending snapshot records (VideoSnapshot or dicts).
         xclient: gspread.Client : Optional gspread client. If None, uses default client.
         sheet_name (str): Optional sheet name. If empty, defaults to "snapshots".
     """
@@ -333,7 +460,7 @@ def update_trending_sheet(snapshots, xclient=None, sheet_name=""):
         print("No snapshots to add.")
         return 0
 
-    fieldnames = ["video_id", "publish_date", "views", "likes", "comment_count", "recorded_at"]
+    fieldnames = list(SNAPSHOT_FIELDS)
     if xclient is None and sheet_name == "":
         sheet = client.open_by_key(os.getenv("SHEET_ID")).worksheet("snapshots")
     else:
@@ -352,10 +479,8 @@ def update_trending_sheet(snapshots, xclient=None, sheet_name=""):
         print("Adding header row to trending sheet...")
         sheet.append_row(fieldnames)
 
-    # Convert snapshots (list[dict]) to lists matching fieldnames
-    cleaned_rows = []
-    for s in snapshots:
-        cleaned_rows.append([s.get(f, "") for f in fieldnames])
+    # Convert snapshots (VideoSnapshot or dicts) to lists matching fieldnames
+    cleaned_rows = to_rows(snapshots, fieldnames, default="")
 
     # Batch append
     if cleaned_rows:
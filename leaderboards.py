@@ -0,0 +1,160 @@
+import os
+import time
+from redis_conn import get_redis_client
+from dotenv import load_dotenv
+load_dotenv()
+
+# Leaderboard per region and metric: a sorted set of video_id -> score, replaced every run
+LEADERBOARD_METRICS = ("views", "engagement_rate", "view_velocity")
+# Board holding the videos of every region fetched in the run
+ALL_REGIONS = "ALL"
+# Region of records fetched without region tagging (run_yt_api's default chart)
+DEFAULT_REGION = os.getenv("LEADERBOARD_DEFAULT_REGION", "US")
+# Boards disappear when no run has refreshed them for this long
+LEADERBOARD_TTL_HOURS = float(os.getenv("LEADERBOARD_TTL_HOURS", 3))
+# Last views/time per video for the velocity (kept longer so a skipped run doesn't reset it)
+VELOCITY_STATE_TTL_HOURS = float(os.getenv("LEADERBOARD_VELOCITY_STATE_TTL_HOURS", 48))
+
+
+def leaderboard_key(metric, region=ALL_REGIONS, env=os.getenv("ENV", "prod")):
+    return f"lb:{env}:{region}:{metric}"
+
+
+def _velocity_key(env):
+    return f"lb:{env}:last_views"
+
+
+def engagement_rate(video):
+    """(likes + comment_count) / views * 100 rounded to 2 decimals, 0 without views (as in the weekly export)."""
+    views = int(video.get("views") or 0)
+    if views <= 0:
+        return 0.0
+    return round((int(video.get("likes") or 0) + int(video.get("comment_count") or 0)) / views * 100, 2)
+
+
+def leaderboard_scores(videos, previous=None, now=None):
+    """
+    Scores of this run's videos, per board.
+    view_velocity is the views gained per hour since the previous run that saw the video
+    (`previous`: {video_id: (views, unix time)}); videos seen for the first time have none.
+    returns - {(region, metric): {video_id: score}} including the ALL_REGIONS boards
+    """
+    previous = previous or {}
+    now = time.time() if now is None else now
+    boards = {}
+    for video in videos:
+        vid = video.get("video_id")
+        if not vid:
+            continue
+        views = int(video.get("views") or 0)
+        scores = {"views": views, "engagement_rate": engagement_rate(video)}
+        if vid in previous:
+            last_views, last_time = previous[vid]
+            if now - last_time >= 60:
+                scores["view_velocity"] = round((views - last_views) / ((now - last_time) / 3600), 2)
+
+        for region in (video.get("region") or DEFAULT_REGION, ALL_REGIONS):
+            for metric, score in scores.items():
+                boards.setdefault((region, metric), {})[vid] = score
+    return boards
+
+
+def _load_previous_views(redis_client, env, video_ids):
+    values = redis_client.hmget(_velocity_key(env), video_ids)
+    previous = {}
+    for vid, value in zip(video_ids, values):
+        if value:
+            views, seen_at = value.split(",")
+            previous[vid] = (int(views), float(seen_at))
+    return previous
+
+
+def queue_leaderboard_updates(pipe, videos, env=os.getenv("ENV", "prod"), redis_client=None, now=None):
+    """
+    Queues the replacement of every board touched by this run on `pipe`, so the boards are
+    written in the same round trip as the cache update (cache_video_ids_idempotent(queue_extra=...)).
+    Each board is filled under a temporary key and RENAMEd over the live one, so readers never
+    see a half written board. Reads the previous views for the velocity first (one HMGET).
+    args:
+        pipe: redis.client.Pipeline : Pipeline the commands are added to
+        videos: list[dict] : This run's videos (video_id, views, likes, comment_count, region)
+        env: str : Environment name for namespacing keys
+        redis_client: redis.Redis : Client for the HMGET (defaults to the shared pooled client)
+    returns:
+        int : Number of boards queued
+    """
+    now = time.time() if now is None else now
+    video_ids = list(dict.fromkeys(v.get("video_id") for v in videos if v.get("video_id")))
+    if not video_ids:
+        return 0
+
+    previous = {}
+    redis_client = redis_client or get_redis_client(env)
+    if redis_client:
+        try:
+            previous = _load_previous_views(redis_client, env, video_ids)
+        except Exception as e:
+            print(f"Could not read the previous views for view velocity: {e}")
+
+    boards = leaderboard_scores(videos, previous, now)
+    ttl_seconds = int(LEADERBOARD_TTL_HOURS * 3600)
+    regions = {region for region, _ in boards}
+    for region in regions:
+        for metric in LEADERBOARD_METRICS:
+            key = leaderboard_key(metric, region, env)
+            scores = boards.get((region, metric))
+            if not scores:
+                pipe.delete(key)
+                continue
+            tmp_key = f"{key}:tmp"
+            pipe.delete(tmp_key)
+            pipe.zadd(tmp_key, scores)
+            pipe.rename(tmp_key, key)
+            pipe.expire(key, ttl_seconds)
+
+    state_key = _velocity_key(env)
+    pipe.hset(state_key, mapping={
+        v["video_id"]: f"{int(v.get('views') or 0)},{now:.0f}" for v in videos if v.get("video_id")
+    })
+    pipe.expire(state_key, int(VELOCITY_STATE_TTL_HOURS * 3600))
+    return len(regions) * len(LEADERBOARD_METRICS)
+
+
+def get_top_videos(metric="views", region=ALL_REGIONS, n=10, env=os.getenv("ENV", "prod"), redis_client=None):
+    """
+    Top `n` videos of a board, highest score first, with one ZREVRANGE.
+    returns - list of (video_id, score), empty when the board doesn't exist or Redis is unavailable
+    """
+    try:
+        redis_client = redis_client or get_redis_client(env)
+        if not redis_client:
+            return []
+        return redis_client.zrevrange(leaderboard_key(metric, region, env), 0, n - 1, withscores=True)
+    except Exception as e:
+        print(f"Error reading leaderboard {metric}/{region}: {e}")
+        return []
+
+
+def get_leaderboard(metric="views", region=ALL_REGIONS, n=10, env=os.getenv("ENV", "prod"), redis_client=None):
+    """
+    Top `n` videos of a board with their score on every metric (for display), ranked by `metric`.
+    One ZREVRANGE, then one pipelined ZMSCORE per other metric.
+    returns - list of dicts (video_id, views, engagement_rate, view_velocity), best first
+    """
+    redis_client = redis_client or get_redis_client(env)
+    top = get_top_videos(metric, region, n, env, redis_client)
+    if not top:
+        return []
+
+    rows = [{"video_id": vid, metric: score} for vid, score in top]
+    others = [m for m in LEADERBOARD_METRICS if m != metric]
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for other in others:
+            pipe.zmscore(leaderboard_key(other, region, env), [row["video_id"] for row in rows])
+        for other, scores in zip(others, pipe.execute()):
+            for row, score in zip(rows, scores):
+                row[other] = score
+    except Exception as e:
+        print(f"Error reading leaderboard scores for {region}: {e}")
+    return rows
@@ -0,0 +1,36 @@
+from migrations import run_migrations
+from db import ensure_trending_partitions, apply_trending_retention, rollup_trending_daily, \
+    compact_trending_history, TRENDING_RETENTION_DROP
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+
+def run_maintenance(drop=TRENDING_RETENTION_DROP, env=os.getenv("ENV", "prod")):
+    """
+    Schema and retention maintenance, kept out of the hourly pipeline run. Schedule it on its
+    own, e.g. once a day: `python maintenance.py`.
+    - applies pending migrations
+    - creates the trending history partitions of the coming weeks
+    - detaches partitions past TRENDING_RETENTION_WEEKS
+    - rolls closed hours up, then compacts raw hours past TRENDING_RAW_KEEP_WEEKS
+    Old partitions are only dropped with drop=True (TRENDING_RETENTION_DROP=on), detached otherwise.
+    New ones are created weeks ahead (TRENDING_PARTITION_WEEKS_AHEAD), so a missed run doesn't matter.
+    returns - dict with the result of each step (None for a failed step)
+    """
+    print(f"\033[1;32m===========\nYT maintenance running... [mode:{env}]\n===========\033[0m\n")
+    result = {"migrations": run_migrations(env=env)}
+    if result["migrations"] is None:
+        print("Migrations failed, skipping partition maintenance.")
+        return result
+
+    result["partitions"] = ensure_trending_partitions(env=env)
+    result["retention"] = apply_trending_retention(drop=drop, env=env)
+    result["rollup"] = rollup_trending_daily(env=env)
+    result["compaction"] = compact_trending_history(drop=drop, env=env)
+    return result
+
+
+if __name__ == "__main__":
+    run_maintenance()
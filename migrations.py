@@ -0,0 +1,260 @@
+from db import get_pooled_connection, release_pooled_connection
+from dotenv import load_dotenv
+import os
+load_dotenv()
+
+# Ordered schema migrations as (id, sql). {schema} is replaced with the target schema.
+# Applied ids are recorded in {schema}.schema_migrations, so each one runs once per schema.
+# Append new migrations at the end, never edit or reorder applied ones.
+MIGRATIONS = [
+    # Spark weekly export reads snapshots by recorded_at range. BRIN is tiny and fits the
+    # append-only, time-ordered inserts; on the partitioned table it is created per partition.
+    ("0001_trending_recorded_at_brin", """
+        CREATE INDEX IF NOT EXISTS youtube_trending_history_p_recorded_at_brin
+        ON {schema}.youtube_trending_history_p USING brin (recorded_at);
+    """),
+
+    # Dashboard: channels trending this week (recorded_at range + GROUP BY channel_title)
+    # and latest videos (ORDER BY recorded_at DESC LIMIT n). Covering so both can be
+    # answered with an index-only scan.
+    ("0002_videos_recorded_at_channel", """
+        CREATE INDEX IF NOT EXISTS youtube_videos_p_recorded_at_channel_idx
+        ON {schema}.youtube_videos_p (recorded_at) INCLUDE (channel_title);
+    """),
+
+    # Daily per-video rollup of the hourly snapshots, filled incrementally by db.rollup_trending_daily()
+    # from the watermark in rollup_watermarks. Long range trends read this instead of the raw history.
+    ("0003_trending_daily_rollup", """
+        CREATE TABLE IF NOT EXISTS {schema}.youtube_trending_daily_p (
+            video_id            varchar(20) references {schema}.youtube_videos_p on delete cascade,
+            day                 date not null,
+            snapshot_count      integer not null,
+            first_recorded_at   timestamp with time zone not null,
+            last_recorded_at    timestamp with time zone not null,
+            first_views         bigint,
+            last_views          bigint,
+            max_views           bigint,
+            first_likes         bigint,
+            last_likes          bigint,
+            max_likes           bigint,
+            first_comment_count bigint,
+            last_comment_count  bigint,
+            max_comment_count   bigint,
+            views_delta         bigint generated always as (last_views - first_views) stored,
+            likes_delta         bigint generated always as (last_likes - first_likes) stored,
+            comment_count_delta bigint generated always as (last_comment_count - first_comment_count) stored,
+            primary key (video_id, day)
+        );
+        CREATE INDEX IF NOT EXISTS youtube_trending_daily_p_day_idx
+        ON {schema}.youtube_trending_daily_p (day);
+        CREATE TABLE IF NOT EXISTS {schema}.rollup_watermarks (
+            name          text primary key,
+            rolled_until  timestamp with time zone not null
+        );
+    """),
+
+    # Dashboard aggregates refreshed by db.refresh_dashboard_aggregates() after every pipeline write
+    ("0004_dashboard_aggregates", """
+        CREATE TABLE IF NOT EXISTS {schema}.dash_video_trending_hours (
+            week_start          date not null,
+            video_id            varchar(20) references {schema}.youtube_videos_p on delete cascade,
+            trending_hours      integer not null,
+            first_seen          timestamp with time zone not null,
+            last_seen           timestamp with time zone not null,
+            last_views          bigint,
+            last_likes          bigint,
+            last_comment_count  bigint,
+            primary key (week_start, video_id)
+        );
+        CREATE TABLE IF NOT EXISTS {schema}.dash_channel_weekly (
+            week_start     date not null,
+            channel_title  text not null,
+            video_count    integer not null,
+            primary key (week_start, channel_title)
+        );
+        CREATE TABLE IF NOT EXISTS {schema}.dash_category_weekly (
+            week_start           date not null,
+            category_id          integer not null,
+            video_count          integer not null,
+            trending_hours       bigint not null,
+            total_views          bigint,
+            total_likes          bigint,
+            total_comment_count  bigint,
+            primary key (week_start, category_id)
+        );
+    """),
+
+    # Normalized tags (lowercased, trimmed, deduplicated) next to the text encoded tags column,
+    # filled on insert by db.py and looked up through GIN (tag_list @> ARRAY['tag']).
+    ("0005_videos_tag_list", """
+        ALTER TABLE {schema}.youtube_videos_p ADD COLUMN IF NOT EXISTS tag_list text[];
+        UPDATE {schema}.youtube_videos_p
+        SET tag_list = ARRAY(
+            SELECT lower(btrim(t)) FROM unnest(tags::text[]) WITH ORDINALITY AS u(t, n)
+            WHERE btrim(t) <> '' GROUP BY 1 ORDER BY min(n)
+        )
+        WHERE tag_list IS NULL AND tags IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS youtube_videos_p_tag_list_gin
+        ON {schema}.youtube_videos_p USING gin (tag_list);
+    """),
+
+    # Full text search over title (weight A) and channel (weight B) for db.search_videos().
+    # A stored generated column, so every insert path (add_video_P, bulk, staged merge) keeps it
+    # up to date. 'simple' config: titles come in many languages, so no stemming or stop words.
+    ("0006_videos_search_vector", """
+        ALTER TABLE {schema}.youtube_videos_p ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(channel_title, '')), 'B')
+        ) STORED;
+        CREATE INDEX IF NOT EXISTS youtube_videos_p_search_vector_gin
+        ON {schema}.youtube_videos_p USING gin (search_vector);
+    """),
+
+    # Converts an unpartitioned youtube_trending_history_p (the original db.sql layout) into the
+    # weekly partitioned table of db.sql, in this migration's transaction:
+    #   - recorded_at goes from date to timestamp with time zone (old rows land on midnight of their
+    #     day) and the primary key becomes (id, recorded_at), see db.sql for the granularity change
+    #   - ids keep coming from the old sequence
+    #   - every week from the oldest snapshot to 4 weeks ahead gets its partition BEFORE the copy,
+    #     so no old row ends up in the default partition (which would block creating that week later)
+    # Does nothing when the table is already partitioned (created from db.sql).
+    ("0007_partition_trending_history", """
+        DO $$
+        DECLARE
+            seq        text;
+            week       date;
+            last_week  date := date_trunc('week', CURRENT_DATE)::date + 28;
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                JOIN pg_namespace ns ON ns.oid = c.relnamespace
+                WHERE ns.nspname = '{schema}' AND c.relname = 'youtube_trending_history_p'
+            ) THEN
+                RETURN;
+            END IF;
+
+            ALTER TABLE {schema}.youtube_trending_history_p RENAME TO youtube_trending_history_p_old;
+            ALTER TABLE {schema}.youtube_trending_history_p_old
+                RENAME CONSTRAINT youtube_trending_history_p_pkey TO youtube_trending_history_p_old_pkey;
+            ALTER TABLE {schema}.youtube_trending_history_p_old
+                RENAME CONSTRAINT youtube_trending_history_p_pk TO youtube_trending_history_p_old_pk;
+            ALTER INDEX IF EXISTS {schema}.youtube_trending_history_p_recorded_at_brin
+                RENAME TO youtube_trending_history_p_old_recorded_at_brin;
+
+            seq := pg_get_serial_sequence('{schema}.youtube_trending_history_p_old', 'id');
+            IF seq IS NULL THEN
+                CREATE SEQUENCE {schema}.youtube_trending_history_p_id_seq;
+                seq := '{schema}.youtube_trending_history_p_id_seq';
+                PERFORM setval(seq, COALESCE((SELECT max(id) FROM {schema}.youtube_trending_history_p_old), 0) + 1, false);
+            END IF;
+
+            EXECUTE format($ddl$
+                CREATE TABLE {schema}.youtube_trending_history_p (
+                    id            integer default nextval(%L) not null,
+                    video_id      varchar(20) references {schema}.youtube_videos_p on delete cascade,
+                    publish_date  date not null,
+                    views         bigint,
+                    likes         bigint,
+                    comment_count bigint,
+                    recorded_at   timestamp with time zone default CURRENT_TIMESTAMP not null,
+                    constraint youtube_trending_history_p_pkey primary key (id, recorded_at),
+                    constraint youtube_trending_history_p_pk unique (video_id, recorded_at)
+                ) PARTITION BY RANGE (recorded_at)
+            $ddl$, seq);
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY {schema}.youtube_trending_history_p.id', seq);
+
+            SELECT date_trunc('week', MIN(COALESCE(recorded_at::timestamptz, publish_date::timestamptz)))::date
+            INTO week FROM {schema}.youtube_trending_history_p_old;
+            week := LEAST(COALESCE(week, last_week), date_trunc('week', CURRENT_DATE)::date);
+            WHILE week <= last_week LOOP
+                EXECUTE format(
+                    'CREATE TABLE {schema}.%I PARTITION OF {schema}.youtube_trending_history_p FOR VALUES FROM (%L) TO (%L)',
+                    'youtube_trending_history_p_w' || to_char(week, 'YYYY_MM_DD'), week, week + 7
+                );
+                week := week + 7;
+            END LOOP;
+            CREATE TABLE {schema}.youtube_trending_history_p_default
+                PARTITION OF {schema}.youtube_trending_history_p DEFAULT;
+
+            INSERT INTO {schema}.youtube_trending_history_p
+                (id, video_id, publish_date, views, likes, comment_count, recorded_at)
+            SELECT id, video_id, publish_date, views, likes, comment_count,
+                   COALESCE(recorded_at::timestamptz, publish_date::timestamptz)
+            FROM {schema}.youtube_trending_history_p_old;
+
+            DROP TABLE {schema}.youtube_trending_history_p_old;
+            CREATE INDEX IF NOT EXISTS youtube_trending_history_p_recorded_at_brin
+                ON {schema}.youtube_trending_history_p USING brin (recorded_at);
+        END
+        $$;
+    """),
+]
+
+
+def _schema_for(env, schema):
+    if env == "test":
+        return os.getenv("POSTGRES_DB")
+    return schema if schema is not None else "yt_data"
+
+
+def applied_migrations(conn, schema):
+    """Returns the set of migration ids already applied to `schema`."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.schema_migrations (
+                id          text primary key,
+                applied_at  timestamp with time zone default CURRENT_TIMESTAMP not null
+            );
+        """)
+        cur.execute(f"SELECT id FROM {schema}.schema_migrations;")
+        applied = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return applied
+
+
+def run_migrations(conn=None, env=os.getenv("ENV", "prod"), schema=None, migrations=None):
+    """
+    Applies the pending MIGRATIONS in order, each one in its own transaction.
+    Stops at the first failing migration so later ones never run on a half migrated schema.
+    - conn: optional psycopg2 connection (a pooled one is used otherwise)
+    - env: "prod" or "test", picks the schema like the other db functions
+    - schema: target schema for prod (defaults to yt_data)
+    - migrations: list of (id, sql) to apply instead of MIGRATIONS
+    returns - list of applied migration ids, or None on failure.
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    schema = _schema_for(env, schema)
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_pooled_connection(env)
+            close_conn = True
+
+        done = applied_migrations(conn, schema)
+        applied = []
+        for migration_id, sql in migrations:
+            if migration_id in done:
+                continue
+            with conn.cursor() as cur:
+                cur.execute(sql.format(schema=schema))
+                cur.execute(f"INSERT INTO {schema}.schema_migrations (id) VALUES (%s);", (migration_id,))
+            conn.commit()
+            applied.append(migration_id)
+            print(f"Applied migration {migration_id} to {schema}")
+        return applied
+
+    except Exception as e:
+        print(f"Error applying migrations to {schema}:", e)
+        if conn:
+            conn.rollback()
+        return None
+
+    finally:
+        if close_conn and conn:
+            release_pooled_connection(conn, env)
+
+
+if __name__ == "__main__":
+    run_migrations()
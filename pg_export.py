@@ -0,0 +1,149 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from db import get_db_connection
+from awsfuncs import extract_s3_parts, delete_old_week_folders, delete_folder_contents, upload_file
+from dotenv import load_dotenv
+load_dotenv()
+
+# Weeks with fewer trending rows than this are exported without Spark
+SPARK_MIN_ROWS = int(os.getenv("EXPORT_SPARK_MIN_ROWS", 500_000))
+# Rows fetched per round trip from the server side cursor (one Parquet row group each)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 50_000))
+
+# Same columns, order and types as the Spark job writes (etl_spark.run_spark_job)
+WEEK_SCHEMA = pa.schema([
+    ("video_id", pa.string()),
+    ("id", pa.int32()),
+    ("publish_date", pa.date32()),
+    ("views", pa.int64()),
+    ("likes", pa.int64()),
+    ("comment_count", pa.int64()),
+    ("recorded_at", pa.timestamp("us", tz="UTC")),
+    ("category_name", pa.string()),
+    ("engagement_rate", pa.float64()),
+])
+
+
+def _schema_for(env):
+    return "aq_test_local" if env == "test" else "yt_data"
+
+
+def count_week_rows(conn, schema, monday, next_monday):
+    """Number of trending snapshots in [monday, next_monday), only reads that week's partition."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT COUNT(*) FROM {schema}.youtube_trending_history_p
+            WHERE recorded_at >= %s AND recorded_at < %s;
+        """, (monday, next_monday))
+        return cur.fetchone()[0]
+
+
+def add_engagement_rate(table):
+    """
+    Appends engagement_rate = round((likes + comment_count) / views * 100, 2), 0 when views is 0,
+    computed on whole Arrow columns (same rounding as Spark's round: half up).
+    """
+    views = pc.cast(table["views"], pa.float64())
+    interactions = pc.cast(pc.add(table["likes"], table["comment_count"]), pa.float64())
+    rate = pc.round(pc.multiply(pc.divide(interactions, views), 100), ndigits=2, round_mode="half_up")
+    has_views = pc.fill_null(pc.greater(table["views"], 0), False)
+    return table.append_column("engagement_rate", pc.if_else(has_views, rate, 0.0))
+
+
+def iter_week_batches(conn, schema, monday, next_monday, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Streams the weekly join (snapshots + category name) through a server side cursor and
+    yields pyarrow Tables of up to `batch_size` rows in WEEK_SCHEMA.
+    """
+    names = [f.name for f in WEEK_SCHEMA if f.name != "engagement_rate"]
+    types = [WEEK_SCHEMA.field(n).type for n in names]
+    with conn.cursor(name="week_export") as cur:
+        cur.itersize = batch_size
+        cur.execute(f"""
+            SELECT t.video_id, t.id, t.publish_date, t.views, t.likes, t.comment_count,
+                   t.recorded_at, c.category_name
+            FROM {schema}.youtube_trending_history_p t
+            LEFT JOIN {schema}.youtube_videos_p v ON v.video_id = t.video_id
+            LEFT JOIN {schema}.categorical_data c ON c.id = v.category_id
+            WHERE t.recorded_at >= %s AND t.recorded_at < %s;
+        """, (monday, next_monday))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            table = pa.table([pa.array(col, type=t) for col, t in zip(columns, types)], names=names)
+            yield add_engagement_rate(table)
+
+
+def write_week_parquet(batches, path):
+    """Writes the batches to one Parquet file (one row group per batch). returns - rows written."""
+    rows = 0
+    with pq.ParquetWriter(path, WEEK_SCHEMA, compression="snappy") as writer:
+        for batch in batches:
+            writer.write_table(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def export_week_to_parquet(output_path, env=os.getenv("ENV", "test"), monday=None, conn=None, s3=None):
+    """
+    Exports the current week (Monday to Monday) to <output_path>/week_YYYY_MM_DD/ like the Spark job,
+    without Spark: psycopg2 server side cursor -> pyarrow -> one Parquet file, uploaded to S3.
+    Old week folders are cleaned up the same way.
+    args:
+     output_path: str : s3a:// base path (etl_spark.get_output_path)
+     env: str : 'test' or 'prod' to determine the schema and connection
+     monday: date : First day of the week to export (defaults to the current week)
+    returns:
+     dict : Status of the export and output path / row count if successful
+    """
+    close_conn = False
+    try:
+        if conn is None:
+            conn = get_db_connection(env)
+            close_conn = True
+
+        schema = _schema_for(env)
+        if monday is None:
+            today = datetime.now().date()
+            monday = today - timedelta(days=today.weekday())
+        next_monday = monday + timedelta(days=7)
+        week_str = monday.strftime("%Y_%m_%d")
+
+        bucket, prefix = extract_s3_parts(output_path)
+        folder = f"{prefix}/week_{week_str}"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            local_file = os.path.join(tmp, "part-00000.snappy.parquet")
+            rows = write_week_parquet(iter_week_batches(conn, schema, monday, next_monday), local_file)
+            conn.rollback()
+            if rows == 0:
+                print("\033[31mWARNING! No data for this week, skipping write.\033[0m")
+                return {"status": "success", "rows": 0}
+
+            print(f"\n\033[34mCleaning up old week folders in s3://{bucket}/{prefix} \n..excluding week_{week_str}...\033[0m\n")
+            delete_old_week_folders(bucket=bucket, prefix=prefix, current_week=week_str, s3=s3)
+            # overwrite this week's folder
+            delete_folder_contents(bucket, folder, s3=s3)
+
+            upload_file(bucket, local_file, f"{folder}/part-00000.snappy.parquet", s3_client=s3)
+            success_marker = os.path.join(tmp, "_SUCCESS")
+            open(success_marker, "w").close()
+            upload_file(bucket, success_marker, f"{folder}/_SUCCESS", s3_client=s3)
+
+        output_dir = f"{output_path}/week_{week_str}"
+        print(f"\n\033[1;32mSuccessfully wrote {rows} rows to: {output_dir} (direct export)\033[0m\n")
+        return {"status": "success", "output_path": output_dir, "rows": rows}
+
+    except Exception as e:
+        print(f"\033[1;31mERROR: Direct Parquet export failed: {e}\033[0m")
+        return {"status": "failure"}
+
+    finally:
+        if close_conn and conn:
+            conn.close()
@@ -0,0 +1,74 @@
+import os
+from threading import Lock
+import redis
+from dotenv import load_dotenv
+load_dotenv()
+
+# Connections kept per pool (shared by every get_redis_client caller in the process)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 10))
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def _pool_kwargs(env):
+    if env.lower() == "test":
+        return {"host": "127.0.0.1", "port": 6379, "db": 0}
+    kwargs = {
+        "host": os.getenv("REDIS_HOST"),
+        "port": int(os.getenv("REDIS_PORT", 6379)),
+        "username": os.getenv("REDIS_USERNAME"),
+        "password": os.getenv("REDIS_PASSWORD"),
+        "db": int(os.getenv("REDIS_DB", 0)),
+    }
+    if os.getenv("REDIS_SSL", "false").lower() == "true":
+        kwargs["connection_class"] = redis.SSLConnection
+    return kwargs
+
+
+def get_redis_pool(env: str = os.getenv("ENV", "test"), decode_responses: bool = True) -> redis.ConnectionPool:
+    """
+    Returns the process wide Redis connection pool for `env`, creating (and pinging) it on first use.
+    - For 'test', local Redis on localhost
+    - For 'prod', uses credentials from environment variables
+    - decode_responses=False gives a separate pool returning raw bytes (binary values)
+    raises:
+        redis.RedisError : if Redis can't be reached when the pool is created
+    """
+    with _pools_lock:
+        pool = _pools.get((env, decode_responses))
+        if pool is None:
+            print(f"Connecting to Redis (env={env})...")
+            pool = redis.ConnectionPool(
+                max_connections=REDIS_MAX_CONNECTIONS,
+                decode_responses=decode_responses,
+                health_check_interval=30,
+                **_pool_kwargs(env)
+            )
+            # Quick ping test for early failure detection, once per pool
+            redis.Redis(connection_pool=pool).ping()
+            print("Redis connection successful")
+            _pools[(env, decode_responses)] = pool
+    return pool
+
+
+def get_redis_client(env: str = os.getenv("ENV", "test"), decode_responses: bool = True) -> redis.Redis:
+    """
+    Returns a Redis client on the shared connection pool for `env`.
+    Clients are cheap; connections are reused across calls, so this can be called freely.
+    Pass decode_responses=False to read binary values as bytes.
+    Returns None if Redis is unreachable.
+    """
+    try:
+        return redis.Redis(connection_pool=get_redis_pool(env, decode_responses))
+    except Exception as e:
+        print(f"Redis connection failed: {e}")
+        return None
+
+
+def close_redis_pools():
+    """Disconnects every pooled Redis connection (e.g. at the end of a job)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.disconnect()
+        _pools.clear()
@@ -1,13 +1,29 @@
-from ty_api import run_yt_api
-from db import add_video_P, add_trending_snapshot_P, wipe_youtube_tables
+from ty_api import run_yt_api, run_yt_api_regions, enrich_video_details
+from db import write_pipeline_run, wipe_youtube_tables, rollup_trending_daily, refresh_dashboard_aggregates
 from g_sheets import update_videos_sheet, update_trending_sheet, clear_sheet_completely, \
-    cache_video_ids_idempotent, get_existing_keys_cached, clear_redis_cache
+    cache_video_ids_idempotent, clear_redis_cache, get_redis_client
+from dedup import find_new_videos, load_seen_filter, save_seen_filter, SEEN_FILTER_MODE
+from leaderboards import queue_leaderboard_updates
+from yt_hll import queue_hll_updates
+from yt_quota import configure_quota_limiter
+from yt_delta import DeltaSuppressor, DELTA_MODE
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 import time
-def run_pipeline(api_key=os.getenv("YT_API_KEY")):
+
+
+def run_pipeline(api_key=os.getenv("YT_API_KEY"), regions=os.getenv("YT_REGIONS", "")):
+    """
+    Runs the hourly pipeline: YouTube API -> Redis cache -> Postgres -> Google Sheets.
+    Migrations, partitions, retention and compaction run separately (maintenance.py).
+    api_key: YouTube API key (defaults to YT_API_KEY).
+    regions: Comma separated region codes (or a list) to fetch concurrently, e.g. "US,GB,CA".
+        Defaults to YT_REGIONS; when empty only the US chart is fetched.
+    """
+    if isinstance(regions, str):
+        regions = [r.strip().upper() for r in regions.split(",") if r.strip()]
     try:
         # # Testind code to wipe tables and sheets and verify functionality
         # wipe_youtube_tables()
@@ -22,48 +38,71 @@ def run_pipeline(api_key=os.getenv("YT_API_KEY")):
 
         #-- Fetch data from YouTube API
         print("\033[4m" + "--Running YT API function..." + "\033[0m\n\n")
-        videos = run_yt_api(api_key, size=10)
+        # Share the daily quota spend with the other jobs using this key through Redis
+        configure_quota_limiter(redis_client=get_redis_client())
+        if regions:
+            videos = run_yt_api_regions(api_key, size=10, regions=regions)
+        else:
+            videos = run_yt_api(api_key, size=10)
         if not videos:
             print("No videos fetched from YouTube API.")
             return
 
-        print("\n\033[33m=== Checking Redis cache for existing videos ===\033[0m\n")
-        cached_ids, _ = get_existing_keys_cached(key_fields=["video_id"])
-        print(f"Cached IDs retrieved: {cached_ids}")
-        print(f"secondary return from get_existing_keys_cached: {_}\n")
-        current_video_ids = {v["video_id"] for v in videos}
-        
-        print(f"Current video IDs from API: {current_video_ids}\n")
-        new_videos = [v for v in videos if v["video_id"] not in current_video_ids]
+        #-- Add channel_id, duration and published_at for the Redis cache
+        enrich_video_details(videos, api_key)
+
+        def queue_live_stats(pipe):
+            """Leaderboards and distinct counters, sent with the Redis cache update."""
+            queue_leaderboard_updates(pipe, videos)
+            queue_hll_updates(pipe, videos)
+
+        #-- Only keep snapshots whose counters moved enough since the last written one (SNAPSHOT_DELTA_MODE=on)
+        suppressor = None
+        snapshots = videos
+        if DELTA_MODE == "on":
+            suppressor = DeltaSuppressor(redis_client=get_redis_client())
+            snapshots = suppressor.select(videos)
+            print(f"Delta suppression: writing {len(snapshots)} of {len(videos)} trending snapshots.\n")
+
+        print("\n\033[33m=== Checking Redis cache / Postgres for existing videos ===\033[0m\n")
+        #-- One Redis lookup for the batch and one Postgres query for the misses (backfilled into Redis);
+        #-- IDs the seen videos Bloom filter never saw are new without a lookup (SEEN_FILTER_MODE=on)
+        seen_filter = load_seen_filter() if SEEN_FILTER_MODE == "on" else None
+        dedup = find_new_videos(videos, seen_filter=seen_filter)
+        new_videos = dedup["new"]
         print(f"new videos to process: {[v['video_id'] for v in new_videos]}")
 
         print(f"Fetched {len(videos)} videos from API.\n")
 
-        print(f"{len(cached_ids)} cached videos found.")
+        print(f"{len(dedup['cached'])} cached videos found, {len(dedup['in_db'])} more already in the database.")
         print(f"{len(new_videos)} new videos will be processed.\n")
 
-        
         ##-- If no new videos, skip DB and Sheet updates and just update snapshot sheet
         if not new_videos:
             print("\033[33m******\033[0m")
-            print("\033[33mAll videos are already cached — skipping DB and video Sheet updates and updating snapshot sheet.\033[0m")
+            print("\033[33mAll videos are already known — skipping DB and video Sheet updates and updating snapshot sheet.\033[0m")
             print("\033[33m******\033[0m\n\n")
 
-            ##-- Update Redis cache
+            ##-- Update Redis cache, the live leaderboards and distinct counters (one pipeline)
             print("\n=== Updating Redis cache ===\n")
-            cache_video_ids_idempotent(videos, ttl_hours=24)
+            cache_video_ids_idempotent(videos, ttl_hours=24, queue_extra=queue_live_stats)
 
             print("\033[4m" + "--Running Database functions.." + "\033[0m")
-            db_result_snapshots = add_trending_snapshot_P(videos)
-            if db_result_snapshots:
-                print(f"\033[34mAttempted to Inserted {len(videos)} trending snapshots into the database.\033[0m\n\n")
+            db_result = write_pipeline_run([], snapshots)
+            if db_result["error"] is None:
+                if suppressor:
+                    suppressor.commit(snapshots)
+                refresh_dashboard_aggregates(videos)
+                rollup_trending_daily()
+                print(f"\033[34mInserted {db_result['snapshots']['inserted']} trending snapshots into the database "
+                      f"({db_result['snapshots']['skipped']} already present).\033[0m\n\n")
             else:
                 print("Failed to insert trending snapshots into the database. Aborting pipeline.")
                 raise Exception("DB insertion failed.")
 
             print("\033[4m" + "--Running Google Sheets functions..." + "\033[0m\n\n")
             #-- Update trending snapshots sheet
-            update_trending_sheet(videos)
+            update_trending_sheet(snapshots)
 
             print("\n\n\033[1;32mPipeline completed successfully!\033[0m\n")
 
@@ -75,34 +114,37 @@ def run_pipeline(api_key=os.getenv("YT_API_KEY")):
 
 
 
-        #-- Insert videos into the database
-        db_result_videos = add_video_P(new_videos)
-        if db_result_videos:
-            print(f"\033[34m{len(new_videos)} were found from a sucessful API call, \n..attempting to send to videos table...\033[0m\n")
-        else:
-            print("Failed to insert videos into the database.")
-            raise Exception("DB insertion failed for video Table. Aborting pipeline.")
-
-        #-- Insert trending snapshots into the database
-        db_result_snapshots = add_trending_snapshot_P(videos)
-        if db_result_snapshots:
-            print(f"\033[34mAttempted to Inserted {len(videos)} trending snapshots into the database.\033[0m\n\n")
+        #-- Insert new videos and all trending snapshots in one transaction
+        db_result = write_pipeline_run(new_videos, snapshots)
+        if db_result["error"] is None:
+            if suppressor:
+                suppressor.commit(snapshots)
+            if seen_filter is not None:
+                seen_filter.update(v["video_id"] for v in new_videos)
+                save_seen_filter(seen_filter)
+            refresh_dashboard_aggregates(videos)
+            #-- Roll closed hours up into the daily table (the watermark lags behind, see db.rollup_trending_daily)
+            rollup_trending_daily()
+            print(f"\033[34m{len(new_videos)} were found from a sucessful API call, \n..inserted {db_result['videos']['inserted']} "
+                  f"into the videos table ({db_result['videos']['skipped']} already present).\033[0m\n")
+            print(f"\033[34mInserted {db_result['snapshots']['inserted']} trending snapshots into the database "
+                  f"({db_result['snapshots']['skipped']} already present).\033[0m\n\n")
         else:
-            print("Failed to insert trending snapshots into the database. Aborting pipeline.")
-            raise Exception("DB insertion failed.")
-
-
-        ##-- Update Redis cache
-        print("\n=== Updating Redis cache ===\n")
-        # cache videos
-        cache_video_ids_idempotent(videos=videos, ttl_hours=24)
+            print("Failed to write the run into the database, nothing was committed.")
+            raise Exception("DB insertion failed. Aborting pipeline.")
 
 
         print("\033[4m" + "--Running Google Sheets functions..." + "\033[0m\n\n")
-        #-- Update videos sheet
+        #-- Update videos sheet (before caching: the sheet skips IDs that are already in Redis)
         update_videos_sheet(new_videos)
         #-- Update trending snapshots sheet
-        update_trending_sheet(videos)
+        update_trending_sheet(snapshots)
+
+
+        ##-- Update Redis cache, the live leaderboards and distinct counters (one pipeline)
+        print("\n=== Updating Redis cache ===\n")
+        # cache videos
+        cache_video_ids_idempotent(videos=videos, ttl_hours=24, queue_extra=queue_live_stats)
 
         print("\n\n\033[1;32mPipeline completed successfully!\033[0m\n")
         return {"status": "success"}
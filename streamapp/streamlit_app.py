@@ -2,16 +2,23 @@ import streamlit as st
 import boto3
 import pandas as pd
 import re
+import html
 import psycopg2
 import plotly.express as px
 from dotenv import load_dotenv
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
-from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 import os
+import sys
 load_dotenv()
 
+# Shared helpers (connection pool) live in the repo root next to the pipeline
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import pooled_connection, search_videos, current_week_start
+from leaderboards import get_leaderboard
+from yt_hll import count_distinct, count_distinct_by_scope, week_window, month_window
+
 st.set_page_config(layout="wide", page_title="YouTube Trending Dashboard - Nail Claros", page_icon="📊")
 
 if "selected_video" not in st.session_state:
@@ -20,17 +27,11 @@ if "last_data_hash" not in st.session_state:
     st.session_state.last_data_hash = None
 
 def get_db_connection():
-    """Connect to database."""
-    if os.getenv("ENV", "prod") == "test":
-        return psycopg2.connect(
-            host=os.getenv("POSTGRES_HOST"),
-            port=os.getenv("POSTGRES_PORT"),
-            database=os.getenv("POSTGRES_DB"),
-            user=os.getenv("POSTGRES_USER"),
-            password=os.getenv("POSTGRES_PASSWORD")
-        )
-    else:
-        return psycopg2.connect(os.getenv("DB_URL"))
+    """
+    Borrow a connection from the shared pool in db.py (reused across reruns and sessions).
+    Use as `with get_db_connection() as conn:`, the connection goes back to the pool afterwards.
+    """
+    return pooled_connection(os.getenv("ENV", "prod"))
 
 
 # -------- Helper functions -------- #
@@ -67,14 +68,14 @@ def get_top_videos_from_db(limit=10):
     """Fetch latest trending videos from your database."""
     if os.getenv("ENV", "test") == "test":
         query = """
-        SELECT video_id, title, channel_title, thumbnail_link, category_id, tags
+        SELECT video_id, title, channel_title, thumbnail_link, category_id, tags, tag_list
         FROM aq_test_local.youtube_videos_p 
         ORDER BY recorded_at DESC
         LIMIT %s;
         """
     else:
         query = """
-        SELECT video_id, title, channel_title, thumbnail_link, category_id, tags
+        SELECT video_id, title, channel_title, thumbnail_link, category_id, tags, tag_list
         FROM yt_data.youtube_videos_p 
         ORDER BY recorded_at DESC
         LIMIT %s;
@@ -86,13 +87,11 @@ def get_top_videos_from_db(limit=10):
 def get_top_channels_from_db(min_videos: int = 2):
     """
     Return channels with more than `min_videos` currently trending this week.
-    Looks at the youtube_videos_p table and counts how many times
-    each channel appears between this Monday and next Monday.
+    Reads the weekly channel counts the pipeline keeps in dash_channel_weekly
+    (videos first seen between this Monday and next Monday).
     """
 
-    today = datetime.now().date()
-    monday = today - timedelta(days=today.weekday())
-    next_monday = monday + timedelta(days=7)
+    monday = current_week_start()
 
     if os.getenv("ENV", "prod") == "test":
         schema = "aq_test_local"
@@ -100,17 +99,68 @@ def get_top_channels_from_db(min_videos: int = 2):
         schema = "yt_data"
 
     query = f"""
-        SELECT channel_title, COUNT(*) AS video_count
-        FROM {schema}.youtube_videos_p
-        WHERE DATE(recorded_at) >= '{monday}'
-          AND DATE(recorded_at) < '{next_monday}'
-        GROUP BY channel_title
-        HAVING COUNT(*) > {min_videos}
+        SELECT channel_title, video_count
+        FROM {schema}.dash_channel_weekly
+        WHERE week_start = %s
+          AND video_count > %s
         ORDER BY video_count DESC;
     """
 
     with get_db_connection() as conn:
-        return pd.read_sql(query, conn)
+        return pd.read_sql(query, conn, params=(monday, min_videos))
+
+@st.cache_data(ttl=600)
+def search_videos_from_db(query: str, page: int = 1, page_size: int = 10) -> pd.DataFrame:
+    """Full text search of titles and channels over the whole history (ranked, paginated)."""
+    rows = search_videos(query, limit=page_size, offset=(page - 1) * page_size, env=os.getenv("ENV", "prod"))
+    return pd.DataFrame(rows or [])
+
+@st.cache_data(ttl=300)
+def get_top_videos_from_redis(metric: str = "views", n: int = 10) -> pd.DataFrame:
+    """
+    Top `n` videos of the latest pipeline run by `metric`, from the Redis leaderboards
+    (one ZREVRANGE), with views / engagement_rate / view_velocity. Empty if Redis has none.
+    """
+    return pd.DataFrame(get_leaderboard(metric, n=n, env=os.getenv("ENV", "prod")))
+
+@st.cache_data(ttl=600)
+def get_distinct_counts() -> dict:
+    """
+    Approximate distinct videos / channels / tags this week and month from the Redis
+    HyperLogLogs (yt_hll), plus distinct videos per category this month. None if Redis is unavailable.
+    """
+    env = os.getenv("ENV", "prod")
+    week, month = week_window(), month_window()
+    return {
+        "videos_week": count_distinct("videos", start=week[0], end=week[1], env=env),
+        "videos_month": count_distinct("videos", start=month[0], end=month[1], env=env),
+        "channels_week": count_distinct("channels", start=week[0], end=week[1], env=env),
+        "tags_month": count_distinct("tags", start=month[0], end=month[1], env=env),
+        "videos_by_category_month": count_distinct_by_scope("videos", start=month[0], end=month[1], env=env),
+    }
+
+@st.cache_data(ttl=1800)
+def get_trending_hours_from_db() -> pd.Series:
+    """
+    Return the number of hours each video has trended this week (video_id -> hours),
+    from the dash_video_trending_hours aggregate the pipeline updates every run.
+    """
+    monday = current_week_start()
+
+    if os.getenv("ENV", "prod") == "test":
+        schema = "aq_test_local"
+    else:
+        schema = "yt_data"
+
+    query = f"""
+        SELECT video_id, trending_hours
+        FROM {schema}.dash_video_trending_hours
+        WHERE week_start = %s;
+    """
+
+    with get_db_connection() as conn:
+        df = pd.read_sql(query, conn, params=(monday,))
+    return df.set_index("video_id")["trending_hours"]
     
 
 def parse_tags(tags_str: str) -> list:
@@ -140,15 +190,15 @@ from collections import Counter
 def get_top_tags(top_videos_df: pd.DataFrame) -> pd.DataFrame:
     """
     Aggregate tags from top videos and count frequency.
+    Uses the normalized tag_list column (already a list per video, no parsing needed).
     Returns a dataframe with columns: 'tag', 'count'
     """
-    all_tags = []
-    for _, row in top_videos_df.iterrows():
-        if "tags" in row and row["tags"]:
-            tags = parse_tags(row["tags"])
-            all_tags.extend(tags)
-    
-    tag_counts = Counter(all_tags)
+    tag_counts = Counter(
+        tag
+        for tags in top_videos_df["tag_list"]
+        if isinstance(tags, list)
+        for tag in tags
+    )
     
     tag_counts = {tag: count for tag, count in tag_counts.items() if count > 1}
     
@@ -200,21 +250,32 @@ try:
     with col1:
         sort_display = st.selectbox(
         "Sort Top 10 by:",
-        options=["Views", "Engagement Rate"],
+        options=["Views", "Engagement Rate", "View Velocity"],
         index=0,
-        help="Choose how to rank trending videos"
+        help="Choose how to rank trending videos (view velocity: views gained per hour since the previous run)"
         )
 
         sort_column_map = {
         "Views": "views",
-        "Engagement Rate": "engagement_rate"
+        "Engagement Rate": "engagement_rate",
+        "View Velocity": "view_velocity"
         }
 
         sort_column = sort_column_map[sort_display]
-        # Here we merge video metadata with trending stats for the last 10 videos
-        merged_df = pd.merge(video_meta_df, last_10_df, on="video_id", how="inner")
-        merged_df = merged_df.drop(["category_id"], axis=1)
-        merged_df = merged_df.sort_values(["recorded_at", sort_column], ascending=[False, False]).drop_duplicates().head(10)
+        # Live leaderboard kept in Redis by the pipeline, already ranked
+        top_board_df = get_top_videos_from_redis(sort_column, n=10)
+        if not top_board_df.empty:
+            # left merge keeps the leaderboard order
+            merged_df = pd.merge(top_board_df, video_meta_df, on="video_id", how="left")
+            merged_df["category_name"] = merged_df["category_id"].astype(str).map(get_category_mapping())
+            merged_df = merged_df.drop(["category_id"], axis=1)
+        else:
+            # No leaderboard (Redis unavailable): rank the last 10 videos of the week's data
+            if sort_column not in last_10_df.columns:
+                sort_column = "views"
+            merged_df = pd.merge(video_meta_df, last_10_df, on="video_id", how="inner")
+            merged_df = merged_df.drop(["category_id"], axis=1)
+            merged_df = merged_df.sort_values(["recorded_at", sort_column], ascending=[False, False]).drop_duplicates().head(10)
 
         st.subheader("🔥 Top 10 Trending Videos Right Now")
 
@@ -277,7 +338,9 @@ try:
             )
 
         st.subheader("🔥This weeks longest trending video and category insights")
-        trending_counts = trending_df.groupby("video_id")["recorded_at"].nunique()
+        trending_counts = get_trending_hours_from_db()
+        # only videos we have metadata for in this week's export
+        trending_counts = trending_counts[trending_counts.index.isin(long_data["video_id"])]
 
         # Find the maximum number of trending days
         max_trending_h = trending_counts.max()
@@ -782,5 +845,65 @@ try:
 
     st.markdown(html_legend, unsafe_allow_html=True)
 
+
+    # --- Distinct counts over longer windows (approximate, from Redis) ---
+    distinct = get_distinct_counts()
+    if distinct["videos_month"] is not None:
+        st.subheader("🧮 Distinct Trending (approx.)")
+        d1, d2, d3, d4 = st.columns(4)
+        d1.metric("Videos this week", f"{distinct['videos_week']:,}")
+        d2.metric("Videos this month", f"{distinct['videos_month']:,}")
+        d3.metric("Channels this week", f"{distinct['channels_week']:,}")
+        d4.metric("Tags this month", f"{distinct['tags_month']:,}")
+
+        if distinct["videos_by_category_month"]:
+            category_names = get_category_mapping()
+            by_category = pd.DataFrame(
+                [(category_names.get(str(c), str(c)), n) for c, n in distinct["videos_by_category_month"].items()],
+                columns=["category_name", "videos"]
+            ).sort_values("videos", ascending=False)
+            fig_distinct = px.bar(by_category, x="category_name", y="videos",
+                                  title="Distinct videos per category this month")
+            fig_distinct.update_layout(showlegend=False, xaxis_title=None, yaxis_title=None,
+                                       margin=dict(l=20, r=20, t=40, b=20))
+            st.plotly_chart(fig_distinct, width="stretch", config={"displayModeBar": False})
+
+
+    # --- Search across all trending history ---
+    st.subheader("🔎 Search trending history")
+    search_col, page_col = st.columns([5, 1])
+    with search_col:
+        search_query = st.text_input("Title or channel", placeholder='e.g. "world cup" -highlights')
+    with page_col:
+        search_page = st.number_input("Page", min_value=1, value=1, step=1)
+
+    if search_query:
+        results_df = search_videos_from_db(search_query, page=int(search_page))
+        if results_df.empty:
+            st.info("No trending videos match this search.")
+        else:
+            for _, row in results_df.iterrows():
+                # titles and channel names come from the API as free text, escape them before rendering as HTML
+                youtube_link = html.escape(f"https://www.youtube.com/watch?v={row['video_id']}")
+                title = html.escape(str(row['title']))
+                channel_title = html.escape(str(row['channel_title']))
+                thumbnail_link = html.escape(str(row['thumbnail_link'] or ""))
+                st.markdown(
+                    f"""
+                    <div style='display:flex; align-items:center; margin-bottom:6px;'>
+                        <a href="{youtube_link}" target="_blank">
+                            <img src="{thumbnail_link}" width="60" style="border-radius:4px; margin-right:8px;">
+                        </a>
+                        <div style='line-height:1.2;'>
+                            <a href="{youtube_link}" target="_blank" style='text-decoration:none; color:white; font-weight:bold;'>
+                                {title}
+                            </a><br>
+                            <small style='color:#cccccc'>{channel_title} | first trending {row['recorded_at']}</small>
+                        </div>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+
 except Exception as e:
     st.error(f"Failed to load data: {e}")
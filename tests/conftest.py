@@ -167,6 +167,16 @@ def delete_prefix_keys(redis_test_client, prefix="ptest"):
         redis_test_client.delete(*keys)
 
 
+@pytest.fixture(autouse=True)
+def isolated_yt_api_state(tmp_path, monkeypatch):
+    """Keeps each test's YouTube quota spend in tmp_path and its API responses in memory, never under ~/.cache."""
+    import ty_api
+    from yt_quota import QuotaLimiter
+
+    monkeypatch.setattr("yt_quota._limiter", QuotaLimiter(max_qps=0, state_path=str(tmp_path / "quota.json")))
+    monkeypatch.setattr(ty_api, "_response_cache", ty_api.ResponseCache(path=None))
+
+
 import json
 import gspread
 from google.oauth2.service_account import Credentials
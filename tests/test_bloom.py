@@ -0,0 +1,140 @@
+from bloom import BloomFilter, optimal_size
+
+
+def test_no_false_negatives_and_low_false_positives():
+    """Test every added ID is found and unseen IDs rarely are."""
+    bloom = BloomFilter.for_capacity(10_000, 0.01)
+    ids = [f"vid{i:06d}" for i in range(10_000)]
+    added = bloom.update(ids)
+    # an ID whose bits were all set already (a false positive) doesn't count as added
+    assert added > 9_900
+    assert all(vid in bloom for vid in ids)
+    false_positives = sum(1 for i in range(10_000) if f"other{i:06d}" in bloom)
+    assert false_positives < 300
+    assert not bloom.add("vid000001")
+    assert len(bloom) == added
+
+
+def test_memory_mapped_file_round_trip(tmp_path):
+    """Test a filter file created, updated through mmap and reopened keeps its IDs."""
+    path = str(tmp_path / "seen.bloom")
+    bloom = BloomFilter.open(path, capacity=1000, error_rate=0.001)
+    assert (bloom.num_bits, bloom.num_hashes) == optimal_size(1000, 0.001)
+    bloom.update(["abc", "def"])
+    bloom.close()
+
+    reopened = BloomFilter.open(path)
+    assert "abc" in reopened and "def" in reopened
+    assert "xyz" not in reopened
+    assert len(reopened) == 2
+
+    copy = BloomFilter.from_bytes(reopened.to_bytes())
+    assert "abc" in copy and len(copy) == 2
+    reopened.synced_at = 1700000000.5
+    assert BloomFilter.from_bytes(reopened.to_bytes()).synced_at == 1700000000.5
+    reopened.close()
+
+
+class StubCursor:
+    """Answers video_id = ANY(%s) lookups from `stored`, and iter_video_ids listings from `stored`."""
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.params = None
+        self.listings = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.params = params
+        if "ANY" not in sql:
+            self.listings.append(params)
+            self.rows = [(vid,) for vid in self.stored]
+
+    def fetchall(self):
+        return [(vid,) for vid in self.params[0] if vid in self.stored]
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class StubConn:
+    def __init__(self, stored=()):
+        self.cur = StubCursor(list(stored))
+
+    def cursor(self, name=None):
+        return self.cur
+
+    def rollback(self):
+        pass
+
+
+class NoLookups:
+    def __getattr__(self, name):
+        raise AssertionError(f"unexpected lookup: {name}")
+
+
+class NoRedisCopy:
+    def get(self, key):
+        return None
+
+
+def test_unseen_ids_need_no_lookup():
+    """Test IDs the filter never saw are new without asking Redis or Postgres."""
+    from dedup import find_new_videos
+
+    bloom = BloomFilter.for_capacity(100, 0.001)
+    videos = [{"video_id": "fresh_1"}, {"video_id": "fresh_2"}, {"video_id": "fresh_1"}]
+    result = find_new_videos(videos, redis_client=NoLookups(), conn=NoLookups(), schema="yt_data",
+                             seen_filter=bloom)
+    assert [v["video_id"] for v in result["new"]] == ["fresh_1", "fresh_2"]
+    assert result["unseen"] == 2 and result["error"] is None
+
+
+def test_seen_filter_catches_up_with_postgres(tmp_path):
+    """Test a filter built once is caught up from recorded_at on the next load, with the writes it missed."""
+    from dedup import load_seen_filter, SEEN_FILTER_SYNC_DAYS
+    from datetime import datetime, timedelta, timezone
+
+    path = str(tmp_path / "seen.bloom")
+    conn = StubConn(["stored_1"])
+    bloom = load_seen_filter(env="prod", path=path, redis_client=NoRedisCopy(), conn=conn, capacity=100)
+    assert "stored_1" in bloom and "stored_2" not in bloom
+    # full listing for the build, then the catch-up from the build's day
+    synced_day = datetime.fromtimestamp(bloom.synced_at, timezone.utc).date()
+    assert conn.cur.listings == [None, (synced_day - timedelta(days=SEEN_FILTER_SYNC_DAYS),)]
+    bloom.close()
+
+    # another host stored stored_2 after this file was synced
+    conn = StubConn(["stored_1", "stored_2"])
+    bloom = load_seen_filter(env="prod", path=path, redis_client=NoLookups(), conn=conn, capacity=100)
+    assert "stored_2" in bloom
+    assert len(conn.cur.listings) == 1, "Expected only the catch-up listing for an existing file"
+    bloom.close()
+
+
+def test_csv_filter_confirms_positives(tmp_path):
+    """Test the CSV's sidecar filter is built from the file, kept in sync by its appends and rebuilt after others."""
+    import csv
+    from writers import update_videos_csv, _open_csv_filter
+
+    path = str(tmp_path / "videos.csv")
+    update_videos_csv([{"video_id": "a", "title": "A"}], file_path=path)
+    update_videos_csv([{"video_id": "a", "title": "A"}, {"video_id": "b", "title": "B"}], file_path=path,
+                      use_filter=True)
+    update_videos_csv([{"video_id": "b", "title": "B"}, {"video_id": "c", "title": "C"}], file_path=path,
+                      use_filter=True)
+    with open(path, newline="", encoding="utf-8") as f:
+        assert [row["video_id"] for row in csv.DictReader(f)] == ["a", "b", "c"]
+
+    # appended without the filter: the file size no longer matches, so the filter is rebuilt from it
+    update_videos_csv([{"video_id": "d", "title": "D"}], file_path=path)
+    csv_filter = _open_csv_filter(path)
+    assert all(vid in csv_filter for vid in "abcd")
+    csv_filter.close()
@@ -0,0 +1,180 @@
+from db import add_videos_bulk, add_trending_snapshots_bulk, write_pipeline_run, _copy_value, _copy_rows, \
+    refresh_dashboard_aggregates, current_week_start
+from types import SimpleNamespace
+
+
+class StubCursor:
+    """
+    Cursor answering INSERT ... ON CONFLICT DO NOTHING like Postgres, against the keys in
+    `existing` (video_id for videos, (video_id, recorded_at) for snapshots).
+    execute_values pages arrive as one mogrified statement each; COPYed rows are kept per
+    staging table and merged by the INSERT ... SELECT reading from it.
+    """
+
+    def __init__(self, existing=(), fail=False):
+        self.connection = SimpleNamespace(encoding="UTF8")
+        self.existing = set(existing)
+        self.fail = fail
+        self.page = []
+        self.returned = []
+        self.rowcount = -1
+        self.statements = 0
+        self.staged = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, template, args):
+        self.page.append(list(args))
+        return b"(row)"
+
+    def _insert(self, rows, snapshots):
+        inserted = []
+        for row in rows:
+            key = (row[0], row[5]) if snapshots else row[0]
+            if key in self.existing:
+                continue
+            self.existing.add(key)
+            inserted.append((row[0],))
+        return inserted
+
+    def execute(self, sql, params=None):
+        if self.fail:
+            raise RuntimeError("connection lost")
+        self.statements += 1
+        if isinstance(sql, str):
+            # staging tables are created empty, the merges read what was COPYed into them
+            if sql.lstrip().startswith("INSERT"):
+                table = "_stage_snapshots" if "FROM _stage_snapshots" in sql else "_stage_videos"
+                self.rowcount = len(self._insert(self.staged.get(table, []), table == "_stage_snapshots"))
+            return
+        rows, self.page = self.page, []
+        self.returned = self._insert(rows, b"youtube_trending_history_p" in sql)
+        self.rowcount = len(self.returned)
+
+    def copy_expert(self, sql, buffer):
+        table = sql.split()[1]
+        self.staged[table] = [line.split("\t") for line in buffer.read().split("\n") if line]
+
+    def fetchall(self):
+        return self.returned
+
+
+class StubConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def _video(video_id, recorded_at="2025-01-01 00:00:00 UTC"):
+    return {"video_id": video_id, "title": f"Video {video_id}", "channel_title": "Chan", "category_id": 10,
+            "publish_date": "2025-01-01", "tags": ["a", "b"], "views": 10, "likes": 1, "comment_count": 0,
+            "thumbnail_link": "", "recorded_at": recorded_at}
+
+
+def test_add_videos_bulk_counts():
+    """Test videos already stored are counted as skipped, over several pages."""
+    cursor = StubCursor(existing={"vid_1"})
+    conn = StubConn(cursor)
+    result = add_videos_bulk([_video("vid_1"), _video("vid_2"), _video("vid_3")], conn=conn, schema="yt_data",
+                             env="prod", page_size=2)
+    assert result == {"inserted": 2, "skipped": 1, "error": None}
+    assert cursor.statements == 2, "Expected one statement per page"
+    assert conn.committed
+
+
+def test_add_trending_snapshots_bulk_counts():
+    """Test snapshots are skipped per (video_id, recorded_at), also within one batch."""
+    cursor = StubCursor(existing={("vid_1", "t1")})
+    conn = StubConn(cursor)
+    snapshots = [_video("vid_1", "t1"), _video("vid_1", "t2"), _video("vid_2", "t1"), _video("vid_2", "t1")]
+    result = add_trending_snapshots_bulk(snapshots, conn=conn, schema="yt_data", env="prod")
+    assert result == {"inserted": 2, "skipped": 2, "error": None}
+
+
+def test_bulk_insert_error_rolls_back():
+    """Test a failed bulk insert reports the error, counts nothing and rolls the caller's connection back."""
+    conn = StubConn(StubCursor(fail=True))
+    result = add_videos_bulk([_video("vid_1")], conn=conn, schema="yt_data", env="prod")
+    assert result["inserted"] == 0 and result["skipped"] == 0
+    assert "connection lost" in result["error"]
+    assert conn.rolled_back and not conn.committed
+
+
+def test_bulk_insert_nothing_to_write():
+    """Test empty batches don't send anything."""
+    cursor = StubCursor()
+    assert add_videos_bulk([], conn=StubConn(cursor), schema="yt_data", env="prod") == \
+        {"inserted": 0, "skipped": 0, "error": None}
+    assert add_trending_snapshots_bulk([], conn=StubConn(cursor), schema="yt_data", env="prod")["inserted"] == 0
+    assert cursor.statements == 0
+
+
+def test_copy_value_escaping():
+    """Test values are escaped for COPY text format, and lists become text[] literals."""
+    assert _copy_value(None) == "\\N"
+    assert _copy_value(42) == "42"
+    assert _copy_value("tab\there") == "tab\\there"
+    assert _copy_value("two\nlines\r") == "two\\nlines\\r"
+    assert _copy_value("back\\slash") == "back\\\\slash"
+    assert _copy_value([]) == "{}"
+    # array elements are quoted with their own escaping, then escaped again for COPY
+    assert _copy_value(["a b", 'say "hi"']) == '{"a b","say \\\\"hi\\\\""}'
+    assert _copy_value(["c:\\dir", "x\ty"]) == '{"c:\\\\\\\\dir","x\\ty"}'
+
+
+def test_copy_rows_one_line_per_row():
+    """Test tabs and newlines inside values don't split rows or columns."""
+    cursor = StubCursor()
+    _copy_rows(cursor, "_stage_snapshots", ("video_id", "title"), [["vid_1", "a\tb\nc"], ["vid_2", None]])
+    assert cursor.staged["_stage_snapshots"] == [["vid_1", "a\\tb\\nc"], ["vid_2", "\\N"]]
+
+
+def test_write_pipeline_run_counts():
+    """Test a run's videos and snapshots are counted per table, duplicates in the run included."""
+    cursor = StubCursor(existing={"vid_1", ("vid_1", "t1")})
+    conn = StubConn(cursor)
+    videos = [_video("vid_1"), _video("vid_2"), _video("vid_2")]
+    snapshots = [_video("vid_1", "t1"), _video("vid_1", "t2"), _video("vid_2", "t2")]
+    result = write_pipeline_run(videos, snapshots, conn=conn, schema="yt_data", env="prod")
+    assert result == {"videos": {"inserted": 1, "skipped": 2}, "snapshots": {"inserted": 2, "skipped": 1},
+                      "error": None}
+    assert conn.committed
+
+
+def test_write_pipeline_run_error_rolls_back():
+    """Test nothing is counted and the transaction is rolled back when a statement fails."""
+    conn = StubConn(StubCursor(fail=True))
+    result = write_pipeline_run([_video("vid_1")], [_video("vid_1", "t1")], conn=conn, schema="yt_data", env="prod")
+    assert result["videos"] == {"inserted": 0, "skipped": 0}
+    assert result["snapshots"] == {"inserted": 0, "skipped": 0}
+    assert "connection lost" in result["error"]
+    assert conn.rolled_back and not conn.committed
+
+
+def test_dashboard_aggregates_share_one_week():
+    """Test the trending hours, channel and category refreshes all get the week_start computed in Python."""
+    cursor = StubCursor()
+    conn = StubConn(cursor)
+    params = []
+    cursor.execute = lambda sql, args=None: params.append(args)
+    video = dict(_video("vid_1", "2025-01-05 23:30:00 UTC"), channel_title="Chan")
+    result = refresh_dashboard_aggregates([video], conn=conn, schema="yt_data", env="prod")
+    assert result["error"] is None
+    week = current_week_start()
+    assert week.weekday() == 0
+    assert cursor.page == [[week, "vid_1", video["recorded_at"], video["recorded_at"], 10, 1, 0]]
+    assert params[1][0] == week and params[2][0] == week
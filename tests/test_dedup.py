@@ -0,0 +1,46 @@
+from dedup import find_new_videos
+from g_sheets import cache_video_ids_idempotent, get_existing_keys_cached
+import pytest
+
+test_videos = [
+    {"video_id": "dedup_vid_1", "title": "Dedup Video 1", "channel_title": "Test Channel"},
+    {"video_id": "dedup_vid_2", "title": "Dedup Video 2", "channel_title": "Test Channel"},
+    {"video_id": "dedup_vid_1", "title": "Dedup Video 1", "channel_title": "Test Channel"},
+]
+
+# not cached by the test above (the Redis test client is shared by the session)
+uncached_videos = [
+    {"video_id": "dedup_vid_3", "title": "Dedup Video 3", "channel_title": "Test Channel"},
+    {"video_id": "dedup_vid_4", "title": "Dedup Video 4", "channel_title": "Test Channel"},
+    {"video_id": "dedup_vid_3", "title": "Dedup Video 3", "channel_title": "Test Channel"},
+]
+
+
+class FailingConn:
+    """Connection whose queries always fail, to check the Postgres fallback."""
+    def cursor(self, *args, **kwargs):
+        raise Exception("Postgres unavailable")
+    def rollback(self): pass
+
+
+@pytest.mark.parametrize("videos", [test_videos])
+def test_all_cached_skips_postgres(videos, redis_test_client):
+    """Test a batch fully answered by Redis has no new videos and never queries Postgres."""
+    cache_video_ids_idempotent(videos, redis_client=redis_test_client, prefix="ptest")
+    result = find_new_videos(videos, redis_client=redis_test_client, conn=FailingConn(), prefix="ptest")
+    assert result["new"] == []
+    assert result["cached"] == {"dedup_vid_1", "dedup_vid_2"}
+    assert result["error"] is None
+
+
+@pytest.mark.parametrize("videos", [uncached_videos])
+def test_misses_are_new_when_postgres_fails(videos, redis_test_client):
+    """Test Redis misses are reported as new (once each, in order) when the Postgres lookup fails."""
+    cache_video_ids_idempotent(videos[1:2], redis_client=redis_test_client, prefix="ptest")
+    result = find_new_videos(videos, redis_client=redis_test_client, conn=FailingConn(), prefix="ptest")
+    assert [v["video_id"] for v in result["new"]] == ["dedup_vid_3"]
+    assert result["error"] is not None
+    # nothing was found in Postgres, so nothing new was backfilled
+    ids = get_existing_keys_cached(key_fields=["video_id"], redis_client=redis_test_client, prefix="ptest",
+                                   ids=["dedup_vid_3", "dedup_vid_4"])[0]
+    assert ids == {"dedup_vid_4"}
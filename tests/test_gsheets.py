@@ -98,3 +98,24 @@ def test_simple_add_trending_sheet(videos, gsheet_client, read_sheet_rows):
     assert any(r["video_id"] == "test_vid_1" for r in records)
     assert any(r["video_id"] == "test_vid_2" for r in records)
 
+
+def test_sheet_marking_creates_no_cache_keys(redis_test_client):
+    """Test videos written to the sheet without a cache entry get no cache key or index entry."""
+    video = dict(test_videos[0], video_id="test_vid_uncached")
+    added_count = update_videos_sheet([video], sheet_name="tester-vids", redis_client=redis_test_client,
+                                      prefix="ptest")
+    assert added_count == 1
+    assert not redis_test_client.exists("ptest:test_vid_uncached")
+    assert redis_test_client.zscore("ptest:__idx__", "test_vid_uncached") is None
+    assert update_videos_sheet([video], sheet_name="tester-vids", redis_client=redis_test_client,
+                               prefix="ptest") == 0
+
+
+def test_sheet_index_uses_shared_client(redis_test_client, monkeypatch):
+    """Test appended IDs are recorded (with a TTL) when the caller passes no Redis client."""
+    monkeypatch.setattr("g_sheets.get_redis_client", lambda *args, **kwargs: redis_test_client)
+    video = dict(test_videos[0], video_id="test_vid_shared_client")
+    assert update_videos_sheet([video], sheet_name="tester-vids", prefix="ptest") == 1
+    assert redis_test_client.zscore("ptest:__sheet__", "test_vid_shared_client") is not None
+    assert redis_test_client.ttl("ptest:__sheet__") > 0
+    assert update_videos_sheet([video], sheet_name="tester-vids", prefix="ptest") == 0
@@ -0,0 +1,37 @@
+from leaderboards import leaderboard_scores, queue_leaderboard_updates, get_top_videos, get_leaderboard
+from g_sheets import cache_video_ids_idempotent
+
+test_videos = [
+    {"video_id": "lb_vid_1", "views": 1000, "likes": 100, "comment_count": 10, "region": "US"},
+    {"video_id": "lb_vid_2", "views": 5000, "likes": 50, "comment_count": 0, "region": "GB"},
+    {"video_id": "lb_vid_3", "views": 3000, "likes": 600, "comment_count": 0, "region": "US"},
+]
+
+
+def test_leaderboard_scores():
+    """Test per region and ALL boards, engagement rate and velocity from the previous run."""
+    previous = {"lb_vid_1": (400, 0.0)}
+    boards = leaderboard_scores(test_videos, previous, now=7200.0)
+    assert boards[("US", "views")] == {"lb_vid_1": 1000, "lb_vid_3": 3000}
+    assert boards[("ALL", "views")]["lb_vid_2"] == 5000
+    assert boards[("US", "engagement_rate")]["lb_vid_1"] == 11.0
+    # 600 views in two hours, videos without a previous run have no velocity
+    assert boards[("ALL", "view_velocity")] == {"lb_vid_1": 300.0}
+
+
+def test_leaderboards_written_with_cache(redis_test_client):
+    """Test the boards are written in the cache pipeline and read back ranked."""
+    try:
+        cache_video_ids_idempotent(test_videos, prefix="ptest", redis_client=redis_test_client,
+                                   queue_extra=lambda pipe: queue_leaderboard_updates(
+                                       pipe, test_videos, env="ptest", redis_client=redis_test_client))
+        top = get_top_videos("views", n=2, env="ptest", redis_client=redis_test_client)
+        assert [vid for vid, _ in top] == ["lb_vid_2", "lb_vid_3"]
+        assert get_top_videos("views", region="US", env="ptest", redis_client=redis_test_client)[0][0] == "lb_vid_3"
+
+        rows = get_leaderboard("engagement_rate", n=1, env="ptest", redis_client=redis_test_client)
+        assert rows == [{"video_id": "lb_vid_3", "engagement_rate": 20.0, "views": 3000.0, "view_velocity": None}]
+    finally:
+        keys = redis_test_client.keys("lb:ptest:*")
+        if keys:
+            redis_test_client.delete(*keys)
@@ -0,0 +1,29 @@
+from pg_export import add_engagement_rate, write_week_parquet, WEEK_SCHEMA
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+def test_engagement_rate_matches_spark():
+    """Test engagement_rate is rounded half up and 0 without views, like the Spark job."""
+    table = pa.table({
+        "views": pa.array([200, 0, None, 8], pa.int64()),
+        "likes": pa.array([1, 5, 1, 1], pa.int64()),
+        "comment_count": pa.array([0, 1, 1, 0], pa.int64()),
+    })
+    rates = add_engagement_rate(table)["engagement_rate"].to_pylist()
+    assert rates == [0.5, 0.0, 0.0, 12.5]
+
+def test_write_week_parquet(tmp_path):
+    """Test batches are written as row groups of one file in the Spark layout schema."""
+    batch = add_engagement_rate(pa.table({
+        "video_id": ["a", "b"], "id": pa.array([1, 2], pa.int32()),
+        "publish_date": pa.array([None, None], pa.date32()),
+        "views": pa.array([10, 20], pa.int64()), "likes": pa.array([1, 2], pa.int64()),
+        "comment_count": pa.array([0, 0], pa.int64()),
+        "recorded_at": pa.array([None, None], pa.timestamp("us", tz="UTC")),
+        "category_name": ["Music", None],
+    }))
+    path = tmp_path / "part-00000.snappy.parquet"
+    assert write_week_parquet([batch, batch], str(path)) == 4
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.schema_arrow == WEEK_SCHEMA
@@ -1,4 +1,4 @@
-from g_sheets import cache_video_ids_idempotent, get_existing_keys_cached
+from g_sheets import cache_video_ids_idempotent, get_existing_keys_cached, rebuild_video_id_index
 import pytest
 
 test_videos = [
@@ -57,4 +57,21 @@ def test_simple_cache_video_ids_idempotent(videos, redis_test_client):
     cached_ids_after = get_existing_keys_cached(key_fields=["video_id"], redis_client=redis_test_client, prefix="ptest")[0]
     assert len(cached_ids_after) == 2
     assert "test_vid_1" in cached_ids_after
-    assert "test_vid_2" in cached_ids_after
\ No newline at end of file
+    assert "test_vid_2" in cached_ids_after
+
+@pytest.mark.parametrize("videos", [test_videos])
+def test_existing_keys_for_batch(videos, redis_test_client):
+    """Test membership of a batch of IDs is answered from the index."""
+    cache_video_ids_idempotent(videos[:1], redis_client=redis_test_client, prefix="ptest")
+    ids = get_existing_keys_cached(key_fields=["video_id"], redis_client=redis_test_client, prefix="ptest",
+                                   ids=["test_vid_1", "test_vid_2"])[0]
+    assert ids == {"test_vid_1"}
+
+def test_rebuild_video_id_index(redis_test_client):
+    """Test keys cached before the index existed are found after a rebuild."""
+    redis_test_client.hset("ptest:legacy_vid", "video_id", "legacy_vid")
+    redis_test_client.expire("ptest:legacy_vid", 3600)
+    assert rebuild_video_id_index(prefix="ptest", redis_client=redis_test_client) == 1
+    ids = get_existing_keys_cached(key_fields=["video_id"], redis_client=redis_test_client, prefix="ptest",
+                                   ids=["legacy_vid"])[0]
+    assert ids == {"legacy_vid"}
@@ -1,5 +1,12 @@
-from ty_api import run_yt_api
+from ty_api import run_yt_api, run_yt_api_regions, iter_yt_api, get_youtube_service, FileDiscoveryCache, \
+    ResponseCache, enrich_video_details, _prefetch_pages
+from yt_records import VideoSnapshot
+from yt_quota import get_quota_limiter, QuotaExceededError
+from yt_replay import SyntheticHttp, _json_response
+from googleapiclient.http import HttpMockSequence
+import json
 import os
+import time
 
 def test_succesful_run_yt_api():
     """Test the run_yt_api function to ensure it fetches data correctly."""
@@ -37,4 +44,222 @@ def test_run_yt_api_negative_size():
     videos = run_yt_api(size=-5)
     ## should return an empty list
     assert isinstance(videos, list), "Expected a list of videos"
-    assert len(videos) == 0, "Expected no videos to be fetched when size is negative"
\ No newline at end of file
+    assert len(videos) == 0, "Expected no videos to be fetched when size is negative"
+
+def test_run_yt_api_regions():
+    """Test the multi-region fetch merges and tags records from every region."""
+    http = SyntheticHttp(n_videos=20, regions=["US", "GB", "CA"], latency_ms=0)
+    videos = run_yt_api_regions(yt_key="FAKE_KEY", size=5, regions=["US", "GB", "CA"], dedupe=False, http=http)
+    assert isinstance(videos, list), "Expected a list of videos"
+    assert len(videos) == 15, "Expected 5 videos per region"
+    assert [v["region"] for v in videos] == ["US"] * 5 + ["GB"] * 5 + ["CA"] * 5, \
+        "Expected every record tagged with its region, in regions order"
+    assert all(v["video_id"].startswith(f"{v['region']}-") for v in videos)
+
+def test_run_yt_api_regions_dedupe():
+    """Test the multi-region fetch keeps each video only once, tagged with its first region."""
+
+    class SharedChartHttp(SyntheticHttp):
+        # every region's chart holds the US videos, like a video trending everywhere
+        def _chart_ids(self, region):
+            return super()._chart_ids("US")
+
+    http = SharedChartHttp(n_videos=20, regions=["US", "GB", "CA"], latency_ms=0)
+    videos = run_yt_api_regions(yt_key="FAKE_KEY", size=5, regions=["GB", "US", "CA"], http=http)
+    ids = [v["video_id"] for v in videos]
+    assert len(ids) == 5, "Expected no duplicate video IDs across regions"
+    assert len(ids) == len(set(ids))
+    assert {v["region"] for v in videos} == {"GB"}, "Expected the first region in regions order to be kept"
+
+    all_videos = run_yt_api_regions(yt_key="FAKE_KEY", size=5, regions=["GB", "US", "CA"], dedupe=False, http=http)
+    assert len(all_videos) == 15
+
+def test_run_yt_api_regions_empty():
+    """Test the multi-region fetch with no regions."""
+    videos = run_yt_api_regions(size=5, regions=[])
+    assert videos == [], "Expected no videos to be fetched without regions"
+
+def test_iter_yt_api_pages():
+    """Test the streaming API follows page tokens past the 50 video page limit."""
+    http = SyntheticHttp(n_videos=200, latency_ms=0)
+    pages = list(iter_yt_api(yt_key="FAKE_KEY", total=60, batches=True, http=http))
+    assert [len(p) for p in pages] == [50, 10], "Expected two pages for 60 videos"
+    assert [v["video_id"] for p in pages for v in p] == [SyntheticHttp.video_id("US", i) for i in range(60)], \
+        "Expected the chart in order, without gaps or repeats"
+    assert http.requests_served == 2
+
+def test_iter_yt_api_chart_end():
+    """Test the streaming API stops when the chart has no more pages."""
+    http = SyntheticHttp(n_videos=70, latency_ms=0)
+    videos = list(iter_yt_api(yt_key="FAKE_KEY", total=200, page_size=30, http=http))
+    assert len(videos) == 70, "Expected every video of the chart"
+    assert http.requests_served == 3
+
+def test_iter_yt_api_records():
+    """Test the streaming API yields single records by default."""
+    http = SyntheticHttp(n_videos=20, latency_ms=0)
+    videos = list(iter_yt_api(yt_key="FAKE_KEY", total=5, prefetch=0, http=http))
+    assert len(videos) == 5, "Expected 5 videos to be streamed"
+    assert all(isinstance(v, VideoSnapshot) for v in videos), "Expected VideoSnapshot records"
+
+def test_prefetch_pages_stops_when_consumer_stops():
+    """Test the prefetch thread stops and closes the page generator when the caller stops early."""
+    closed = []
+
+    def endless_pages():
+        try:
+            page = 0
+            while True:
+                yield [page]
+                page += 1
+        finally:
+            closed.append(True)
+
+    pages = _prefetch_pages(endless_pages(), prefetch=1)
+    assert next(pages) == [0]
+    pages.close()
+    for _ in range(50):
+        if closed:
+            break
+        time.sleep(0.05)
+    assert closed, "Expected the producer to close the page generator"
+
+def test_get_youtube_service_reused():
+    """Test the YouTube client is built once per key and reused."""
+    service_1 = get_youtube_service("SOME_KEY")
+    service_2 = get_youtube_service("SOME_KEY")
+    assert service_1 is service_2, "Expected the same client for the same key"
+    assert get_youtube_service("OTHER_KEY") is not service_1, "Expected a separate client per key"
+
+def test_file_discovery_cache(tmp_path):
+    """Test the discovery document cache round trips documents through disk."""
+    cache = FileDiscoveryCache(cache_dir=str(tmp_path))
+    assert cache.get("https://example.com/discovery") is None, "Expected a miss on an empty cache"
+    cache.set("https://example.com/discovery", '{"kind": "discovery#restDescription"}')
+    # a fresh instance reads what the previous run stored
+    assert FileDiscoveryCache(cache_dir=str(tmp_path)).get("https://example.com/discovery") == '{"kind": "discovery#restDescription"}'
+
+def test_file_discovery_cache_expired(tmp_path):
+    """Test expired discovery documents are treated as a miss."""
+    cache = FileDiscoveryCache(cache_dir=str(tmp_path), ttl=-1)
+    cache.set("https://example.com/discovery", "{}")
+    assert cache.get("https://example.com/discovery") is None, "Expected expired documents to be ignored"
+
+
+def _chart_response(etag, video_ids):
+    """Builds a minimal mostPopular chart body for the fake HTTP transport."""
+    return json.dumps({
+        "etag": etag,
+        "items": [
+            {
+                "id": vid,
+                "snippet": {"title": f"Video {vid}", "channelTitle": "Test Channel", "categoryId": "10",
+                            "publishedAt": "2024-01-01T00:00:00Z", "tags": ["test"], "thumbnails": {}},
+                "statistics": {"viewCount": "100", "likeCount": "10", "commentCount": "1"}
+            }
+            for vid in video_ids
+        ]
+    })
+
+def test_run_yt_api_etag_not_modified(tmp_path):
+    """Test a 304 reply is answered from the response cache."""
+    http = HttpMockSequence([
+        ({"status": "200"}, _chart_response("etag-1", ["vid_a", "vid_b"])),
+        ({"status": "304"}, ""),
+    ])
+    cache = ResponseCache(path=str(tmp_path / "responses.json"))
+
+    first = run_yt_api(yt_key="FAKE_KEY", size=2, response_cache=cache, http=http)
+    second = run_yt_api(yt_key="FAKE_KEY", size=2, response_cache=cache, http=http)
+
+    assert [v["video_id"] for v in first] == ["vid_a", "vid_b"]
+    assert [v["video_id"] for v in second] == ["vid_a", "vid_b"], "Expected cached records on a 304"
+    assert cache.get("videos.list:snippet,statistics:mostPopular:US:2")["etag"] == "etag-1"
+    # the cache survives a new process
+    assert ResponseCache(path=str(tmp_path / "responses.json")).get("videos.list:snippet,statistics:mostPopular:US:2") is not None
+
+def test_run_yt_api_etag_changed(tmp_path):
+    """Test a changed chart replaces the cached entry."""
+    http = HttpMockSequence([
+        ({"status": "200"}, _chart_response("etag-1", ["vid_a"])),
+        ({"status": "200"}, _chart_response("etag-2", ["vid_c"])),
+    ])
+    cache = ResponseCache(path=None)
+
+    run_yt_api(yt_key="FAKE_KEY", size=1, response_cache=cache, http=http)
+    videos = run_yt_api(yt_key="FAKE_KEY", size=1, response_cache=cache, http=http)
+
+    assert [v["video_id"] for v in videos] == ["vid_c"]
+    assert cache.get("videos.list:snippet,statistics:mostPopular:US:1")["etag"] == "etag-2"
+
+def test_enrich_video_details():
+    """Test enrichment looks each unique ID up once, 50 IDs per call in one batch request."""
+    http = SyntheticHttp(n_videos=120, latency_ms=0)
+    videos = [{"video_id": SyntheticHttp.video_id("US", i)} for i in range(120)]
+    # a video trending in two regions is looked up once and both records get the details
+    videos.append({"video_id": SyntheticHttp.video_id("US", 7)})
+    enrich_video_details(videos, yt_key="FAKE_KEY", http=http)
+
+    assert http.requests_served == 1, "Expected the 3 details calls to go out as one batch"
+    assert all(v["channel_id"] for v in videos), "Expected a channel_id for every video"
+    assert all(v["duration"].startswith("P") for v in videos), "Expected ISO 8601 durations"
+    assert videos[-1]["duration"] == videos[7]["duration"]
+
+    unbatched = SyntheticHttp(n_videos=120, latency_ms=0)
+    enrich_video_details([dict(v) for v in videos], yt_key="FAKE_KEY", http=unbatched, use_batch=False)
+    assert unbatched.requests_served == 3, "Expected one request per 50 unique IDs"
+
+def test_enrich_video_details_single_call():
+    """Test enrichment of one chunk issues a single plain request."""
+    http = HttpMockSequence([
+        ({"status": "200"}, json.dumps({"items": [
+            {"id": "vid_a", "snippet": {"channelId": "chan_a", "publishedAt": "2024-01-01T00:00:00Z"},
+             "contentDetails": {"duration": "PT3M20S", "definition": "hd", "caption": "false"}}
+        ]})),
+    ])
+    videos = [{"video_id": "vid_a"}, {"video_id": "vid_missing"}]
+    enrich_video_details(videos, yt_key="FAKE_KEY", http=http)
+
+    assert videos[0]["channel_id"] == "chan_a"
+    assert videos[0]["duration"] == "PT3M20S"
+    assert videos[1]["duration"] == "", "Expected empty details for videos the API did not return"
+
+class _QuotaAfterFirstCall(SyntheticHttp):
+    """Synthetic API whose daily quota runs out after the first details call."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.details_calls = 0
+
+    def answer(self, uri, headers):
+        if self.details_calls:
+            return _json_response(403, {"error": {"code": 403, "message": "quota",
+                                                  "errors": [{"reason": "quotaExceeded"}]}})
+        self.details_calls += 1
+        return super().answer(uri, headers)
+
+def test_enrich_video_details_quota_in_batch():
+    """Test a quotaExceeded reply inside a batch marks the daily quota as spent."""
+    limiter = get_quota_limiter()
+    http = _QuotaAfterFirstCall(n_videos=60)
+    videos = [{"video_id": SyntheticHttp.video_id("US", i)} for i in range(60)]
+    enrich_video_details(videos, yt_key="FAKE_KEY", http=http)
+
+    assert videos[0]["duration"].startswith("PT"), "Expected the details fetched before the quota error"
+    assert videos[59]["duration"] == ""
+    assert limiter.spent_today() == limiter.daily_quota, "Expected the quota to be marked as exhausted"
+    try:
+        limiter.acquire()
+        assert False, "Expected no more calls today"
+    except QuotaExceededError:
+        pass
+
+def test_local_transports_spend_no_quota():
+    """Test calls answered by a synthetic or mocked transport don't reserve any quota."""
+    limiter = get_quota_limiter()
+    run_yt_api(yt_key="FAKE_KEY", size=5, http=SyntheticHttp(n_videos=20, latency_ms=0))
+    iter_list = list(iter_yt_api(yt_key="FAKE_KEY", total=60, http=SyntheticHttp(n_videos=200, latency_ms=0)))
+    http = HttpMockSequence([({"status": "200"}, _chart_response("etag-1", ["vid_a"]))])
+    run_yt_api(yt_key="FAKE_KEY", size=1, use_cache=False, http=http)
+    assert len(iter_list) == 60
+    assert limiter.spent_today() == 0
@@ -0,0 +1,41 @@
+from yt_delta import DeltaSuppressor
+from yt_records import VideoSnapshot
+
+def _snap(video_id, views, likes=10, comment_count=1):
+    return VideoSnapshot(video_id=video_id, views=views, likes=likes, comment_count=comment_count)
+
+def test_delta_first_snapshot_is_written():
+    """Test videos without state are always written."""
+    suppressor = DeltaSuppressor()
+    snaps = [_snap("a", 100), _snap("b", 200)]
+    assert suppressor.select(snaps, now=0) == snaps
+
+def test_delta_unchanged_snapshot_is_suppressed():
+    """Test a snapshot with the same counters is dropped until the heartbeat."""
+    suppressor = DeltaSuppressor(heartbeat_minutes=60)
+    suppressor.commit([_snap("a", 100)], now=0)
+    assert suppressor.select([_snap("a", 100)], now=1800) == []
+    assert len(suppressor.select([_snap("a", 100)], now=3600)) == 1, "Expected a heartbeat after 60 minutes"
+
+def test_delta_thresholds():
+    """Test the absolute and relative thresholds."""
+    suppressor = DeltaSuppressor(min_abs_delta=50, min_rel_delta=0.1, heartbeat_minutes=600)
+    suppressor.commit([_snap("a", 1000), _snap("b", 100)], now=0)
+    assert suppressor.select([_snap("a", 1040)], now=60) == [], "40 views is under both thresholds"
+    assert len(suppressor.select([_snap("a", 1060)], now=60)) == 1, "60 views is over the absolute threshold"
+    assert len(suppressor.select([_snap("b", 120)], now=60)) == 1, "20% is over the relative threshold"
+
+def test_delta_select_does_not_advance_state():
+    """Test only commit() updates the last written counters."""
+    suppressor = DeltaSuppressor(heartbeat_minutes=600)
+    suppressor.commit([_snap("a", 100)], now=0)
+    assert len(suppressor.select([_snap("a", 150)], now=60)) == 1
+    assert len(suppressor.select([_snap("a", 150)], now=120)) == 1, "Expected the state to be unchanged without commit"
+
+def test_delta_state_in_redis(redis_test_client):
+    """Test the state is shared between runs through Redis."""
+    DeltaSuppressor(redis_client=redis_test_client, env="ptest").commit([_snap("a", 100)], now=0)
+    next_run = DeltaSuppressor(heartbeat_minutes=600, redis_client=redis_test_client, env="ptest")
+    kept = next_run.select([_snap("a", 100), _snap("b", 5)], now=60)
+    redis_test_client.delete("snapstate:ptest")
+    assert [s["video_id"] for s in kept] == ["b"]
@@ -0,0 +1,41 @@
+from datetime import date
+from yt_hll import hll_elements, week_window, month_window, record_run, count_distinct, \
+    count_distinct_by_scope, merge_window
+
+test_videos = [
+    {"video_id": "hll_vid_1", "category_id": 10, "channel_title": "Chan A", "region": "US", "tags": ["Music", "live"]},
+    {"video_id": "hll_vid_2", "category_id": 10, "channel_title": "Chan B", "region": "GB", "tags": ["music"]},
+    {"video_id": "hll_vid_3", "category_id": 20, "channel_title": "Chan A", "tags": []},
+]
+
+
+def test_hll_elements_and_windows():
+    """Test the elements added per key and the week / month windows."""
+    elements = hll_elements(test_videos)
+    assert elements[("videos", "10")] == {"hll_vid_1", "hll_vid_2"}
+    assert elements[("channels", "US")] == {"Chan A"}
+    assert elements[("tags", "ALL")] == {"music", "live"}
+    assert week_window(date(2025, 1, 1)) == (date(2024, 12, 30), date(2025, 1, 5))
+    assert month_window(date(2024, 2, 10)) == (date(2024, 2, 1), date(2024, 2, 29))
+
+
+def test_distinct_counts_over_days(redis_test_client):
+    """Test a video seen on two days is counted once over the window."""
+    try:
+        record_run(test_videos[:2], env="ptest", redis_client=redis_test_client, day=date(2025, 1, 1))
+        record_run(test_videos[1:], env="ptest", redis_client=redis_test_client, day=date(2025, 1, 2))
+
+        assert count_distinct("videos", start=date(2025, 1, 1), end=date(2025, 1, 2),
+                              env="ptest", redis_client=redis_test_client) == 3
+        assert count_distinct("videos", start=date(2025, 1, 2), env="ptest", redis_client=redis_test_client) == 2
+        by_category = count_distinct_by_scope("videos", start=date(2025, 1, 1), end=date(2025, 1, 31),
+                                              env="ptest", redis_client=redis_test_client)
+        assert by_category == {"10": 2, "20": 1}
+
+        merged = merge_window("channels", start=date(2025, 1, 1), end=date(2025, 1, 7),
+                              env="ptest", redis_client=redis_test_client)
+        assert redis_test_client.pfcount(merged) == 2
+    finally:
+        keys = redis_test_client.keys("hll:ptest:*")
+        if keys:
+            redis_test_client.delete(*keys)
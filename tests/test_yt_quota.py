@@ -0,0 +1,44 @@
+from yt_quota import QuotaLimiter, QuotaExceededError, quota_day
+import time
+import pytest
+
+def test_quota_limiter_tracks_spend(tmp_path):
+    """Test the limiter adds up quota units per method."""
+    limiter = QuotaLimiter(daily_quota=1000, max_qps=0, state_path=str(tmp_path / "quota.json"))
+    limiter.acquire("youtube.videos.list")
+    limiter.acquire("youtube.videos.list", calls=3)
+    limiter.acquire("youtube.search.list")
+    assert limiter.spent_today() == 104, "Expected 1 + 3 + 100 units"
+
+def test_quota_limiter_persists_spend(tmp_path):
+    """Test a new limiter (e.g. the next hourly run) sees the spend of the previous one."""
+    QuotaLimiter(daily_quota=1000, max_qps=0, state_path=str(tmp_path / "quota.json")).acquire(calls=5)
+    limiter = QuotaLimiter(daily_quota=1000, max_qps=0, state_path=str(tmp_path / "quota.json"))
+    assert limiter.spent_today() == 5
+
+def test_quota_limiter_exceeded(tmp_path):
+    """Test calls over the daily quota are refused without being counted."""
+    limiter = QuotaLimiter(daily_quota=150, max_qps=0, state_path=str(tmp_path / "quota.json"))
+    limiter.acquire("youtube.search.list")
+    with pytest.raises(QuotaExceededError):
+        limiter.acquire("youtube.search.list")
+    assert limiter.spent_today() == 100, "Expected the refused call not to be counted"
+
+def test_quota_limiter_redis(redis_test_client):
+    """Test the spend is shared through Redis."""
+    limiter = QuotaLimiter(daily_quota=10, max_qps=0, redis_client=redis_test_client, env="ptest")
+    limiter.acquire(calls=4)
+    other_job = QuotaLimiter(daily_quota=10, max_qps=0, redis_client=redis_test_client, env="ptest")
+    with pytest.raises(QuotaExceededError):
+        other_job.acquire(calls=7)
+    spent = other_job.spent_today()
+    redis_test_client.delete(f"yt_quota:ptest:{quota_day()}")
+    assert spent == 4
+
+def test_quota_limiter_paces_calls(tmp_path):
+    """Test the token bucket holds calls past the burst to max_qps."""
+    limiter = QuotaLimiter(daily_quota=1000, max_qps=20, burst=1, state_path=str(tmp_path / "quota.json"))
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.15, "Expected 4 paced calls at 20 per second"
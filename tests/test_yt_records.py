@@ -0,0 +1,54 @@
+from yt_records import VideoSnapshot, to_rows, normalize_tags, SNAPSHOT_FIELDS
+import pytest
+
+test_video = VideoSnapshot(
+    video_id="test_vid_1",
+    title="Test Video 1",
+    channel_title="Test Channel",
+    category_id="1",
+    publish_date="01-01-2023",
+    tags=["test", "video"],
+    views=1000,
+    likes=100,
+    comment_count=10,
+    thumbnail_link="http://example.com/thumb1.jpg",
+    recorded_at="2023-10-01 12:00:00"
+)
+
+def test_video_snapshot_mapping_access():
+    """Test VideoSnapshot reads like the old record dicts."""
+    assert test_video["video_id"] == "test_vid_1"
+    assert test_video.get("views") == 1000
+    assert test_video.get("thumbnail", "") == "", "Expected the default for unknown fields"
+    assert len(test_video.keys()) == 11, "Expected optional fields to be hidden until set"
+    with pytest.raises(KeyError):
+        test_video["not_a_field"]
+
+def test_video_snapshot_is_slotted():
+    """Test VideoSnapshot has no per-instance dict."""
+    assert not hasattr(test_video, "__dict__")
+
+def test_video_snapshot_update():
+    """Test optional fields show up once they are set."""
+    video = VideoSnapshot.from_dict(test_video.to_dict())
+    video.update({"duration": "PT1M", "channel_id": "chan_1"})
+    video["region"] = "GB"
+    assert "duration" in video.keys() and "region" in video.keys()
+    assert video.to_dict()["channel_id"] == "chan_1"
+
+def test_to_rows_mixed_records():
+    """Test to_rows converts VideoSnapshot and dict records the same way."""
+    as_dict = test_video.to_dict()
+    rows = to_rows([test_video, as_dict], SNAPSHOT_FIELDS)
+    assert rows[0] == rows[1]
+    assert rows[0] == ["test_vid_1", "01-01-2023", 1000, 100, 10, "2023-10-01 12:00:00"]
+
+def test_to_rows_clean():
+    """Test sheet cleaning joins tags and fills missing values."""
+    rows = to_rows([test_video], ["tags", "duration"], default="", clean=True)
+    assert rows == [["test, video", ""]]
+
+def test_normalize_tags():
+    """Test tags are lowercased, trimmed and deduplicated in order."""
+    assert normalize_tags([" Music", "music", "", "Trap ", "BZRP"]) == ["music", "trap", "bzrp"]
+    assert normalize_tags(None) == []
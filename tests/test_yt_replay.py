@@ -0,0 +1,57 @@
+from ty_api import run_yt_api, enrich_video_details
+from yt_replay import SyntheticHttp, RecordingHttp, ReplayHttp, write_synthetic_fixtures, request_key
+import os
+
+def test_request_key_drops_api_key():
+    """Test fixtures are keyed without the API key and independent of parameter order."""
+    key_1 = request_key("https://youtube.googleapis.com/youtube/v3/videos?key=SECRET&part=snippet&chart=mostPopular")
+    key_2 = request_key("https://youtube.googleapis.com/youtube/v3/videos?chart=mostPopular&part=snippet&key=OTHER")
+    assert key_1 == key_2
+    assert "SECRET" not in key_1
+
+def test_synthetic_chart():
+    """Test the synthetic transport fabricates N videos per region."""
+    http = SyntheticHttp(n_videos=30, regions=["US", "GB"], latency_ms=0)
+    videos = run_yt_api(yt_key="FAKE_KEY", size=30, region="GB", use_cache=False, http=http)
+    assert len(videos) == 30
+    assert [v["video_id"] for v in videos] == [SyntheticHttp.video_id("GB", i) for i in range(30)]
+
+
+def test_synthetic_region_codes_of_any_length():
+    """Test IDs round trip through the details lookup whatever the region code's length."""
+    http = SyntheticHttp(n_videos=5, regions=3, latency_ms=0)
+    videos = run_yt_api(yt_key="FAKE_KEY", size=5, region="R1", use_cache=False, http=http)
+    assert [v["video_id"] for v in videos] == [f"R1-{i}" for i in range(5)]
+    enrich_video_details(videos, yt_key="FAKE_KEY", http=http)
+    assert all(v.get("duration") for v in videos), "Expected every ID found by the details lookup"
+
+def test_record_then_replay(tmp_path):
+    """Test recorded responses, including batched details, replay to the same records."""
+    recorder = RecordingHttp(str(tmp_path), inner=SyntheticHttp(n_videos=50, regions=["US", "CA"], latency_ms=0))
+    recorded = []
+    for region in ["US", "CA"]:
+        recorded += run_yt_api(yt_key="FAKE_KEY", size=50, region=region, use_cache=False, http=recorder)
+    enrich_video_details(recorded, yt_key="FAKE_KEY", http=recorder)
+
+    replay = ReplayHttp(str(tmp_path), latency_ms=0)
+    replayed = []
+    for region in ["US", "CA"]:
+        replayed += run_yt_api(yt_key="FAKE_KEY", size=50, region=region, use_cache=False, http=replay)
+    enrich_video_details(replayed, yt_key="FAKE_KEY", http=replay)
+
+    assert [v["video_id"] for v in replayed] == [v["video_id"] for v in recorded]
+    assert [v["duration"] for v in replayed] == [v["duration"] for v in recorded]
+    for name in os.listdir(tmp_path):
+        assert "FAKE_KEY" not in (tmp_path / name).read_text(), "Expected no API key in fixtures"
+
+def test_replay_missing_fixture(tmp_path):
+    """Test requests without a fixture fail like an API error."""
+    videos = run_yt_api(yt_key="FAKE_KEY", size=5, use_cache=False, http=ReplayHttp(str(tmp_path)))
+    assert videos == []
+
+def test_write_synthetic_fixtures(tmp_path):
+    """Test generated fixtures can be replayed offline."""
+    written = write_synthetic_fixtures(str(tmp_path), n_videos=10, regions=["US", "JP"])
+    assert written == 3
+    videos = run_yt_api(yt_key="FAKE_KEY", size=10, region="JP", use_cache=False, http=ReplayHttp(str(tmp_path)))
+    assert len(videos) == 10
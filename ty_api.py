@@ -1,15 +1,281 @@
 from googleapiclient.discovery import build
+from googleapiclient.discovery_cache.base import Cache
+from googleapiclient.http import build_http
+from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timezone
+from yt_quota import get_quota_limiter, QuotaExceededError
+from yt_records import VideoSnapshot
+from yt_replay import get_transport, is_offline, is_local_transport
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, Event, local
+from queue import Queue, Empty, Full
+import hashlib
+import json
+import time
 load_dotenv()
 import os
 
-def run_yt_api(yt_key="", size=5) -> list[dict]:
+# Region codes covered by the Kaggle trending dataset (see spark_big.py)
+TRENDING_REGIONS = ["CA", "DE", "FR", "GB", "IN", "JP", "KR", "MX", "RU", "US"]
+
+# videos().list only returns up to 50 items per page (and accepts up to 50 IDs per call)
+MAX_PAGE_SIZE = 50
+
+# Number of videos().list calls grouped into one BatchHttpRequest
+MAX_BATCH_CALLS = 50
+
+_END_OF_PAGES = object()
+
+# Where fetched discovery documents are kept between runs (only used with static_discovery=False)
+DISCOVERY_CACHE_DIR = os.getenv("YT_DISCOVERY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "yt_pipeline", "discovery"))
+DISCOVERY_CACHE_TTL = int(os.getenv("YT_DISCOVERY_CACHE_TTL", 7 * 24 * 3600))
+
+# ETag + parsed records of previous chart responses, see ResponseCache
+RESPONSE_CACHE_PATH = os.getenv("YT_RESPONSE_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "yt_pipeline", "responses.json"))
+
+# Process wide YouTube clients, keyed by API key
+_services = {}
+_services_lock = Lock()
+_thread_state = local()
+
+
+class FileDiscoveryCache(Cache):
+    """
+        Discovery document cache for googleapiclient that persists documents on disk,
+        so later processes skip fetching the document again until it is older than `ttl` seconds.
+    """
+
+    def __init__(self, cache_dir=DISCOVERY_CACHE_DIR, ttl=DISCOVERY_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, url, content):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if isinstance(content, bytes):
+                content = content.decode("utf-8")
+            # Write then rename so concurrent runs never read a partial document
+            tmp_path = f"{self._path(url)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, self._path(url))
+        except OSError as e:
+            print(f"Warning: could not write discovery cache ({e})")
+
+
+def get_youtube_service(yt_key="", static_discovery=True):
+    """
+        Returns the process wide YouTube Data API client for the given key, building it on first use.
+        yt_key: Optional YouTube API key. If not provided, uses the environment variable YT_API_KEY.
+        static_discovery: If True (default) the discovery document bundled with googleapiclient is used,
+            no network request is made. If False the live document is fetched once and then served from
+            the on-disk FileDiscoveryCache by later runs.
+        The client is shared between threads, execute its requests through _execute so each
+        thread uses its own HTTP connection.
+    """
+    YT_API_KEY = yt_key or os.getenv("YT_API_KEY")
+    cache_key = (YT_API_KEY, static_discovery)
+
+    with _services_lock:
+        service = _services.get(cache_key)
+        if service is None:
+            if static_discovery:
+                service = build("youtube", "v3", developerKey=YT_API_KEY, static_discovery=True)
+            else:
+                service = build("youtube", "v3", developerKey=YT_API_KEY, static_discovery=False,
+                                cache=FileDiscoveryCache())
+            _services[cache_key] = service
+
+    return service
+
+
+class ResponseCache:
+    """
+        Cache of chart responses keyed by request parameters. Each entry keeps the ETag
+        and the parsed records, so a later identical request can be sent with If-None-Match
+        and answered from the cache when YouTube replies 304 Not Modified.
+        path: Optional JSON file the entries are persisted to (None keeps them in memory only).
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH):
+        self.path = path
+        self._entries = {}
+        self._lock = Lock()
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, etag, records):
+        with self._lock:
+            self._entries[key] = {"etag": etag, "records": records, "stored_at": time.time()}
+            if self.path:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            if self.path:
+                self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: could not write response cache ({e})")
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """Returns the process wide ResponseCache (stored at YT_RESPONSE_CACHE_PATH)."""
+    global _response_cache
+    with _services_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    return _response_cache
+
+
+def _thread_http():
+    """
+        Returns an httplib2 connection owned by the calling thread (httplib2 is not thread safe).
+        With YT_API_MODE=record/replay/synthetic this is the matching yt_replay transport instead.
+    """
+    http = getattr(_thread_state, "http", None)
+    if http is None:
+        http = get_transport() or build_http()
+        _thread_state.http = http
+    return http
+
+
+def _is_quota_error(e):
+    """True if an HttpError is YouTube's 403 quotaExceeded / dailyLimitExceeded reply."""
+    return e.resp.status == 403 and any(
+        reason in str(e.content) for reason in ("quotaExceeded", "dailyLimitExceeded")
+    )
+
+
+def _execute(request, http=None, method=None, calls=1):
+    """
+        Executes a googleapiclient request on `http`, or on the calling thread's own connection.
+        Every call goes through the process wide QuotaLimiter first, which paces the request
+        and reserves its quota units (raises QuotaExceededError when the daily quota is spent).
+        Replayed, synthetic and mocked responses (YT_API_MODE or an explicit local `http`,
+        see yt_replay) don't use any quota.
+        method: API method id used for the quota cost, defaults to the request's own methodId.
+        calls: Number of API calls the request stands for (e.g. the requests inside a batch).
+    """
+    limiter = get_quota_limiter()
+    if not (is_offline() or is_local_transport(http)):
+        limiter.acquire(method or getattr(request, "methodId", None) or "youtube.videos.list", calls)
+    try:
+        return request.execute(http=http or _thread_http())
+    except HttpError as e:
+        if _is_quota_error(e):
+            # Another job spent the quota, stop every other request for today
+            limiter.mark_exhausted()
+            raise QuotaExceededError(f"YouTube API daily quota exhausted (API replied quotaExceeded): {e}") from e
+        raise
+
+
+def _recorded_at_now():
+    # timezone aware, so Postgres (timestamptz) doesn't read it in the session's timezone
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S %Z")
+
+
+def _execute_cached(request, cache_key, response_cache, http=None):
+    """
+        Executes a chart request conditionally: when `response_cache` has an entry for `cache_key`
+        its ETag is sent as If-None-Match, and a 304 reply is served from the cached records
+        (re-stamped with the current recorded_at). Fresh responses are parsed and stored.
+        Returns a list of untagged records.
+    """
+    entry = response_cache.get(cache_key) if response_cache else None
+    if entry:
+        request.headers["If-None-Match"] = entry["etag"]
+
+    try:
+        response = _execute(request, http)
+    except HttpError as e:
+        if entry and e.resp.status == 304:
+            print(f"Chart not modified since last fetch, serving {len(entry['records'])} cached records.")
+            recorded_at = _recorded_at_now()
+            return [VideoSnapshot.from_dict({**record, "recorded_at": recorded_at}) for record in entry["records"]]
+        raise
+
+    records = [_parse_video_item(item) for item in response.get("items", [])]
+    if response_cache and response.get("etag"):
+        response_cache.set(cache_key, response["etag"], [record.to_dict() for record in records])
+
+    return records
+
+
+def _parse_video_item(item, region=None) -> VideoSnapshot:
+    """
+        Converts a single item from a videos().list response into a pipeline record.
+        item: dict from the API response "items" list.
+        region: Optional region code to tag the record with.
+    """
+    snippet = item.get("snippet", {})
+    stats = item.get("statistics", {})
+
+    thumbnails = snippet.get("thumbnails", {})
+    dt = datetime.strptime(snippet.get("publishedAt"),"%Y-%m-%dT%H:%M:%SZ")
+
+    return VideoSnapshot(
+        video_id=item.get("id"),
+        title=snippet.get("title"),
+        channel_title=snippet.get("channelTitle"),
+        category_id=snippet.get("categoryId"),
+        publish_date=dt.strftime("%m-%d-%Y"),
+        tags=snippet.get("tags", []),
+        views=int(stats.get("viewCount", 0)),
+        likes=int(stats.get("likeCount", 0)),
+        comment_count=int(stats.get("commentCount", 0)),
+        thumbnail_link=thumbnails.get("high", {}).get("url") or thumbnails.get("default", {}).get("url"),
+        recorded_at=_recorded_at_now(),
+        region=region or None
+    )
+
+
+def run_yt_api(yt_key="", size=5, region="US", tag_region=False, use_cache=True, response_cache=None, http=None) -> list[VideoSnapshot]:
     """
         Fetches the most popular videos from YouTube API.
         size: Number of videos to fetch (max 50 and defaults to 5).
         yt_key: Optional YouTube API key. If not provided, uses the environment variable YT_API_KEY.
-        Returns a list of dictionaries with video IDs as keys and metadata (title, views, tags) as values.
+        region: Region code of the trending chart to fetch (defaults to "US").
+        tag_region: If True, each record gets a "region" key with the region code.
+        use_cache: If True, the request is sent with the ETag of the previous identical request
+            and a 304 Not Modified reply is answered from the response cache.
+        response_cache: Optional ResponseCache. Defaults to the process wide cache at YT_RESPONSE_CACHE_PATH.
+        http: Optional httplib2-compatible transport (e.g. googleapiclient.http.HttpMockSequence for tests).
+        Returns a list of VideoSnapshot records (video ID plus metadata such as title, views, tags),
+        which can be read like dicts.
     """
     if not yt_key:
         YT_API_KEY = os.getenv("YT_API_KEY")
@@ -20,60 +286,300 @@ def run_yt_api(yt_key="", size=5) -> list[dict]:
         return []
     
     try:
-        youtube = build("youtube", "v3", developerKey=YT_API_KEY)
+        youtube = get_youtube_service(YT_API_KEY)
         request = youtube.videos().list(
             part="snippet,statistics",
             chart="mostPopular",
-            regionCode="US",
+            regionCode=region,
             maxResults=size
         )
 
-        response = request.execute()
+        if use_cache:
+            response_cache = response_cache or get_response_cache()
+        else:
+            response_cache = None
+
+        cache_key = f"videos.list:snippet,statistics:mostPopular:{region}:{size}"
+        results = _execute_cached(request, cache_key, response_cache, http)
+
+        if tag_region:
+            for record in results:
+                record["region"] = region
+
+        return results
+
+    except QuotaExceededError as e:
+        print(f"Skipping region {region}: {e}")
+        return []
+
+    except Exception as e:
+        print(f"Error fetching data from YouTube API: {e}")
+        return []
+
+
+def _iter_chart_pages(yt_key, region, total, page_size, http=None):
+    """
+        Yields the raw "items" list of each mostPopular chart page, following nextPageToken
+        until `total` items were returned or the chart runs out of pages.
+    """
+    youtube = get_youtube_service(yt_key)
+    page_token = None
+    fetched = 0
+
+    while fetched < total:
+        request = youtube.videos().list(
+            part="snippet,statistics",
+            chart="mostPopular",
+            regionCode=region,
+            maxResults=min(page_size, total - fetched),
+            pageToken=page_token
+        )
+        response = _execute(request, http)
+
+        items = response.get("items", [])[:total - fetched]
+        if not items:
+            return
 
-        results = []
+        fetched += len(items)
+        yield items
 
-        for item in response.get("items", []):
-            snippet = item.get("snippet", {})
-            stats = item.get("statistics", {})
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return
 
-            thumbnails = snippet.get("thumbnails", {})
-            dt = datetime.strptime(snippet.get("publishedAt"),"%Y-%m-%dT%H:%M:%SZ")
 
-            record = {
-                "video_id": item.get("id"),
-                "title": snippet.get("title"),
-                "channel_title": snippet.get("channelTitle"),
-                "category_id": snippet.get("categoryId"),
-                "publish_date": dt.strftime("%m-%d-%Y"),
-                "tags": snippet.get("tags", []),
-                "views": int(stats.get("viewCount", 0)),
-                "likes": int(stats.get("likeCount", 0)),
-                "comment_count": int(stats.get("commentCount", 0)),
-                "thumbnail_link": thumbnails.get("high", {}).get("url") or thumbnails.get("default", {}).get("url"),
-                "recorded_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S %Z")
-            }
+def _prefetch_pages(pages, prefetch):
+    """
+        Runs the `pages` generator on a background thread, keeping at most `prefetch`
+        pages buffered so the next request is in flight while the caller handles the current page.
+        Exceptions raised by the producer are re-raised in the caller. When the caller stops
+        early (break, close), the producer stops at its next page and closes `pages`.
+    """
+    buffer = Queue(maxsize=prefetch)
+    stop = Event()
 
-            results.append(record)
-            
-            # import pprint
-            # pprint.pprint(record)    
-            # print("------")
+    def _put(item):
+        # gives up once the consumer is gone, so the thread never blocks forever on a full buffer
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
 
-            # for key, value in record.items():
-            #     print(f"{key}: {value}")
-            # print("---")
+    def _produce():
+        try:
+            for page in pages:
+                if not _put(page):
+                    break
+        except Exception as e:
+            _put(e)
+        finally:
+            pages.close()
+            _put(_END_OF_PAGES)
 
-        return results
+    Thread(target=_produce, daemon=True).start()
+
+    try:
+        while True:
+            page = buffer.get()
+            if page is _END_OF_PAGES:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        stop.set()
+        # free the buffer so a producer waiting in put() sees the stop right away
+        try:
+            while True:
+                buffer.get_nowait()
+        except Empty:
+            pass
+
+
+def iter_yt_api(yt_key="", total=50, region="US", page_size=MAX_PAGE_SIZE, batches=False, prefetch=1, tag_region=False,
+                http=None):
+    """
+        Streams the most popular videos from YouTube API page by page.
+        Unlike run_yt_api this follows nextPageToken, so `total` can go past 50
+        (the mostPopular chart itself stops at around 200 videos per region).
+        yt_key: Optional YouTube API key. If not provided, uses the environment variable YT_API_KEY.
+        total: Maximum number of videos to yield.
+        region: Region code of the trending chart to fetch (defaults to "US").
+        page_size: Number of videos requested per page (max 50).
+        batches: If True, yields one list of records per page instead of single records.
+        prefetch: Number of pages fetched ahead on a background thread while the caller
+            consumes the current one. Use 0 to fetch each page only when it is needed.
+        tag_region: If True, each record gets a "region" key with the region code.
+        http: Optional httplib2-compatible transport (e.g. yt_replay.SyntheticHttp for tests).
+        Yields VideoSnapshot records (same as run_yt_api) or lists of them.
+    """
+    YT_API_KEY = yt_key or os.getenv("YT_API_KEY")
+
+    if total < 1:
+        return
+
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    pages = _iter_chart_pages(YT_API_KEY, region, total, page_size, http)
+    if prefetch > 0:
+        pages = _prefetch_pages(pages, prefetch)
+
+    try:
+        for items in pages:
+            records = [_parse_video_item(item, region if tag_region else None) for item in items]
+            if batches:
+                yield records
+            else:
+                yield from records
+
+    except QuotaExceededError as e:
+        print(f"Stopping pagination for region {region}: {e}")
+        return
 
     except Exception as e:
         print(f"Error fetching data from YouTube API: {e}")
+        return
+
+
+def _merge_video_details(item):
+    """Extracts the enrichment fields of a videos().list item with snippet and contentDetails parts."""
+    snippet = item.get("snippet", {})
+    details = item.get("contentDetails", {})
+    return {
+        "channel_id": snippet.get("channelId", ""),
+        "published_at": snippet.get("publishedAt", ""),
+        "duration": details.get("duration", ""),
+        "definition": details.get("definition", ""),
+        "caption": details.get("caption", ""),
+    }
+
+
+def enrich_video_details(videos, yt_key="", http=None, use_batch=True) -> list[VideoSnapshot]:
+    """
+        Adds channel_id, published_at, duration, definition and caption to fetched records.
+        The unique video IDs are looked up 50 per videos().list call, and the calls are grouped
+        into googleapiclient batch requests, so a run of any size needs one HTTP round trip
+        per 50 calls. Records are updated in place in a single pass; videos the API did not
+        return keep empty values.
+        videos: list[VideoSnapshot] : Records from run_yt_api / run_yt_api_regions (plain dicts work too).
+        yt_key: Optional YouTube API key. If not provided, uses the environment variable YT_API_KEY.
+        http: Optional httplib2-compatible transport.
+        use_batch: If False every chunk is sent as its own request instead of a batch.
+        Returns the same list of records.
+    """
+    video_ids = list(dict.fromkeys(v["video_id"] for v in videos if v.get("video_id")))
+    if not video_ids:
+        return videos
+
+    try:
+        youtube = get_youtube_service(yt_key)
+        chunks = [video_ids[i:i + MAX_PAGE_SIZE] for i in range(0, len(video_ids), MAX_PAGE_SIZE)]
+        requests = [
+            youtube.videos().list(part="snippet,contentDetails", id=",".join(chunk), maxResults=MAX_PAGE_SIZE)
+            for chunk in chunks
+        ]
+
+        details = {}
+        errors = []
+        quota_errors = []
+
+        def _collect(request_id, response, exception):
+            if exception is not None:
+                if isinstance(exception, HttpError) and _is_quota_error(exception):
+                    quota_errors.append(exception)
+                else:
+                    errors.append(exception)
+                return
+            for item in response.get("items", []):
+                details[item["id"]] = _merge_video_details(item)
+
+        if use_batch and len(requests) > 1:
+            for start in range(0, len(requests), MAX_BATCH_CALLS):
+                batch = youtube.new_batch_http_request(callback=_collect)
+                for request in requests[start:start + MAX_BATCH_CALLS]:
+                    batch.add(request)
+                _execute(batch, http, method="youtube.videos.list", calls=len(requests[start:start + MAX_BATCH_CALLS]))
+                if quota_errors:
+                    # A call inside the batch hit the daily quota: stop every other request for today,
+                    # as _execute does, and keep the details collected so far
+                    get_quota_limiter().mark_exhausted()
+                    print(f"Skipping the remaining video details, YouTube API daily quota exhausted: {quota_errors[0]}")
+                    break
+        else:
+            for request in requests:
+                _collect(None, _execute(request, http), None)
+
+        for exception in errors:
+            print(f"Error fetching video details from YouTube API: {exception}")
+
+        empty = _merge_video_details({})
+        for video in videos:
+            video.update(details.get(video.get("video_id"), empty))
+
+        print(f"Enriched {len(details)} of {len(video_ids)} videos with {len(requests)} details calls.")
+
+    except QuotaExceededError as e:
+        print(f"Skipping video details: {e}")
+
+    except Exception as e:
+        print(f"Error fetching video details from YouTube API: {e}")
+
+    return videos
+
+
+def run_yt_api_regions(yt_key="", size=5, regions=TRENDING_REGIONS, max_workers=4, dedupe=True,
+                       http=None) -> list[VideoSnapshot]:
+    """
+        Fetches the most popular videos for several regions concurrently.
+        Each region is a separate run_yt_api call on a bounded thread pool, so a failing
+        region only contributes an empty list.
+        yt_key: Optional YouTube API key. If not provided, uses the environment variable YT_API_KEY.
+        size: Number of videos to fetch per region (max 50 and defaults to 5).
+        regions: List of region codes to fetch (defaults to TRENDING_REGIONS).
+        max_workers: Maximum number of concurrent region requests.
+        dedupe: If True, a video trending in several regions is only kept once
+            (tagged with the first region in `regions` order), since the DB tables are keyed on video_id.
+        http: Optional httplib2-compatible transport shared by every region thread, so it must be
+            thread safe (e.g. yt_replay.SyntheticHttp / ReplayHttp for tests). Defaults to one
+            connection per thread.
+        Returns one merged list of records, each tagged with a "region" key.
+    """
+    if size < 1 or not regions:
         return []
-    
+
+    workers = max(1, min(max_workers, len(regions)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # map keeps the results in the same order as regions
+        per_region = list(executor.map(
+            lambda r: run_yt_api(yt_key, size=size, region=r, tag_region=True, http=http),
+            regions
+        ))
+
+    results = []
+    seen_ids = set()
+    for region, records in zip(regions, per_region):
+        print(f"Fetched {len(records)} videos for region {region}.")
+        for record in records:
+            if dedupe:
+                if record["video_id"] in seen_ids:
+                    continue
+                seen_ids.add(record["video_id"])
+            results.append(record)
+
+    return results
+
 
 
 ## Good way to test the function
 # res = run_yt_api(os.getenv("YT_API_KEY"), size=10)
 
+## Streaming version, each page is written while the next one is fetched
+# from db import add_trending_snapshot_P
+# for page in iter_yt_api(os.getenv("YT_API_KEY"), total=150, batches=True):
+#     add_trending_snapshot_P(page)
+
 ## Test code for db insertion
 # from db import add_video_P, add_trending_snapshot_P
 
@@ -1,5 +1,7 @@
 import csv
 import os
+from yt_records import to_rows
+from bloom import BloomFilter, BLOOM_CAPACITY, BLOOM_ERROR_RATE
 
 
 def _get_existing_keys(file_path, key_fields):
@@ -22,36 +24,105 @@ def _get_existing_keys(file_path, key_fields):
     return existing, needs_header
 
 
+def _find_existing_keys(file_path, key_fields, candidates):
+    """
+    Like _get_existing_keys but only collects the keys in `candidates` (a set of tuples),
+    streaming the file, so memory is bounded by the batch instead of the whole CSV.
+    """
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return set(), True
+
+    found = set()
+    with open(file_path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if not (reader.fieldnames and all(k in reader.fieldnames for k in key_fields)):
+            print(f"Header missing or invalid in {file_path} — will rewrite it.")
+            return set(), True
+        if not candidates:
+            return set(), False
+        for row in reader:
+            key = tuple(row[k] for k in key_fields)
+            if key in candidates:
+                found.add(key)
+                if len(found) == len(candidates):
+                    break
+
+    return found, False
+
+
+def _open_csv_filter(file_path, key_field="video_id", capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+    """
+    Memory-maps the Bloom filter of the `key_field` values in `file_path`, kept next to it as
+    `{file_path}.bloom`. Rebuilt with one streaming pass over the CSV when it is missing,
+    unreadable or out of sync with the file (the CSV was written without it).
+    """
+    bloom_path = f"{file_path}.bloom"
+    bloom = None
+    if os.path.exists(bloom_path):
+        try:
+            bloom = BloomFilter.open(bloom_path)
+        except Exception as e:
+            print(f"{bloom_path} unreadable ({e}) — rebuilding it.")
+    csv_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    if bloom is not None and bloom.synced_size == csv_size:
+        return bloom
+
+    if bloom is not None:
+        bloom.close()
+    rebuilt = BloomFilter.for_capacity(capacity, error_rate)
+    if csv_size:
+        with open(file_path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames and key_field in reader.fieldnames:
+                rebuilt.update(row[key_field] for row in reader)
+    rebuilt.synced_size = csv_size
+    rebuilt.save(bloom_path)
+    return BloomFilter.open(bloom_path)
+
+
 def _append_to_csv(file_path, fieldnames, rows, needs_header):
-    """Helper to write rows to CSV, adding header if needed."""
+    """Helper to write records (VideoSnapshot or dicts) to CSV, adding header if needed."""
     with open(file_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer = csv.writer(f)
         if needs_header:
-            writer.writeheader()
-        writer.writerows(rows)
+            writer.writerow(fieldnames)
+        writer.writerows(to_rows(rows, fieldnames, default=""))
 
 
-def update_videos_csv(videos, file_path="youtube_videos.csv"):
+def update_videos_csv(videos, file_path="youtube_videos.csv", use_filter=False):
     """
     Appends unique videos to a CSV file.
     Writes headers automatically on first run or if missing.
-    Uniqueness based on 'video_id'.
+    Uniqueness based on 'video_id'. Only the batch's IDs are looked up in the file.
+    With use_filter, a Bloom filter of the file's IDs (_open_csv_filter) answers the IDs it has
+    never seen, and the file is only scanned for its positives.
     """
     if not videos:
         print("No videos to add.")
         return
 
     fieldnames = list(videos[0].keys())
-    existing_ids, needs_header = _get_existing_keys(file_path, ["video_id"])
-
-    # Filter unique
-    new_videos = [v for v in videos if v["video_id"] not in (id_[0] for id_ in existing_ids)]
-    if not new_videos:
-        print("No new unique videos to add.")
-        return
-
-    _append_to_csv(file_path, fieldnames, new_videos, needs_header)
-    print(f"Added {len(new_videos)} new videos to {file_path}.")
+    candidates = {(v["video_id"],) for v in videos}
+    csv_filter = _open_csv_filter(file_path) if use_filter else None
+    try:
+        if csv_filter is not None:
+            candidates = {key for key in candidates if key[0] in csv_filter}
+        existing_ids, needs_header = _find_existing_keys(file_path, ["video_id"], candidates)
+
+        # Filter unique
+        new_videos = [v for v in videos if (v["video_id"],) not in existing_ids]
+        if not new_videos:
+            print("No new unique videos to add.")
+            return
+
+        _append_to_csv(file_path, fieldnames, new_videos, needs_header)
+        print(f"Added {len(new_videos)} new videos to {file_path}.")
+        if csv_filter is not None:
+            csv_filter.update(v["video_id"] for v in new_videos)
+            csv_filter.synced_size = os.path.getsize(file_path)
+    finally:
+        if csv_filter is not None:
+            csv_filter.close()
 
 
 def update_trending_csv(snapshots, file_path="youtube_trending_history.csv"):
@@ -68,8 +139,7 @@ def update_trending_csv(snapshots, file_path="youtube_trending_history.csv"):
     existing_pairs, needs_header = _get_existing_keys(file_path, ["video_id", "recorded_at"])
 
     new_rows = [
-        {k: s.get(k) for k in fieldnames}
-        for s in snapshots
+        s for s in snapshots
         if (s.get("video_id"), s.get("recorded_at")) not in existing_pairs
     ]
 
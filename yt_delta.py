@@ -0,0 +1,130 @@
+import os
+import time
+from threading import Lock
+from dotenv import load_dotenv
+load_dotenv()
+
+# Counters compared between two snapshots of the same video
+DELTA_FIELDS = ("views", "likes", "comment_count")
+
+# "on" enables delta suppression in the pipeline
+DELTA_MODE = os.getenv("SNAPSHOT_DELTA_MODE", "off").lower()
+# A snapshot is written when any counter moved by more than this many units...
+MIN_ABS_DELTA = int(os.getenv("SNAPSHOT_MIN_ABS_DELTA", 0))
+# ...or by more than this fraction of its last written value (0.01 = 1%)
+MIN_REL_DELTA = float(os.getenv("SNAPSHOT_MIN_REL_DELTA", 0))
+# (0 disables a threshold; with both disabled any change is written)
+# ...or when the last written snapshot is older than this (heartbeat)
+HEARTBEAT_MINUTES = float(os.getenv("SNAPSHOT_HEARTBEAT_MINUTES", 360))
+# The Redis state expires when no run has written a snapshot for this long
+STATE_TTL_HOURS = int(os.getenv("SNAPSHOT_STATE_TTL_HOURS", 7 * 24))
+
+
+class DeltaSuppressor:
+    """
+    Drops trending snapshots whose counters haven't moved enough since the last written one.
+    Keeps the last written views/likes/comment_count and time of every video, in a Redis hash
+    (snapstate:{env}, shared by every run) when a client is given, otherwise in memory.
+    A snapshot is kept when the video has no state yet, when any counter changed by more than
+    min_abs_delta or min_rel_delta, or when heartbeat_minutes passed since the last written one.
+    Call select() before writing and commit() with the same snapshots once the write succeeded,
+    so a failed write never advances the state.
+    args:
+        min_abs_delta: int : Absolute change needed on any counter
+        min_rel_delta: float : Relative change needed on any counter (fraction of the last value)
+        heartbeat_minutes: float : Maximum time between two written snapshots of a video
+        redis_client: redis.Redis : Optional Redis client holding the state
+        env: str : Environment name for namespacing the Redis key
+    """
+
+    def __init__(self, min_abs_delta=MIN_ABS_DELTA, min_rel_delta=MIN_REL_DELTA,
+                 heartbeat_minutes=HEARTBEAT_MINUTES, redis_client=None, env=os.getenv("ENV", "prod")):
+        self.min_abs_delta = min_abs_delta
+        self.min_rel_delta = min_rel_delta
+        self.heartbeat_seconds = heartbeat_minutes * 60
+        self.redis_client = redis_client
+        self.key = f"snapstate:{env}"
+        self._state = {}
+        self._lock = Lock()
+
+    # ---- state ----
+    @staticmethod
+    def _encode(snapshot, now):
+        return ",".join(str(int(snapshot.get(f, 0) or 0)) for f in DELTA_FIELDS) + f",{now:.0f}"
+
+    @staticmethod
+    def _decode(value):
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode()
+        *counters, written_at = value.split(",")
+        return [int(c) for c in counters], float(written_at)
+
+    def _load(self, video_ids):
+        if self.redis_client:
+            try:
+                values = self.redis_client.hmget(self.key, video_ids)
+                return {vid: self._decode(v) for vid, v in zip(video_ids, values)}
+            except Exception as e:
+                print(f"Redis unavailable for snapshot state ({e}) — keeping it in memory.")
+                self.redis_client = None
+        with self._lock:
+            return {vid: self._decode(self._state.get(vid)) for vid in video_ids}
+
+    # ---- decisions ----
+    def _changed(self, old, new):
+        for before, after in zip(old, new):
+            diff = abs(after - before)
+            if diff == 0:
+                continue
+            if not self.min_abs_delta and not self.min_rel_delta:
+                return True
+            if self.min_abs_delta and diff > self.min_abs_delta:
+                return True
+            if self.min_rel_delta and diff > self.min_rel_delta * max(before, 1):
+                return True
+        return False
+
+    def select(self, snapshots, now=None):
+        """
+        Returns the snapshots that should be written, in their original order.
+        args:
+            snapshots: list : VideoSnapshot objects or dicts with video_id and the DELTA_FIELDS
+            now: float : Current time as a unix timestamp (defaults to time.time())
+        """
+        if not snapshots:
+            return []
+        now = time.time() if now is None else now
+        state = self._load([s["video_id"] for s in snapshots])
+
+        keep = []
+        for snapshot in snapshots:
+            last = state.get(snapshot["video_id"])
+            if last is None:
+                keep.append(snapshot)
+                continue
+            counters, written_at = last
+            current = [int(snapshot.get(f, 0) or 0) for f in DELTA_FIELDS]
+            if now - written_at >= self.heartbeat_seconds or self._changed(counters, current):
+                keep.append(snapshot)
+        return keep
+
+    def commit(self, snapshots, now=None):
+        """Records `snapshots` as the last written ones, call after they were stored."""
+        if not snapshots:
+            return
+        now = time.time() if now is None else now
+        mapping = {s["video_id"]: self._encode(s, now) for s in snapshots}
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.hset(self.key, mapping=mapping)
+                pipe.expire(self.key, STATE_TTL_HOURS * 3600)
+                pipe.execute()
+                return
+            except Exception as e:
+                print(f"Redis unavailable for snapshot state ({e}) — keeping it in memory.")
+                self.redis_client = None
+        with self._lock:
+            self._state.update(mapping)
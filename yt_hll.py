@@ -0,0 +1,181 @@
+import os
+from datetime import datetime, timedelta, timezone
+from redis_conn import get_redis_client
+from leaderboards import DEFAULT_REGION
+from yt_records import normalize_tags
+from dotenv import load_dotenv
+load_dotenv()
+
+# Approximate distinct counts kept in Redis HyperLogLogs (~0.81% standard error, at most 12 KB a key).
+# One key per dimension, scope and UTC day: hll:{env}:{dimension}:{scope}:{YYYY-MM-DD}.
+# Any window (week, month, last N days) is counted by merging its days with PFCOUNT / PFMERGE.
+#   videos   : video IDs, per category_id (and ALL)
+#   channels : channels, per region (and ALL)
+#   tags     : normalized tags (ALL)
+HLL_DIMENSIONS = ("videos", "channels", "tags")
+ALL_SCOPES = "ALL"
+# Daily keys are dropped after this many days (bounds the longest window that can be counted)
+HLL_RETENTION_DAYS = int(os.getenv("HLL_RETENTION_DAYS", 400))
+
+
+def _day(value):
+    if value is None:
+        return datetime.now(timezone.utc).date()
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).date() if value.tzinfo else value.date()
+    return value
+
+
+def hll_key(dimension, scope=ALL_SCOPES, day=None, env=os.getenv("ENV", "prod")):
+    return f"hll:{env}:{dimension}:{scope}:{_day(day).isoformat()}"
+
+
+def _scopes_key(dimension, env):
+    return f"hll:{env}:{dimension}:scopes"
+
+
+def week_window(day=None):
+    """(monday, sunday) of the week containing `day` (defaults to today, UTC)."""
+    day = _day(day)
+    monday = day - timedelta(days=day.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def month_window(day=None):
+    """(first, last) day of the month containing `day` (defaults to today, UTC)."""
+    day = _day(day)
+    first = day.replace(day=1)
+    next_month = (first + timedelta(days=32)).replace(day=1)
+    return first, next_month - timedelta(days=1)
+
+
+def _window_keys(dimension, scope, start, end, env):
+    start, end = _day(start), _day(end)
+    if end < start:
+        return []
+    return [hll_key(dimension, scope, start + timedelta(days=i), env) for i in range((end - start).days + 1)]
+
+
+def hll_elements(videos):
+    """
+    Elements added by one run, per key.
+    returns - {(dimension, scope): set of elements}
+    """
+    elements = {}
+
+    def add(dimension, scope, value):
+        if value not in (None, ""):
+            elements.setdefault((dimension, str(scope)), set()).add(str(value))
+
+    for video in videos:
+        vid = video.get("video_id")
+        if not vid:
+            continue
+        category = video.get("category_id")
+        channel = video.get("channel_id") or video.get("channel_title")
+        region = video.get("region") or DEFAULT_REGION
+
+        add("videos", ALL_SCOPES, vid)
+        if category not in (None, ""):
+            add("videos", category, vid)
+        add("channels", ALL_SCOPES, channel)
+        add("channels", region, channel)
+        for tag in normalize_tags(video.get("tags")):
+            add("tags", ALL_SCOPES, tag)
+    return elements
+
+
+def queue_hll_updates(pipe, videos, env=os.getenv("ENV", "prod"), day=None):
+    """
+    Queues the PFADDs of this run's videos into today's keys on `pipe` (e.g. the cache pipeline,
+    cache_video_ids_idempotent(queue_extra=...)), and records the scopes seen per dimension.
+    returns - number of keys updated
+    """
+    ttl_seconds = HLL_RETENTION_DAYS * 86400
+    elements = hll_elements(videos)
+    for (dimension, scope), values in elements.items():
+        key = hll_key(dimension, scope, day, env)
+        pipe.pfadd(key, *values)
+        pipe.expire(key, ttl_seconds)
+        pipe.sadd(_scopes_key(dimension, env), scope)
+    return len(elements)
+
+
+def record_run(videos, env=os.getenv("ENV", "prod"), redis_client=None, day=None):
+    """Adds one run's videos on its own pipeline. returns - number of keys updated, or None on failure."""
+    try:
+        redis_client = redis_client or get_redis_client(env)
+        if not redis_client:
+            return None
+        pipe = redis_client.pipeline(transaction=False)
+        updated = queue_hll_updates(pipe, videos, env, day)
+        pipe.execute()
+        return updated
+    except Exception as e:
+        print(f"Error updating distinct counters: {e}")
+        return None
+
+
+def count_distinct(dimension, scope=ALL_SCOPES, start=None, end=None, env=os.getenv("ENV", "prod"), redis_client=None):
+    """
+    Approximate number of distinct elements of `dimension` in `scope` over [start, end]
+    (days, inclusive; both default to today). One PFCOUNT over the window's daily keys.
+    returns - int, or None when Redis is unavailable
+    """
+    start = _day(start)
+    end = start if end is None else end
+    try:
+        redis_client = redis_client or get_redis_client(env)
+        if not redis_client:
+            return None
+        keys = _window_keys(dimension, scope, start, end, env)
+        return redis_client.pfcount(*keys) if keys else 0
+    except Exception as e:
+        print(f"Error counting distinct {dimension}: {e}")
+        return None
+
+
+def count_distinct_by_scope(dimension, start=None, end=None, env=os.getenv("ENV", "prod"), redis_client=None):
+    """
+    count_distinct for every scope recorded for `dimension` (ALL excluded), one PFCOUNT per
+    scope sent in one pipeline.
+    returns - {scope: count}, empty when Redis is unavailable
+    """
+    start = _day(start)
+    end = start if end is None else end
+    try:
+        redis_client = redis_client or get_redis_client(env)
+        if not redis_client:
+            return {}
+        scopes = sorted(s for s in redis_client.smembers(_scopes_key(dimension, env)) if s != ALL_SCOPES)
+        pipe = redis_client.pipeline(transaction=False)
+        for scope in scopes:
+            pipe.pfcount(*_window_keys(dimension, scope, start, end, env))
+        return dict(zip(scopes, pipe.execute())) if scopes else {}
+    except Exception as e:
+        print(f"Error counting distinct {dimension} by scope: {e}")
+        return {}
+
+
+def merge_window(dimension, scope=ALL_SCOPES, start=None, end=None, env=os.getenv("ENV", "prod"),
+                 redis_client=None, ttl_seconds=3600):
+    """
+    PFMERGEs the window's daily keys into one key, e.g. to keep a month's counter around for
+    repeated reads or further merges (hll:{env}:{dimension}:{scope}:{start}..{end}).
+    returns - the merged key, or None on failure
+    """
+    start = _day(start)
+    end = start if end is None else _day(end)
+    try:
+        redis_client = redis_client or get_redis_client(env)
+        if not redis_client:
+            return None
+        dest = f"hll:{env}:{dimension}:{scope}:{start.isoformat()}..{end.isoformat()}"
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.pfmerge(dest, *_window_keys(dimension, scope, start, end, env))
+        pipe.expire(dest, ttl_seconds)
+        pipe.execute()
+        return dest
+    except Exception as e:
+        print(f"Error merging distinct {dimension} counters: {e}")
+        return None
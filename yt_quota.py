@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import fcntl
+from datetime import datetime
+from threading import Lock
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+load_dotenv()
+
+# Quota units charged per YouTube Data API call
+# https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COSTS = {
+    "youtube.videos.list": 1,
+    "youtube.channels.list": 1,
+    "youtube.videoCategories.list": 1,
+    "youtube.playlistItems.list": 1,
+    "youtube.commentThreads.list": 1,
+    "youtube.search.list": 100,
+}
+DEFAULT_COST = 1
+
+DAILY_QUOTA = int(os.getenv("YT_DAILY_QUOTA", 10000))
+# Steady request rate and burst size of the token bucket
+MAX_QPS = float(os.getenv("YT_MAX_QPS", 10))
+BURST = int(os.getenv("YT_BURST", 10))
+QUOTA_STATE_PATH = os.getenv("YT_QUOTA_STATE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "yt_pipeline", "quota.json"))
+
+# The daily quota resets at midnight Pacific Time
+QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+
+
+class QuotaExceededError(Exception):
+    """Raised when a call would push the daily YouTube API spend over the quota."""
+
+
+def quota_day() -> str:
+    """Returns the current quota day (Pacific Time date) as YYYY-MM-DD."""
+    return datetime.now(QUOTA_TZ).strftime("%Y-%m-%d")
+
+
+class QuotaLimiter:
+    """
+    Paces YouTube Data API calls with a token bucket and keeps the daily quota spend.
+    The spend is stored in Redis (shared by every job using the key) when a client is given,
+    otherwise in a local JSON file, so parallel region and enrichment fetches fill the quota
+    without going over it.
+    args:
+        daily_quota: int : Quota units available per day
+        max_qps: float : Steady number of calls per second
+        burst: int : Number of calls that may be sent back to back
+        redis_client: redis.Redis : Optional Redis client holding the shared spend
+        env: str : Environment name for namespacing the Redis key
+        state_path: str : JSON file used when Redis is not available
+    """
+
+    def __init__(self, daily_quota=DAILY_QUOTA, max_qps=MAX_QPS, burst=BURST,
+                 redis_client=None, env=os.getenv("ENV", "prod"), state_path=QUOTA_STATE_PATH):
+        self.daily_quota = daily_quota
+        self.max_qps = max_qps
+        self.burst = max(1, burst)
+        self.redis_client = redis_client
+        self.env = env
+        self.state_path = state_path
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = Lock()
+
+    # ---- token bucket ----
+    def _take_token(self):
+        """Blocks until a call may be sent under max_qps."""
+        if self.max_qps <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.max_qps)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.max_qps
+            time.sleep(wait)
+
+    # ---- daily spend ----
+    def _redis_key(self, day):
+        return f"yt_quota:{self.env}:{day}"
+
+    def _reserve_redis(self, day, units):
+        key = self._redis_key(day)
+        pipe = self.redis_client.pipeline()
+        pipe.incrby(key, units)
+        pipe.expire(key, 48 * 3600)
+        spent = pipe.execute()[0]
+        if spent > self.daily_quota:
+            self.redis_client.decrby(key, units)
+            return False, spent - units
+        return True, spent
+
+    def _reserve_file(self, day, units):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path, "a+", encoding="utf-8") as f:
+            # Lock the file so concurrent processes don't lose updates
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                spent = int(state.get(day, 0))
+                if spent + units > self.daily_quota:
+                    return False, spent
+                # only keep the current day
+                state = {day: spent + units}
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                return True, spent + units
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _reserve(self, units):
+        day = quota_day()
+        if self.redis_client:
+            try:
+                return self._reserve_redis(day, units)
+            except Exception as e:
+                print(f"Redis unavailable for quota tracking ({e}) — falling back to {self.state_path}.")
+                self.redis_client = None
+        with self._lock:
+            return self._reserve_file(day, units)
+
+    def spent_today(self) -> int:
+        """Returns the quota units spent so far today."""
+        day = quota_day()
+        if self.redis_client:
+            try:
+                return int(self.redis_client.get(self._redis_key(day)) or 0)
+            except Exception:
+                pass
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return int(json.load(f).get(day, 0))
+        except (OSError, ValueError):
+            return 0
+
+    def mark_exhausted(self):
+        """Records the whole daily quota as spent, e.g. after the API answered quotaExceeded."""
+        remaining = self.daily_quota - self.spent_today()
+        if remaining > 0:
+            self._reserve(remaining)
+
+    def acquire(self, method="youtube.videos.list", calls=1):
+        """
+        Reserves the quota for `calls` calls of `method` and waits for the token bucket.
+        args:
+            method: str : API method id, e.g. "youtube.videos.list"
+            calls: int : Number of calls (e.g. requests inside one batch)
+        returns:
+            int : Quota units spent today including this reservation
+        raises:
+            QuotaExceededError : if the reservation would go over the daily quota
+        """
+        units = QUOTA_COSTS.get(method, DEFAULT_COST) * calls
+        ok, spent = self._reserve(units)
+        if not ok:
+            raise QuotaExceededError(
+                f"YouTube API daily quota exhausted: {spent}/{self.daily_quota} units spent on {quota_day()}, "
+                f"{method} needs {units} more."
+            )
+        for _ in range(calls):
+            self._take_token()
+        return spent
+
+
+_limiter = None
+_limiter_lock = Lock()
+
+
+def get_quota_limiter() -> QuotaLimiter:
+    """Returns the process wide QuotaLimiter (local file backed until configure_quota_limiter is called)."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = QuotaLimiter()
+    return _limiter
+
+
+def configure_quota_limiter(**kwargs) -> QuotaLimiter:
+    """
+    Replaces the process wide QuotaLimiter, e.g. configure_quota_limiter(redis_client=client)
+    to share the daily spend with other jobs. Takes the same arguments as QuotaLimiter.
+    """
+    global _limiter
+    with _limiter_lock:
+        _limiter = QuotaLimiter(**kwargs)
+    return _limiter
@@ -0,0 +1,138 @@
+# Fields every fetched record has, in the order run_yt_api has always returned them
+VIDEO_FIELDS = (
+    "video_id", "title", "channel_title", "category_id", "publish_date", "tags",
+    "views", "likes", "comment_count", "thumbnail_link", "recorded_at",
+)
+
+# Fields only set by some stages (region tagging, enrich_video_details)
+OPTIONAL_FIELDS = ("region", "channel_id", "published_at", "duration", "definition", "caption")
+
+# Columns of a trending snapshot (youtube_trending_history_p / snapshots sheet)
+SNAPSHOT_FIELDS = ("video_id", "publish_date", "views", "likes", "comment_count", "recorded_at")
+
+
+class VideoSnapshot:
+    """
+    One video as seen in a trending chart at `recorded_at`, the record type returned by run_yt_api.
+    Uses __slots__ (no per-instance __dict__) but still behaves like a read/write mapping
+    (`v["views"]`, `v.get("tags")`, `v.keys()`), so psycopg2 named parameters and older callers keep working.
+    Optional fields left as None are not reported by keys(), so a record
+    without enrichment has the same 11 keys the old dicts had.
+    Sinks should convert a whole batch once with to_rows().
+    """
+
+    __slots__ = VIDEO_FIELDS + OPTIONAL_FIELDS
+
+    def __init__(self, video_id=None, title=None, channel_title=None, category_id=None,
+                 publish_date=None, tags=None, views=0, likes=0, comment_count=0,
+                 thumbnail_link=None, recorded_at=None, region=None, channel_id=None,
+                 published_at=None, duration=None, definition=None, caption=None):
+        self.video_id = video_id
+        self.title = title
+        self.channel_title = channel_title
+        self.category_id = category_id
+        self.publish_date = publish_date
+        self.tags = tags if tags is not None else []
+        self.views = views
+        self.likes = likes
+        self.comment_count = comment_count
+        self.thumbnail_link = thumbnail_link
+        self.recorded_at = recorded_at
+        self.region = region
+        self.channel_id = channel_id
+        self.published_at = published_at
+        self.duration = duration
+        self.definition = definition
+        self.caption = caption
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a VideoSnapshot from a record dict, ignoring unknown keys."""
+        return cls(**{k: v for k, v in data.items() if k in cls.__slots__})
+
+    # ---- mapping compatibility ----
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(f"VideoSnapshot has no field '{key}'")
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def keys(self):
+        return list(VIDEO_FIELDS) + [f for f in OPTIONAL_FIELDS if getattr(self, f) is not None]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def update(self, other):
+        for k, v in other.items():
+            self[k] = v
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"VideoSnapshot(video_id={self.video_id!r}, views={self.views!r}, recorded_at={self.recorded_at!r})"
+
+    def row(self, fields):
+        """Returns the values of `fields` as a tuple (missing values are None)."""
+        return tuple(getattr(self, f, None) for f in fields)
+
+
+def normalize_tags(tags) -> list:
+    """
+    Returns the lookup form of a video's tags (youtube_videos_p.tag_list):
+    lowercased, trimmed, without empty or duplicate tags, in their original order.
+    """
+    seen = []
+    for tag in tags or []:
+        tag = str(tag).strip().lower()
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def _clean_value(v):
+    """Flattens a value for Google Sheets / CSV cells."""
+    if isinstance(v, list):
+        return ", ".join(v)
+    if isinstance(v, (dict, tuple)):
+        return str(v)
+    return v
+
+
+def to_rows(records, fields, default=None, clean=False) -> list:
+    """
+    Converts a batch of records (VideoSnapshot or plain dicts) into value lists in `fields` order.
+    args:
+        records: list : VideoSnapshot objects and/or dicts
+        fields: list[str] : Columns to extract
+        default: value used for missing fields (None for DB rows, "" for sheets)
+        clean: bool : If True lists are joined with ", " and dicts/tuples turned into strings
+    returns:
+        list[list] : One list of values per record
+    """
+    rows = []
+    for record in records:
+        if isinstance(record, VideoSnapshot):
+            values = record.row(fields)
+            if default is not None:
+                values = [default if v is None else v for v in values]
+        else:
+            values = [record.get(f, default) for f in fields]
+        if clean:
+            values = [_clean_value(v) for v in values]
+        rows.append(list(values))
+    return rows
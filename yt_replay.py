@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import random
+import hashlib
+from abc import ABC, abstractmethod
+from email.parser import Parser
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qsl, urlencode
+import httplib2
+from googleapiclient.http import HttpMock, HttpMockSequence
+from dotenv import load_dotenv
+load_dotenv()
+
+# "live" (default), "record" (live + save responses), "replay" (fixtures only) or "synthetic"
+API_MODE = os.getenv("YT_API_MODE", "live").lower()
+FIXTURE_DIR = os.getenv("YT_FIXTURE_DIR", os.path.join("tests", "fixtures", "yt_api"))
+REPLAY_LATENCY_MS = float(os.getenv("YT_REPLAY_LATENCY_MS", 0))
+
+# Query parameters that don't change the response (the API key must never end up in a fixture)
+_IGNORED_PARAMS = {"key", "alt", "prettyPrint", "quotaUser", "fields"}
+_BATCH_BOUNDARY = "yt_replay_batch_boundary"
+
+
+def is_offline(mode=None) -> bool:
+    """True when YouTube API calls are answered locally (replay or synthetic mode)."""
+    return (mode or API_MODE) in ("replay", "synthetic")
+
+
+def request_key(uri) -> str:
+    """
+    Normalizes a request URI to the key its fixture is stored under:
+    the path plus the sorted query parameters, without the API key.
+    """
+    parsed = urlparse(uri)
+    params = sorted((k, v) for k, v in parse_qsl(parsed.query) if k not in _IGNORED_PARAMS)
+    return f"{parsed.path}?{urlencode(params)}"
+
+
+def fixture_path(fixture_dir, uri) -> str:
+    """Returns the fixture file for a request URI."""
+    digest = hashlib.sha1(request_key(uri).encode("utf-8")).hexdigest()[:20]
+    return os.path.join(fixture_dir, f"{digest}.json")
+
+
+def _json_response(status, payload):
+    content = json.dumps(payload).encode("utf-8")
+    return httplib2.Response({"status": str(status), "content-type": "application/json; charset=UTF-8"}), content
+
+
+def _not_found(uri):
+    return _json_response(404, {"error": {"code": 404, "message": f"No fixture for {request_key(uri)}"}})
+
+
+def _split_batch_request(body, headers):
+    """Splits a googleapiclient batch body into (content_id, method, uri, headers) tuples."""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    content_type = {k.lower(): v for k, v in (headers or {}).items()}["content-type"]
+    message = Parser().parsestr(f"content-type: {content_type}\r\n\r\n{body}")
+
+    parts = []
+    for part in message.get_payload():
+        request_line, _, rest = part.get_payload().partition("\n")
+        method, path, _ = request_line.strip().split(" ", 2)
+        inner_headers = {}
+        for line in rest.split("\n"):
+            if not line.strip():
+                break
+            name, _, value = line.partition(":")
+            inner_headers[name.strip().lower()] = value.strip()
+        parts.append((part["Content-ID"], method, path, inner_headers))
+    return parts
+
+
+def _build_batch_response(answers):
+    """Builds a multipart batch reply from (content_id, response, content) tuples."""
+    chunks = []
+    for content_id, resp, content in answers:
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+        request_id = content_id.strip("<>")
+        chunks.append(
+            f"--{_BATCH_BOUNDARY}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <response-{request_id}>\r\n\r\n"
+            f"HTTP/1.1 {resp.status} {resp.reason or 'OK'}\r\n"
+            "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+            f"{content}\r\n"
+        )
+    chunks.append(f"--{_BATCH_BOUNDARY}--")
+    resp = httplib2.Response({"status": "200", "content-type": f"multipart/mixed; boundary={_BATCH_BOUNDARY}"})
+    return resp, "".join(chunks).encode("utf-8")
+
+
+def _split_batch_response(content, resp):
+    """Splits a multipart batch reply into {request content_id: (status, body)}."""
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    message = Parser().parsestr(f"content-type: {resp['content-type']}\r\n\r\n{content}")
+
+    answers = {}
+    for part in message.get_payload():
+        status_line, _, rest = part.get_payload().partition("\n")
+        status = int(status_line.split(" ")[1])
+        _, _, body = rest.replace("\r\n", "\n").partition("\n\n")
+        request_id = part["Content-ID"].strip("<>").replace("response-", "", 1)
+        answers[f"<{request_id}>"] = (status, body.strip())
+    return answers
+
+
+class _LocalHttp(ABC):
+    """
+    Base for transports that answer requests locally. Handles googleapiclient batch
+    requests by answering every inner request with answer() and returning one multipart reply.
+    Subclasses implement answer(uri, headers) -> (httplib2.Response, content).
+    latency_ms: Delay added to every HTTP round trip (a batch counts as one round trip).
+    """
+
+    def __init__(self, latency_ms=REPLAY_LATENCY_MS):
+        self.latency_ms = latency_ms
+        self.requests_served = 0
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        self.requests_served += 1
+
+        if method == "POST" and urlparse(uri).path.endswith("/batch"):
+            answers = []
+            for content_id, _, path, inner_headers in _split_batch_request(body, headers):
+                resp, content = self.answer(path, inner_headers)
+                answers.append((content_id, resp, content))
+            return _build_batch_response(answers)
+
+        return self.answer(uri, {k.lower(): v for k, v in (headers or {}).items()})
+
+    @abstractmethod
+    def answer(self, uri, headers):
+        """Returns (httplib2.Response, content) for one GET request."""
+
+
+class ReplayHttp(_LocalHttp):
+    """
+    httplib2 stand-in that serves responses saved by RecordingHttp from `fixture_dir`.
+    Requests are matched on path and query parameters (see request_key). An If-None-Match
+    header equal to the fixture's ETag gets a 304, like the live API.
+    """
+
+    def __init__(self, fixture_dir=FIXTURE_DIR, latency_ms=REPLAY_LATENCY_MS):
+        super().__init__(latency_ms)
+        self.fixture_dir = fixture_dir
+
+    def answer(self, uri, headers):
+        try:
+            with open(fixture_path(self.fixture_dir, uri), "r", encoding="utf-8") as f:
+                fixture = json.load(f)
+        except (OSError, ValueError):
+            return _not_found(uri)
+
+        etag = fixture.get("etag")
+        if etag and headers.get("if-none-match") == etag:
+            return httplib2.Response({"status": "304"}), b""
+
+        resp = httplib2.Response({"status": str(fixture["status"]), "content-type": "application/json; charset=UTF-8"})
+        return resp, fixture["body"].encode("utf-8")
+
+
+class RecordingHttp:
+    """
+    httplib2 wrapper that forwards requests to `inner` (a live connection by default) and saves
+    every GET response, including the ones inside batch requests, as a fixture in `fixture_dir`.
+    """
+
+    def __init__(self, fixture_dir=FIXTURE_DIR, inner=None):
+        self.fixture_dir = fixture_dir
+        self.inner = inner or httplib2.Http()
+
+    def _save(self, uri, status, content):
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+        try:
+            etag = json.loads(content).get("etag") if content else None
+        except ValueError:
+            etag = None
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        with open(fixture_path(self.fixture_dir, uri), "w", encoding="utf-8") as f:
+            json.dump({"request": request_key(uri), "status": status, "etag": etag, "body": content}, f)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        resp, content = self.inner.request(uri, method=method, body=body, headers=headers, **kwargs)
+
+        if method == "GET" and resp.status < 300:
+            self._save(uri, resp.status, content)
+        elif method == "POST" and urlparse(uri).path.endswith("/batch") and resp.status < 300:
+            answers = _split_batch_response(content, resp)
+            for content_id, _, path, _ in _split_batch_request(body, headers):
+                status, part_body = answers.get(content_id, (None, None))
+                if status and status < 300:
+                    self._save(path, status, part_body)
+
+        return resp, content
+
+
+def _synthetic_item(video_id, region, rank, rng, now):
+    published = now - timedelta(hours=rng.randint(1, 240))
+    views = rng.randint(10_000, 50_000_000)
+    return {
+        "kind": "youtube#video",
+        "etag": hashlib.sha1(f"{video_id}:{views}".encode("utf-8")).hexdigest(),
+        "id": video_id,
+        "snippet": {
+            "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "channelId": f"UC{region}{rng.randint(0, 9999):04d}synthetic",
+            "title": f"Synthetic trending video #{rank + 1} ({region})",
+            "channelTitle": f"Synthetic Channel {rng.randint(1, 500)}",
+            "categoryId": str(rng.choice([1, 2, 10, 17, 20, 22, 23, 24, 25, 26, 28])),
+            "tags": [f"tag{rng.randint(1, 200)}" for _ in range(rng.randint(0, 8))],
+            "thumbnails": {"high": {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}},
+        },
+        "contentDetails": {
+            "duration": f"PT{rng.randint(0, 59)}M{rng.randint(0, 59)}S",
+            "definition": rng.choice(["hd", "sd"]),
+            "caption": rng.choice(["true", "false"]),
+        },
+        "statistics": {
+            "viewCount": str(views),
+            "likeCount": str(views // rng.randint(20, 200)),
+            "commentCount": str(views // rng.randint(500, 5000)),
+        },
+    }
+
+
+class SyntheticHttp(_LocalHttp):
+    """
+    httplib2 stand-in that fabricates a mostPopular chart of `n_videos` videos for each
+    of `regions` (IDs look like "US-42": region and chart rank, see video_id()), plus
+    videos().list?id=... lookups.
+    Responses are deterministic for a given seed, so runs can be compared.
+    Wrap it in RecordingHttp to write the synthetic charts out as replay fixtures.
+    """
+
+    def __init__(self, n_videos=200, regions=("US",), seed=0, latency_ms=REPLAY_LATENCY_MS):
+        super().__init__(latency_ms)
+        if isinstance(regions, int):
+            regions = [f"R{i}" for i in range(regions)]
+        self.n_videos = n_videos
+        self.regions = list(regions)
+        self.seed = seed
+        self.now = datetime(2025, 1, 6, 12, 0, 0)
+
+    @staticmethod
+    def video_id(region, rank):
+        """ID of the video at `rank` in `region`'s chart (region codes of any length)."""
+        return f"{region}-{rank}"
+
+    def _parse_id(self, video_id):
+        """(region, rank) of one of this chart's IDs, or None for any other ID."""
+        region, _, rank = video_id.rpartition("-")
+        if region in self.regions and rank.isdigit() and int(rank) < self.n_videos:
+            return region, int(rank)
+        return None
+
+    def _video(self, video_id):
+        region, rank = self._parse_id(video_id)
+        rng = random.Random(f"{self.seed}:{video_id}")
+        return _synthetic_item(video_id, region, rank, rng, self.now)
+
+    def _chart_ids(self, region):
+        return [self.video_id(region, i) for i in range(self.n_videos)]
+
+    def answer(self, uri, headers):
+        params = dict(parse_qsl(urlparse(uri).query))
+        parts = params.get("part", "snippet,statistics").split(",")
+
+        if "id" in params:
+            ids = [vid for vid in params["id"].split(",") if self._parse_id(vid)]
+            items = [self._video(vid) for vid in ids]
+            return _json_response(200, {"kind": "youtube#videoListResponse", "items": self._only_parts(items, parts)})
+
+        region = params.get("regionCode", "US")
+        if region not in self.regions:
+            return _json_response(200, {"kind": "youtube#videoListResponse", "items": []})
+
+        page_size = int(params.get("maxResults", 5))
+        start = int(params.get("pageToken", "0") or 0)
+        ids = self._chart_ids(region)[start:start + page_size]
+        payload = {
+            "kind": "youtube#videoListResponse",
+            "etag": hashlib.sha1(f"{self.seed}:{region}:{start}:{page_size}".encode("utf-8")).hexdigest(),
+            "items": self._only_parts([self._video(vid) for vid in ids], parts),
+            "pageInfo": {"totalResults": self.n_videos, "resultsPerPage": page_size},
+        }
+        if start + page_size < self.n_videos:
+            payload["nextPageToken"] = str(start + page_size)
+
+        if headers.get("if-none-match") == payload["etag"]:
+            return httplib2.Response({"status": "304"}), b""
+        return _json_response(200, payload)
+
+    @staticmethod
+    def _only_parts(items, parts):
+        keep = {"kind", "etag", "id", *parts}
+        return [{k: v for k, v in item.items() if k in keep} for item in items]
+
+
+def write_synthetic_fixtures(fixture_dir=FIXTURE_DIR, n_videos=50, regions=("US",), seed=0):
+    """
+    Writes replay fixtures for a synthetic chart of `n_videos` videos in each of `regions`,
+    for the requests run_yt_api / run_yt_api_regions(size=n_videos) and enrich_video_details make.
+    Returns the number of fixture files written.
+    """
+    synthetic = SyntheticHttp(n_videos=n_videos, regions=regions, seed=seed, latency_ms=0)
+    recorder = RecordingHttp(fixture_dir, inner=synthetic)
+    base = "https://youtube.googleapis.com/youtube/v3/videos"
+
+    written = 0
+    video_ids = []
+    for region in synthetic.regions:
+        query = urlencode({"part": "snippet,statistics", "chart": "mostPopular", "regionCode": region, "maxResults": n_videos})
+        recorder.request(f"{base}?{query}")
+        video_ids.extend(synthetic._chart_ids(region))
+        written += 1
+
+    # enrich_video_details looks IDs up in chunks of 50, in the merged region order
+    for start in range(0, len(video_ids), 50):
+        query = urlencode({"part": "snippet,contentDetails", "id": ",".join(video_ids[start:start + 50]), "maxResults": 50})
+        recorder.request(f"{base}?{query}")
+        written += 1
+
+    return written
+
+
+def is_local_transport(http) -> bool:
+    """
+    True when `http` answers requests without calling the API (ReplayHttp, SyntheticHttp,
+    googleapiclient's HttpMock / HttpMockSequence, or a RecordingHttp around one of them),
+    so the request spends no quota whatever YT_API_MODE says.
+    """
+    if isinstance(http, RecordingHttp):
+        http = http.inner
+    return isinstance(http, (_LocalHttp, HttpMock, HttpMockSequence))
+
+
+def get_transport(mode=None, fixture_dir=None, latency_ms=None):
+    """
+    Returns the httplib2 transport for the configured YT_API_MODE, or None in live mode.
+    - record: live requests, responses saved to YT_FIXTURE_DIR
+    - replay: responses served from YT_FIXTURE_DIR with YT_REPLAY_LATENCY_MS added
+    - synthetic: responses fabricated by SyntheticHttp (YT_SYNTHETIC_VIDEOS per region, YT_SYNTHETIC_REGIONS)
+    """
+    mode = mode or API_MODE
+    fixture_dir = fixture_dir or FIXTURE_DIR
+    latency_ms = REPLAY_LATENCY_MS if latency_ms is None else latency_ms
+
+    if mode == "record":
+        return RecordingHttp(fixture_dir)
+    if mode == "replay":
+        return ReplayHttp(fixture_dir, latency_ms=latency_ms)
+    if mode == "synthetic":
+        regions = os.getenv("YT_SYNTHETIC_REGIONS", "CA,DE,FR,GB,IN,JP,KR,MX,RU,US").split(",")
+        return SyntheticHttp(
+            n_videos=int(os.getenv("YT_SYNTHETIC_VIDEOS", 200)),
+            regions=[r.strip() for r in regions if r.strip()],
+            seed=int(os.getenv("YT_SYNTHETIC_SEED", 0)),
+            latency_ms=latency_ms,
+        )
+    return None